@@ -0,0 +1,25 @@
+"""
+Per-user locations for caches, profiles and logs written by the converter
+"""
+import os
+import sys
+from pathlib import Path
+
+
+APP_NAME = "convert2ios"
+
+
+def app_data_dir():
+    """Writable per-user data directory (created on first use)"""
+    override = os.environ.get("CONVERT2IOS_HOME")
+    if override:
+        base = Path(override)
+    elif sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local") / APP_NAME
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Application Support" / APP_NAME
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / APP_NAME
+
+    base.mkdir(parents=True, exist_ok=True)
+    return base
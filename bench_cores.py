@@ -0,0 +1,127 @@
+"""
+Throughput benchmark of concurrent libx264 jobs: naive vs core-partitioned
+
+Runs the same set of CPU encodes on the conversion engine with `--jobs`
+workers, in three modes:
+
+- naive: ffmpeg's default threads and no affinity (every job starts one
+  thread per core), one piece per file,
+- partitioned: the CoreScheduler splits the cores between the running
+  jobs, one piece per file,
+- default: what `convert.py batch` and the GUI ship, partitioned with
+  chunks=auto. The benchmark inputs are short, so they are split as if
+  they were long recordings (SEGMENT_MIN_DURATION is lowered to 0), unless
+  `--chunks N` sets the count.
+
+Reports aggregate fps (frames of every job divided by the wall time of the
+batch), wall time and CPU time.
+
+Run:  python bench_cores.py [--jobs 4] [--files 8] [--input 720p30-10s] [--repeat 3] [--chunks N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+
+import conversion_engine
+from app_paths import app_data_dir
+from bench_encode import INPUTS, ResourceSampler, generate_input
+from conversion_engine import ConversionEngine
+from cpu_scheduler import CoreScheduler, usable_cores
+from job_queue import ConversionJob, CHUNKS_AUTO, DONE
+
+
+MODES = ("naive", "partitioned", "default")
+
+
+async def run_batch(source, out_dir, files, jobs, partition, chunks=1):
+    engine = ConversionEngine(max_workers=jobs, core_scheduler=CoreScheduler(partition=partition))
+    batch = [ConversionJob(source, os.path.join(out_dir, f"{i}.mp4"), use_gpu=False, smart_copy=False,
+                           chunks=chunks)
+             for i in range(files)]
+    return await asyncio.gather(*(engine.run(job) for job in batch))
+
+
+def measure(source, name, mode, files, jobs, repeat, out_dir, chunks=CHUNKS_AUTO):
+    """Median of `repeat` batches of `files` encodes with `jobs` at a time"""
+    width, height, rate, seconds = INPUTS[name]
+    runs = []
+    for _ in range(repeat):
+        os.makedirs(out_dir, exist_ok=True)
+        try:
+            with ResourceSampler() as sampler:
+                started = time.monotonic()
+                reports = asyncio.run(run_batch(source, out_dir, files, jobs, mode != "naive",
+                                                chunks if mode == "default" else 1))
+                wall_time = time.monotonic() - started
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+        failed = [report for report in reports if report["status"] != DONE]
+        if failed:
+            raise RuntimeError(f"{mode}: {failed[0].get('error', failed[0]['exit_code'])}")
+        runs.append({"wall_time": wall_time,
+                     "fps": files * seconds * rate / wall_time,
+                     "cpu_time": sampler.cpu_time,
+                     "segmented": [report.get("mode") for report in reports].count("segmented")})
+    return {
+        "mode": mode,
+        "segmented_files": runs[-1]["segmented"],
+        "files": files,
+        "jobs": jobs,
+        "runs": repeat,
+        "wall_time": round(statistics.median(run["wall_time"] for run in runs), 3),
+        "aggregate_fps": round(statistics.median(run["fps"] for run in runs), 1),
+        "cpu_time": round(statistics.median(run["cpu_time"] for run in runs), 3),
+    }
+
+
+def main():
+    cores = len(usable_cores())
+    parser = argparse.ArgumentParser(description="Naive vs core-partitioned concurrent libx264 jobs")
+    parser.add_argument("--input", choices=sorted(INPUTS), default="720p30-10s")
+    parser.add_argument("--jobs", type=int, default=max(2, cores // 2), help="concurrent encodes")
+    parser.add_argument("--files", type=int, help="encodes per batch (default: 2 x jobs)")
+    parser.add_argument("--repeat", type=int, default=3, help="batches per mode (median is kept)")
+    parser.add_argument("--chunks", type=int, default=CHUNKS_AUTO,
+                        help="chunks per file of the default mode (default: auto, as shipped)")
+    parser.add_argument("--work-dir", default=str(app_data_dir() / "bench"))
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    source = generate_input(args.work_dir, args.input)
+    files = args.files or args.jobs * 2
+    out_dir = os.path.join(args.work_dir, "cores-out")
+
+    # The short benchmark inputs stand for long recordings in the default mode
+    conversion_engine.SEGMENT_MIN_DURATION = 0
+
+    print(f"🧮 {cores} cores, {args.jobs} jobs at a time, {files} x {args.input}")
+    results = []
+    for mode in MODES:
+        result = measure(source, args.input, mode, files, args.jobs, max(1, args.repeat), out_dir,
+                         args.chunks)
+        results.append(result)
+        print(f"{mode:<12} {result['aggregate_fps']:>8.1f} fps  wall {result['wall_time']:>7.2f}s  "
+              f"cpu {result['cpu_time']:>8.2f}s  segmented {result['segmented_files']}/{files}")
+    naive, partitioned, default = results
+    gain = (partitioned["aggregate_fps"] / naive["aggregate_fps"] - 1) * 100
+    default_gain = (default["aggregate_fps"] / naive["aggregate_fps"] - 1) * 100
+    print(f"📈 partitioned vs naive: {gain:+.1f}% aggregate fps")
+    print(f"📈 default vs naive: {default_gain:+.1f}% aggregate fps")
+
+    if args.output:
+        with open(args.output, "w", encoding='utf-8') as f:
+            json.dump({"input": args.input, "cores": cores, "results": results,
+                       "gain_percent": round(gain, 1), "default_gain_percent": round(default_gain, 1)},
+                      f, indent=2)
+        print(f"💾 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Reproducible encode benchmark with regression tracking
+
+Generates fixed synthetic inputs with ffmpeg's lavfi sources (testsrc2 +
+sine) at several resolutions, frame rates and durations, runs them through
+every conversion path of the conversion engine (CPU H.264, H.265, each container, the
+remux path, chunked encoding and the rendition ladder, against the same
+renditions as separate jobs) and records fps, speed, wall time, CPU
+time and peak RSS of the ffmpeg processes to a JSON file.
+
+Run:  python bench_encode.py [--quick] [--baseline bench_baseline.json]
+      python bench_encode.py --save-baseline     (after an intended change)
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from app_paths import app_data_dir
+from conversion_engine import convert_job
+from job_queue import ConversionJob, DONE
+from renditions import DEFAULT_LADDER, hls_output_path, pick_renditions
+
+
+# name: (width, height, frame rate, seconds)
+INPUTS = {
+    "360p30-10s": (640, 360, 30, 10),
+    "720p30-10s": (1280, 720, 30, 10),
+    "1080p30-5s": (1920, 1080, 30, 5),
+    "1080p60-5s": (1920, 1080, 60, 5),
+}
+QUICK_INPUTS = ("360p30-10s", "720p30-10s")
+
+# name: ConversionJob options; "separate" runs one job per rendition instead of one ladder
+PATHS = {
+    "h264-mp4": {"codec": "h264", "output_format": "mp4", "smart_copy": False},
+    "h264-mov": {"codec": "h264", "output_format": "mov", "smart_copy": False},
+    "h264-m4v": {"codec": "h264", "output_format": "m4v", "smart_copy": False},
+    "h265-mp4": {"codec": "h265", "output_format": "mp4", "smart_copy": False},
+    "remux-mp4": {"codec": "h264", "output_format": "mp4", "smart_copy": True},
+    "chunks4-mp4": {"codec": "h264", "output_format": "mp4", "smart_copy": False, "chunks": 4},
+    "ladder3-mp4": {"codec": "h264", "output_format": "mp4", "smart_copy": False,
+                    "renditions": list(DEFAULT_LADDER)},
+    "ladder3-hls": {"codec": "h264", "output_format": "mp4", "smart_copy": False,
+                    "renditions": list(DEFAULT_LADDER), "hls": True},
+    "separate3-mp4": {"codec": "h264", "output_format": "mp4", "smart_copy": False,
+                      "separate": list(DEFAULT_LADDER)},
+}
+
+# Metrics where a larger value is worse
+LOWER_IS_BETTER = ("wall_time", "cpu_time", "peak_rss")
+HIGHER_IS_BETTER = ("fps", "speed")
+# Time differences below this are timer/scheduler noise, not regressions
+NOISE_SECONDS = 0.05
+
+
+def input_path(work_dir, name):
+    return os.path.join(work_dir, f"{name}-main40.mkv")
+
+
+def generate_input(work_dir, name):
+    """Create one synthetic source once: H.264 Main 4.0 + 48 kHz AAC in MKV (remuxable)"""
+    path = input_path(work_dir, name)
+    if os.path.exists(path):
+        return path
+    width, height, rate, seconds = INPUTS[name]
+    tmp_path = path + ".tmp.mkv"
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={rate}:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={seconds}",
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-level", "4.0", "-pix_fmt", "yuv420p",
+        "-g", str(rate * 2), "-threads", "1",
+        "-c:a", "aac", "-b:a", "128k",
+        "-fflags", "+bitexact", "-flags", "+bitexact",
+        "-y", tmp_path,
+    ], check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ResourceSampler:
+    """
+    Peak RSS and CPU time of all child processes of this process.
+
+    Samples with psutil (imported lazily) every `interval` seconds; CPU time
+    comes from os.times() where the OS reports child times.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_rss = None
+        self._cpu = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_times = None
+        try:
+            import psutil
+            self._me = psutil.Process()
+        except ImportError:
+            self._me = None
+
+    def __enter__(self):
+        self._start_times = os.times()
+        if self._me is not None:
+            self.peak_rss = 0
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        end = os.times()
+        self.cpu_time = (end.children_user - self._start_times.children_user
+                         + end.children_system - self._start_times.children_system)
+        if not self.cpu_time and self._cpu:
+            self.cpu_time = sum(self._cpu.values())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = 0
+            for child in self._me.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                    times = child.cpu_times()
+                    self._cpu[child.pid] = times.user + times.system
+                except Exception:
+                    pass
+            self.peak_rss = max(self.peak_rss, rss)
+
+
+def run_case(source, path_name, out_dir, use_gpu, source_height=0):
+    options = dict(PATHS[path_name])
+    output_format = options.pop("output_format")
+    separate = options.pop("separate", None)
+    case_dir = os.path.join(out_dir, f"{os.path.basename(source)}.{path_name}")
+    output = os.path.join(case_dir, f"output.{output_format}")
+    if options.get("hls"):
+        output = hls_output_path(output)
+    if separate:
+        # The renditions the ladder would write for this source
+        jobs = [ConversionJob(source, os.path.join(case_dir, f"{name}.{output_format}"), use_gpu,
+                              output_format=output_format, renditions=[name], **options)
+                for name in pick_renditions(separate, source_height)]
+    else:
+        jobs = [ConversionJob(source, output, use_gpu, output_format=output_format, **options)]
+    os.makedirs(case_dir, exist_ok=True)
+    try:
+        with ResourceSampler() as sampler:
+            reports = [convert_job(job) for job in jobs]
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+    for report in reports:
+        if report["status"] != DONE:
+            raise RuntimeError(f"{path_name} failed: {report.get('error', report['exit_code'])}")
+    report = dict(reports[0])
+    if separate:
+        report["mode"] = "separate"
+        report["wall_time"] = round(sum(r["wall_time"] for r in reports), 3)
+    return report, sampler
+
+
+def measure(name, source, path_name, out_dir, repeat, use_gpu):
+    """Median of `repeat` runs of one input through one conversion path"""
+    width, height, rate, seconds = INPUTS[name]
+    runs = []
+    for _ in range(repeat):
+        report, sampler = run_case(source, path_name, out_dir, use_gpu, height)
+        runs.append({
+            "wall_time": report["wall_time"],
+            "fps": round(seconds * rate / report["wall_time"], 2),
+            "speed": round(seconds / report["wall_time"], 3),
+            "cpu_time": round(sampler.cpu_time, 3),
+            "peak_rss": sampler.peak_rss,
+        })
+    result = {"input": name, "path": path_name, "mode": report["mode"],
+              "vcodec": report["vcodec"], "runs": repeat}
+    for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+        values = [run[key] for run in runs if run[key] is not None]
+        result[key] = statistics.median(values) if values else None
+    return result
+
+
+def ffmpeg_version():
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-version"],
+                            capture_output=True, text=True, errors='replace')
+    return result.stdout.splitlines()[0] if result.stdout else "unknown"
+
+
+def compare(results, baseline, threshold):
+    """Regressions of more than `threshold` percent against the baseline"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if not old:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            new_value, old_value = result.get(metric), old.get(metric)
+            if not new_value or not old_value:
+                continue
+            if metric in ("wall_time", "cpu_time") and abs(new_value - old_value) < NOISE_SECONDS:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            worse = change if metric in LOWER_IS_BETTER else -change
+            if worse > threshold:
+                regressions.append((key, metric, old_value, new_value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode benchmark with regression tracking")
+    parser.add_argument("--quick", action="store_true", help="only the small inputs")
+    parser.add_argument("--inputs", nargs="+", choices=sorted(INPUTS))
+    parser.add_argument("--paths", nargs="+", choices=sorted(PATHS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case (median is kept)")
+    parser.add_argument("--gpu", action="store_true", help="allow NVENC (default: CPU only)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="regression threshold in percent")
+    parser.add_argument("--work-dir", default=str(app_data_dir() / "bench"),
+                        help="where the synthetic inputs are cached")
+    args = parser.parse_args()
+
+    inputs = args.inputs or (QUICK_INPUTS if args.quick else list(INPUTS))
+    paths = args.paths or list(PATHS)
+    out_dir = os.path.join(args.work_dir, "out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    results = {}
+    for name in inputs:
+        source = generate_input(args.work_dir, name)
+        for path_name in paths:
+            result = measure(name, source, path_name, out_dir, max(1, args.repeat), args.gpu)
+            results[f"{name}/{path_name}"] = result
+            rss = f"{result['peak_rss'] / 2**20:7.1f} MiB" if result["peak_rss"] else "      n/a"
+            print(f"{name + '/' + path_name:<26} {result['fps']:>8.1f} fps {result['speed']:>6.2f}x "
+                  f"wall {result['wall_time']:>6.2f}s cpu {result['cpu_time']:>6.2f}s rss {rss}")
+
+    document = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": platform.node(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "ffmpeg": ffmpeg_version(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    print(f"💾 {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+        print(f"📌 baseline → {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        print("ℹ️ ไม่มี baseline ให้เปรียบเทียบ (ใช้ --save-baseline เพื่อสร้าง)")
+        return 0
+
+    if baseline.get("machine") != document["machine"] or baseline.get("ffmpeg") != document["ffmpeg"]:
+        print("⚠️ baseline มาจากเครื่องหรือ ffmpeg คนละตัว ผลเปรียบเทียบอาจคลาดเคลื่อน")
+    regressions = compare(results, baseline.get("results", {}), args.threshold)
+    for key, metric, old_value, new_value, change in regressions:
+        print(f"❌ {key} {metric}: {old_value} → {new_value} ({change:+.1f}%)")
+    if regressions:
+        print(f"❌ พบ {len(regressions)} regression เกิน {args.threshold}%")
+        return 1
+    print(f"✅ ไม่มี regression เกิน {args.threshold}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+I/O benchmark of the moov layouts: bytes written and wall time
+
+Converts one large input with every moov mode (faststart, fragmented,
+reserve), using the same ffmpeg commands as a conversion, and records the
+bytes ffmpeg wrote, the output size, the wall time and the order of the
+top-level boxes (the moov must come before the media for iOS). faststart
+writes the file, then rewrites all of it with the moov in front; the other
+modes write every byte once.
+
+Bytes written are the wchar counter of /proc/<pid>/io, read after ffmpeg
+has exited but before it is reaped (Linux). Elsewhere psutil I/O counters
+are sampled while ffmpeg runs, which can miss the last writes.
+
+Run:  python bench_io.py [--input big.mkv] [--output-dir /mnt/nas/tmp] [--transcode]
+"""
+import argparse
+import json
+import os
+import statistics
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from app_paths import app_data_dir
+from ios_profile import MOOV_MODES, build_command
+from stream_planner import plan_conversion
+
+
+SAMPLE_INTERVAL = 0.05
+
+
+def generate_input(work_dir, seconds, bitrate):
+    """Synthetic 1080p30 H.264 Main 4.0 + AAC source, remuxable without re-encoding"""
+    path = os.path.join(work_dir, f"io-1080p30-{seconds}s-{bitrate}-main40.mkv")
+    if os.path.exists(path):
+        return path
+    tmp_path = path + ".tmp.mkv"
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1920x1080:rate=30:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-profile:v", "main", "-level", "4.0", "-pix_fmt", "yuv420p",
+        "-b:v", bitrate, "-g", "60",
+        "-c:a", "aac", "-b:a", "128k",
+        "-y", tmp_path,
+    ], check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_proc_io(pid):
+    """Bytes passed to write() by `pid` so far, or None without /proc"""
+    try:
+        with open(f"/proc/{pid}/io", encoding='ascii') as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key == "wchar":
+                    return int(value)
+    except OSError:
+        pass
+    return None
+
+
+class WriteSampler:
+    """Fallback: sample the write counter of a running process with psutil"""
+
+    def __init__(self, pid):
+        self.written = None
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            import psutil
+            self._process = psutil.Process(pid)
+        except Exception:
+            self._process = None
+
+    def start(self):
+        if self._process is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            try:
+                counters = self._process.io_counters()
+            except Exception:
+                return
+            self.written = getattr(counters, "write_chars", counters.write_bytes)
+
+
+def top_level_boxes(path, limit=6):
+    """Types of the first top-level MP4/MOV boxes, e.g. ['ftyp', 'moov', 'free', 'mdat']"""
+    boxes = []
+    offset = 0
+    with open(path, "rb") as f:
+        while len(boxes) < limit:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            size, kind = struct.unpack(">I4s", header)
+            boxes.append(kind.decode("latin-1"))
+            if size == 1:
+                size = struct.unpack(">Q", f.read(8))[0]
+            if size < 8:
+                break  # size 0: the box runs to the end of the file
+            offset += size
+    return boxes
+
+
+def run_ffmpeg(command):
+    """Run one ffmpeg, returns (exit code, wall time, bytes written)"""
+    started = time.monotonic()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    errors = []
+    error_thread = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+    error_thread.start()
+
+    exact = hasattr(os, "waitid") and read_proc_io(process.pid) is not None
+    sampler = None if exact else WriteSampler(process.pid).start()
+    if exact:
+        # Wait for the exit without reaping, so /proc/<pid>/io is still readable
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        wall_time = time.monotonic() - started
+        written = read_proc_io(process.pid)
+        process.wait()
+    else:
+        process.wait()
+        wall_time = time.monotonic() - started
+        sampler.stop()
+        written = sampler.written
+    error_thread.join()
+    if process.returncode != 0:
+        sys.stderr.write(errors[0].decode('utf-8', 'replace') if errors else "")
+    return process.returncode, wall_time, written
+
+
+def measure(source, plan, moov_mode, output_dir, transcode, repeat):
+    """Median of `repeat` conversions of `source` with one moov mode"""
+    output = os.path.join(output_dir, f"bench_io.{moov_mode}.mp4")
+    vcodec = "libx264" if transcode else "copy"
+    command = build_command(source, output, vcodec, "mp4", None if transcode else plan,
+                            progress=False, preset="ultrafast" if transcode else None,
+                            moov_mode=moov_mode, duration=plan.duration, frame_rate=plan.frame_rate)
+    command[1:1] = ["-v", "error"]
+
+    runs = []
+    for _ in range(repeat):
+        returncode, wall_time, written = run_ffmpeg(command)
+        if returncode != 0:
+            raise RuntimeError(f"{moov_mode}: ffmpeg exit code {returncode}")
+        runs.append((wall_time, written, os.path.getsize(output)))
+    boxes = top_level_boxes(output)
+    os.remove(output)
+
+    wall_time = statistics.median(run[0] for run in runs)
+    written = [run[1] for run in runs if run[1] is not None]
+    written = statistics.median(written) if written else None
+    size = runs[-1][2]
+    return {
+        "moov": moov_mode,
+        "path": "transcode" if transcode else plan.mode,
+        "wall_time": round(wall_time, 3),
+        "bytes_written": written,
+        "output_size": size,
+        "write_amplification": round(written / size, 3) if written and size else None,
+        "boxes": boxes,
+        "moov_first": "moov" in boxes and boxes.index("moov") < min(
+            [boxes.index(kind) for kind in ("mdat", "moof") if kind in boxes] or [len(boxes)]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="I/O benchmark of the moov layouts")
+    parser.add_argument("--input", help="input file (default: a synthetic 1080p30 file)")
+    parser.add_argument("--seconds", type=int, default=60, help="length of the synthetic input")
+    parser.add_argument("--bitrate", default="20M", help="video bitrate of the synthetic input")
+    parser.add_argument("--output-dir", default=str(app_data_dir() / "bench"),
+                        help="where outputs are written (e.g. a network share)")
+    parser.add_argument("--modes", nargs="+", choices=MOOV_MODES, default=list(MOOV_MODES))
+    parser.add_argument("--transcode", action="store_true",
+                        help="re-encode (libx264 ultrafast) instead of remuxing")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per mode (median is kept)")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    work_dir = str(app_data_dir() / "bench")
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+    source = args.input or generate_input(work_dir, args.seconds, args.bitrate)
+    plan = plan_conversion(source)
+
+    results = []
+    for moov_mode in args.modes:
+        result = measure(source, plan, moov_mode, args.output_dir, args.transcode, max(1, args.repeat))
+        results.append(result)
+        written = (f"{result['bytes_written'] / 2**20:8.1f} MiB" if result["bytes_written"] is not None
+                   else "     n/a    ")
+        amplification = (f"{result['write_amplification']:.2f}x" if result["write_amplification"]
+                         else "n/a")
+        print(f"{moov_mode:<11} {result['wall_time']:>7.2f}s  written {written}  "
+              f"output {result['output_size'] / 2**20:8.1f} MiB  ({amplification})  "
+              f"{' '.join(result['boxes'])}")
+
+    if args.output:
+        with open(args.output, "w", encoding='utf-8') as f:
+            json.dump({"input": source, "duration": plan.duration, "results": results}, f, indent=2)
+        print(f"💾 {args.output}")
+    return 0 if all(result["moov_first"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
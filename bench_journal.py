@@ -0,0 +1,73 @@
+"""
+Benchmark of the SQLite job journal with thousands of jobs
+
+Submits `--jobs` jobs to a fresh journal (one transaction for all of them,
+and one per job as the GUI does), walks every job through
+pending -> running -> done like the engine does, then times the reads a
+restart does: the pending jobs and the recovery scan.
+
+Run:  python bench_journal.py [--jobs 5000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from job_journal import JobJournal
+from job_queue import ConversionJob, PENDING, RUNNING, DONE
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def make_jobs(count):
+    return [ConversionJob(f"/videos/in{i:06d}.mkv", f"/videos/out/in{i:06d}.mp4") for i in range(count)]
+
+
+def walk(journal, jobs):
+    """The transitions the engine writes for each job"""
+    for state in (PENDING, RUNNING, DONE):
+        for job in jobs:
+            job.status = state
+            journal.update(job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite job journal benchmark")
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = {"jobs": args.jobs}
+    with tempfile.TemporaryDirectory() as work_dir:
+        journal = JobJournal(os.path.join(work_dir, "many.sqlite3"))
+        results["add_many"], jobs = timed(lambda: journal.add_many(make_jobs(args.jobs)))
+        single = JobJournal(os.path.join(work_dir, "single.sqlite3"))
+        results["add_each"], _ = timed(lambda: [single.add(job) for job in make_jobs(args.jobs)])
+
+        # Half the jobs finish, the rest stays pending
+        results["transitions"], _ = timed(lambda: walk(journal, jobs[:args.jobs // 2]))
+        results["read_pending"], pending = timed(lambda: journal.rows([PENDING]))
+        results["recover"], (queued, finished) = timed(lambda: journal.recover(log=lambda message: None))
+        journal.close()
+        single.close()
+
+    per_job = {key: value / args.jobs * 1e6 for key, value in results.items() if key != "jobs"}
+    for key in ("add_many", "add_each", "transitions", "read_pending", "recover"):
+        print(f"{key:<13} {results[key] * 1000:9.1f} ms  {per_job[key]:8.1f} µs/job")
+    print(f"📋 pending {len(pending)}, requeued {len(queued)}, finished {len(finished)}")
+
+    if args.output:
+        with open(args.output, "w", encoding='utf-8') as f:
+            json.dump({key: round(value, 6) for key, value in results.items()}, f, indent=2)
+        print(f"💾 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
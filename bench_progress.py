@@ -0,0 +1,101 @@
+"""
+Micro-benchmark: cost per ffmpeg progress update of the old stats-line
+regex path versus the structured `-progress` parser
+Run: python bench_progress.py
+"""
+import io
+import re
+import time
+
+from ffmpeg_progress import CHUNK_SIZE, ProgressParser
+
+UPDATES = 50000
+
+LEGACY_KEYWORDS = ['error', 'warning', 'duration:', 'video:', 'audio:', 'stream',
+                   'invalid', 'failed', 'not found']
+
+
+def legacy_output():
+    """stderr as the old GUI saw it: one stats line per update"""
+    lines = []
+    for i in range(UPDATES):
+        secs = i / 10
+        lines.append(f"frame={i:6d} fps=480 q=28.0 size={i * 12:8d}kB "
+                     f"time=00:{int(secs // 60) % 60:02d}:{secs % 60:05.2f} "
+                     f"bitrate=1234.5kbits/s speed=16.0x\n")
+    return "".join(lines).encode()
+
+
+def progress_output():
+    """stdout with -progress pipe:1: one key=value block per update"""
+    blocks = []
+    for i in range(UPDATES):
+        us = i * 100000
+        blocks.append(
+            f"frame={i}\nfps=480.00\nstream_0_0_q=28.0\nbitrate=1234.5kbits/s\n"
+            f"total_size={i * 12288}\nout_time_us={us}\nout_time_ms={us}\n"
+            f"out_time=00:00:00.000000\ndup_frames=0\ndrop_frames=0\n"
+            f"speed=16.0x\nprogress=continue\n")
+    return "".join(blocks).encode()
+
+
+def parse_duration(duration_str):
+    parts = duration_str.split(':')
+    return float(parts[0]) * 3600 + float(parts[1]) * 60 + float(parts[2])
+
+
+def run_legacy(data):
+    """Same work as the old GUI read loop + parse_ffmpeg_progress"""
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', errors='replace')
+    for line in stream:
+        if line.strip():
+            line = line.strip()
+            if "Duration:" in line:
+                re.search(r'Duration: (\d{2}:\d{2}:\d{2}\.\d{2})', line)
+            elif "time=" in line and "speed=" in line:
+                time_match = re.search(r'time=(\d{2}:\d{2}:\d{2}\.\d{2})', line)
+                speed_match = re.search(r'speed=\s*(\d+\.?\d*)x', line)
+                if time_match:
+                    parse_duration(time_match.group(1))
+                if speed_match:
+                    float(speed_match.group(1))
+            any(keyword in line.lower() for keyword in LEGACY_KEYWORDS)
+
+
+def run_structured(data, chunk_size):
+    """Same work as read_progress + the GUI handler (out_time and speed)"""
+    stream = io.BytesIO(data)
+    parser = ProgressParser()
+    while True:
+        chunk = stream.read1(chunk_size)
+        if not chunk:
+            break
+        event = parser.feed(chunk.decode("ascii", "replace"))
+        if event is not None:
+            event.out_time
+            event.speed
+
+
+def measure(name, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    per_update = elapsed / UPDATES * 1e6
+    print(f"{name:<24} {UPDATES} updates in {elapsed:.3f}s = {per_update:.2f} µs/update")
+    return per_update
+
+
+def main():
+    legacy = measure("stats line + regex", run_legacy, legacy_output())
+
+    data = progress_output()
+    block_size = len(data) // UPDATES
+    # One block per read (slow encode) up to full 64 KiB reads (fast encode)
+    for chunk_size in (block_size, 4096, CHUNK_SIZE):
+        structured = measure(f"-progress, {chunk_size} B reads",
+                             run_structured, data, chunk_size)
+        print(f"{'':<24} speedup: {legacy / structured:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Startup benchmark: time to first window and time to first ffmpeg spawn
+
+Launches the GUI (from source, or a built exe with --exe) with a small
+sample file on the command line, so the file is queued as soon as the
+window exists. Two times are measured from launch:
+
+  first_window   the GUI reports its first drawn window (CONVERT2IOS_STARTUP_REPORT)
+  first_spawn    the first ffprobe/ffmpeg child process appears (psutil)
+
+Run:  python bench_startup.py [--runs 5] [--exe dist/VideoConverter/VideoConverter.exe]
+Compare the --onefile and --fast builds of build_exe.py with --exe.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from app_paths import app_data_dir
+from bench_encode import generate_input
+from convert_gui import STARTUP_REPORT_ENV
+
+
+TIMEOUT = 60
+POLL_INTERVAL = 0.005
+
+
+def read_first_window(report_path):
+    try:
+        with open(report_path, encoding='utf-8') as f:
+            for line in f:
+                name, _, value = line.partition(" ")
+                if name == "first_window":
+                    return float(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def ffmpeg_child_started(psutil, process):
+    """True once the launched app (or its onefile child) has started ffprobe/ffmpeg"""
+    try:
+        for child in psutil.Process(process.pid).children(recursive=True):
+            name = child.name().lower()
+            if name.startswith("ffprobe") or name.startswith("ffmpeg"):
+                return True
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        pass
+    return False
+
+
+def kill_tree(psutil, process):
+    if psutil is not None:
+        try:
+            for child in psutil.Process(process.pid).children(recursive=True):
+                child.kill()
+        except psutil.NoSuchProcess:
+            pass
+    process.kill()
+    process.wait()
+
+
+def measure(command, work_dir):
+    """One cold launch; returns (first_window, first_spawn) in seconds"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    report_path = os.path.join(work_dir, f"startup_{time.time_ns()}.txt")
+    env = dict(os.environ, **{STARTUP_REPORT_ENV: report_path})
+    started = time.time()
+    process = subprocess.Popen(command, env=env, cwd=work_dir)
+
+    first_window = first_spawn = None
+    try:
+        while time.time() - started < TIMEOUT and process.poll() is None:
+            if first_spawn is None and psutil is not None and ffmpeg_child_started(psutil, process):
+                first_spawn = time.time() - started
+            if first_window is None:
+                reported = read_first_window(report_path)
+                if reported is not None:
+                    first_window = reported - started
+            if first_window is not None and (first_spawn is not None or psutil is None):
+                break
+            time.sleep(POLL_INTERVAL)
+    finally:
+        kill_tree(psutil, process)
+        if os.path.exists(report_path):
+            os.remove(report_path)
+    return first_window, first_spawn
+
+
+def summary(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {"median": round(statistics.median(values), 3),
+            "min": round(min(values), 3), "max": round(max(values), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI startup benchmark")
+    parser.add_argument("--exe", help="built VideoConverter executable (default: run convert_gui.py)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    work_dir = str(app_data_dir() / "bench")
+    os.makedirs(work_dir, exist_ok=True)
+    sample = generate_input(work_dir, "360p30-10s")
+
+    if args.exe:
+        command = [os.path.abspath(args.exe), sample]
+    else:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                "convert_gui.py"), sample]
+
+    windows, spawns = [], []
+    with tempfile.TemporaryDirectory() as run_dir:
+        for run in range(max(1, args.runs)):
+            first_window, first_spawn = measure(command, run_dir)
+            windows.append(first_window)
+            spawns.append(first_spawn)
+            window_text = f"{first_window:.3f}s" if first_window is not None else "n/a"
+            spawn_text = f"{first_spawn:.3f}s" if first_spawn is not None else "n/a"
+            print(f"run {run + 1}: first window {window_text}, first ffmpeg spawn {spawn_text}")
+
+    result = {
+        "command": command[0],
+        "runs": len(windows),
+        "first_window": summary(windows),
+        "first_spawn": summary(spawns),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 """
 Build script for creating a standalone executable of the Video Converter GUI
+
+    python build_exe.py            single VideoConverter.exe (--onefile)
+    python build_exe.py --fast     fast-startup build: dist/VideoConverter/ folder (--onedir)
+
+A --onefile exe unpacks the whole bundle to a temp folder on every launch,
+which is most of its cold start. The fast build ships the unpacked folder
+instead (and skips UPX, which also has to be undone at load time), so
+startup is only Python + tkinter. Measure with bench_startup.py.
 """
 import PyInstaller.__main__
 import os
 import sys
 from pathlib import Path
 
-def build_executable():
+def build_executable(fast=False):
     """Build the executable using PyInstaller"""
     
     # Get the current directory
@@ -19,7 +27,7 @@ def build_executable():
     # PyInstaller arguments
     args = [
         str(script_path),
-        '--onefile',                    # Create a single executable file
+        '--onedir' if fast else '--onefile',  # Folder (fast startup) or a single executable file
         '--windowed',                   # Hide console window (GUI mode)
         '--name=VideoConverter',        # Name of the executable
         '--clean',                      # Clean PyInstaller cache
@@ -33,6 +41,9 @@ def build_executable():
     if icon_path and icon_path.exists():
         args.append(f'--icon={icon_path}')
     
+    if fast:
+        args.append('--noupx')          # Compressed DLLs are slower to load
+
     # Add hidden imports that might be needed
     args.extend([
         '--hidden-import=tkinter',
@@ -49,8 +60,12 @@ def build_executable():
     
     print("\n" + "="*50)
     print("Build completed!")
-    print(f"Executable location: {current_dir / 'dist' / 'VideoConverter.exe'}")
+    if fast:
+        print(f"Executable location: {current_dir / 'dist' / 'VideoConverter' / 'VideoConverter.exe'}")
+        print("Ship the whole dist/VideoConverter folder (zip it for a release)")
+    else:
+        print(f"Executable location: {current_dir / 'dist' / 'VideoConverter.exe'}")
     print("="*50)
 
 if __name__ == "__main__":
-    build_executable()
+    build_executable(fast="--fast" in sys.argv)
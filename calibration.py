@@ -0,0 +1,215 @@
+"""
+Encoder calibration: measure every encoder/preset on this machine
+
+Short synthetic clips (lavfi testsrc2) and optional sample files are
+encoded with each available encoder and preset, using the normal iOS
+settings, to a null muxer. The measured throughput and CPU use are stored
+as a per-machine profile, and conversions can then ask for the slowest
+(best quality) preset that still reaches a wanted realtime multiple.
+
+Throughput is stored as pixels per second, so a measurement at 720p30 also
+predicts the speed for a 1080p60 input.
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+
+import ffmpeg_caps
+import ios_profile
+import process_registry
+from app_paths import app_data_dir
+from ffmpeg_progress import PROGRESS_ARGS, read_progress
+from stream_planner import ProbeError, plan_conversion
+
+
+PROFILE_FILE = "encoder_profile.json"
+PROFILE_VERSION = 1
+
+# Synthetic clip used when no samples are given
+TEST_SIZE = (1280, 720)
+TEST_RATE = 30
+TEST_DURATION = 5
+
+
+class CpuMeter:
+    """CPU time of one child process (psutil if available, else os.times())"""
+
+    def __init__(self, process):
+        self.process = process
+        self.cpu_time = 0.0
+        self._psutil_process = None
+        self._start = os.times()
+        try:
+            import psutil
+            self._psutil_process = psutil.Process(process.pid)
+        except Exception:
+            pass
+
+    def sample(self):
+        if self._psutil_process is not None:
+            try:
+                times = self._psutil_process.cpu_times()
+                self.cpu_time = times.user + times.system
+            except Exception:
+                pass
+
+    def finish(self):
+        """Final CPU time after the process was waited for"""
+        end = os.times()
+        children = (end.children_user - self._start.children_user
+                    + end.children_system - self._start.children_system)
+        # os.times() does not count children on Windows, keep the last sample there
+        self.cpu_time = max(self.cpu_time, children)
+        return self.cpu_time
+
+
+def _input_args(source):
+    if source is None:
+        width, height = TEST_SIZE
+        return ["-f", "lavfi", "-i",
+                f"testsrc2=size={width}x{height}:rate={TEST_RATE}:duration={TEST_DURATION}"]
+    return ["-t", str(TEST_DURATION), "-i", source]
+
+
+def measure(vcodec, preset, source=None, width=TEST_SIZE[0], height=TEST_SIZE[1]):
+    """
+    Encode `source` (None = synthetic clip) with one encoder/preset.
+
+    Returns a dict with encoded fps, pixel rate, wall time and CPU use in
+    percent of one core, or None if the encode failed.
+    """
+    command = ([ffmpeg_caps.ffmpeg_binary(), "-hide_banner", "-v", "error"] + PROGRESS_ARGS + _input_args(source)
+               + ["-map", "0:v:0", "-c:v", vcodec] + ios_profile.video_settings(vcodec, preset)
+               + ["-an", "-f", "null", "-"])
+    frames = [0]
+
+    started = time.monotonic()
+    process = process_registry.spawn(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    meter = CpuMeter(process)
+
+    def on_event(event):
+        frames[0] = event.frame
+        meter.sample()
+
+    read_progress(process.stdout, on_event)
+    process.wait()
+    wall_time = time.monotonic() - started
+    cpu_time = meter.finish()
+
+    if process.returncode != 0 or frames[0] == 0 or wall_time <= 0:
+        return None
+    fps = frames[0] / wall_time
+    return {
+        "encoder": vcodec,
+        "preset": preset,
+        "source": source or "testsrc2",
+        "width": width,
+        "height": height,
+        "fps": round(fps, 2),
+        "pixel_rate": round(fps * width * height),
+        "wall_time": round(wall_time, 3),
+        "cpu_percent": round(100 * cpu_time / wall_time, 1),
+    }
+
+
+def available_encoders():
+    return [name for name in ios_profile.ENCODER_PRESETS if ffmpeg_caps.has_encoder(name)]
+
+
+def calibrate(encoders=None, samples=(), log=print):
+    """Measure every preset of every available encoder and save the profile"""
+    encoders = encoders or available_encoders()
+
+    sources = [(None, TEST_SIZE)]
+    for sample in samples:
+        try:
+            plan = plan_conversion(sample)
+        except (ProbeError, OSError) as e:
+            log(f"⚠️ ข้ามไฟล์ตัวอย่าง {sample}: {e}")
+            continue
+        if plan.video_index is not None:
+            sources.append((sample, (plan.width, plan.height)))
+
+    results = []
+    for vcodec in encoders:
+        for preset in ios_profile.ENCODER_PRESETS[vcodec]:
+            for source, (width, height) in sources:
+                result = measure(vcodec, preset, source, width, height)
+                if result is None:
+                    log(f"❌ {vcodec} {preset}: เข้ารหัสไม่สำเร็จ")
+                    continue
+                log(f"⏱️ {vcodec:<10} {preset:<9} {result['fps']:>8.1f} fps  "
+                    f"CPU {result['cpu_percent']:>6.1f}%  ({result['source']})")
+                results.append(result)
+
+    ffmpeg_path = ffmpeg_caps.find_ffmpeg()
+    profile = {
+        "version": PROFILE_VERSION,
+        "machine": platform.node(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_caps.binary_key(ffmpeg_path) if ffmpeg_path else None,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    save_profile(profile)
+    return profile
+
+
+def _profile_path():
+    return app_data_dir() / PROFILE_FILE
+
+
+def save_profile(profile):
+    path = _profile_path()
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump(profile, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_profile():
+    """The saved calibration profile, or None if this machine was never calibrated"""
+    try:
+        with open(_profile_path(), encoding='utf-8') as f:
+            profile = json.load(f)
+        if profile.get("version") == PROFILE_VERSION:
+            return profile
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def predicted_speed(result, width, height, frame_rate):
+    """Realtime multiple one measurement predicts for a width x height @ frame_rate input"""
+    pixels_per_second = max(1, width * height) * (frame_rate or TEST_RATE)
+    return result["pixel_rate"] / pixels_per_second
+
+
+def pick_preset(vcodec, target_speed, width=0, height=0, frame_rate=0.0, profile=None):
+    """
+    Slowest preset of `vcodec` predicted to encode at least `target_speed`
+    times realtime. Falls back to the fastest measured preset if none is
+    fast enough; None if there is no calibration for the encoder.
+    """
+    profile = profile or load_profile()
+    if not profile:
+        return None
+    width, height = (width, height) if width and height else TEST_SIZE
+
+    presets = ios_profile.ENCODER_PRESETS.get(vcodec, [])
+    speeds = {}
+    for result in profile["results"]:
+        if result["encoder"] == vcodec and result["preset"] in presets:
+            speed = predicted_speed(result, width, height, frame_rate)
+            # Several sources per preset: trust the slowest one
+            speeds[result["preset"]] = min(speed, speeds.get(result["preset"], speed))
+    if not speeds:
+        return None
+
+    fast_enough = [preset for preset in presets if speeds.get(preset, 0) >= target_speed]
+    if fast_enough:
+        return fast_enough[-1]
+    return max(speeds, key=speeds.get)
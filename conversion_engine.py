@@ -0,0 +1,1045 @@
+"""
+Asyncio conversion engine shared by the GUI and the command line
+
+One event loop supervises every conversion: ffmpeg runs as an asyncio
+subprocess, its `-progress` pipe and stderr are read by coroutines, and at
+most `max_workers` jobs run at once. There is no thread per job and no
+blocking read loop, so dozens of concurrent encodes cost one loop.
+
+Front-ends see what happens as EngineEvent objects (progress, log, state
+change, done), through an `on_event` callback called on the loop thread or
+by iterating `events()` inside the loop.
+
+The engine runs in the caller's loop (`await engine.run(job)`, as the
+command line does) or on its own background thread, started on the first
+submit() from a thread without a running loop (the GUI). submit(),
+cancel() and set_max_workers() may be called from any thread.
+
+ffprobe and chunked encodes (SegmentedEncoder) block, so they run in the
+loop's default executor.
+
+Concurrent libx264 encodes share the cores through a CoreScheduler: each
+gets its own block of cores and a matching thread count instead of one
+thread per core each. NVENC encodes take session slots from NvencSlots;
+a job that finds none free is encoded with libx264 instead. If NVENC fails
+while encoding, the job is finished on libx264: long H.264 encodes resume
+from the last keyframe NVENC wrote (see nvenc_resume), others start over.
+
+Pending jobs start in the engine's `order` (job_queue.QUEUE_ORDERS). Each
+job that has to wait is probed on a small thread pool and its encode time
+predicted (encode_estimator), which orders shortest-first and feeds
+forecast(); every finished job refines the prediction.
+
+With a `stager` (staging.Stager) the next waiting inputs on network shares
+are copied to local scratch while the current jobs encode, and outputs are
+written to scratch and moved to their place after the encode, while the
+next job already runs. With a `verifier` (verify.Verifier) each output is
+checked on the verifier's own threads after its encode, also while the
+next job runs; a job whose output fails the checks ends failed.
+"""
+import asyncio
+import heapq
+import os
+import subprocess
+import threading
+import time
+
+import calibration
+import ffmpeg_caps
+import job_logs
+import metrics
+import process_registry
+import renditions
+from concurrent.futures import ThreadPoolExecutor
+from cpu_scheduler import CoreScheduler, format_cores, usable_cores
+from encode_estimator import COPY, EncodeEstimator, frame_pixels, remaining_time
+from ffmpeg_progress import parse_duration_line, read_progress_async
+from ios_profile import MOOV_FRAGMENTED, MOOV_RESERVE, build_command
+from job_queue import (default_worker_count, order_key, CHUNKS_AUTO, ORDER_FIFO, QUEUE_ORDERS,
+                       PENDING, RUNNING, DONE, FAILED, CANCELLED, FINISHED_STATES)
+from nvenc_resume import ResumableEncode, resumable
+from nvenc_slots import NvencSlots, is_session_error
+from stream_planner import ProbeError, plan_from_probe, probe_media
+
+
+# Event kinds
+EVENT_PROGRESS = "progress"
+EVENT_LOG = "log"
+EVENT_STATE = "state"
+EVENT_DONE = "done"
+
+# ffmpeg log lines worth passing on as log events
+LOG_KEYWORDS = ('error', 'warning', 'duration:', 'video:', 'audio:', 'stream',
+                'invalid', 'failed', 'not found')
+
+# Seconds a cancelled ffmpeg gets to exit after SIGTERM before it is killed
+KILL_TIMEOUT = 3
+# Threads probing waiting jobs for their estimate (kept off the loop's executor)
+ESTIMATE_WORKERS = 2
+
+# stderr lines kept for the report of a failed job
+ERROR_TAIL = 20
+# Longest stderr line the stream reader accepts
+STREAM_LIMIT = 1 << 20
+
+# With chunks=auto, libx264 encodes of inputs at least this long (seconds) are split,
+# into one piece per PIECE_THREADS threads of the job's share of the cores
+SEGMENT_MIN_DURATION = 600
+PIECE_THREADS = 4
+
+
+class EngineEvent:
+    """
+    Something that happened to a job.
+
+    `kind` is EVENT_PROGRESS (job.current_time/speed changed), EVENT_LOG
+    (`message`), EVENT_STATE (job.status changed) or EVENT_DONE (last event
+    of the job, `report` holds the result).
+    """
+    __slots__ = ("kind", "job", "message", "report")
+
+    def __init__(self, kind, job, message=None, report=None):
+        self.kind = kind
+        self.job = job
+        self.message = message
+        self.report = report
+
+    def __repr__(self):
+        return f"EngineEvent({self.kind}, job={self.job.id}, message={self.message!r})"
+
+
+class EventStream:
+    """Async iterator over the events of one engine, subscribed when created"""
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._queue = asyncio.Queue()
+        engine._subscribers.append(self._queue)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
+    def close(self):
+        if self._queue in self._engine._subscribers:
+            self._engine._subscribers.remove(self._queue)
+
+
+def check_nvenc(log=print):
+    """ตรวจสอบว่า ffmpeg รองรับ NVENC หรือไม่ (ใช้ผลจาก capability cache)"""
+    try:
+        return ffmpeg_caps.has_nvenc()
+    except Exception as e:
+        log(f"❌ ไม่สามารถตรวจสอบ ffmpeg ได้: {e}")
+        return False
+
+
+def select_video_encoder(codec, use_gpu=True, log=print):
+    """NVENC encoder for the codec if available, otherwise libx264"""
+    if use_gpu and check_nvenc(log):
+        log("✅ ใช้ GPU (NVENC) สำหรับการเข้ารหัส (iOS Compatible)")
+        return "hevc_nvenc" if codec == "h265" else "h264_nvenc"
+    log("⚠️ ไม่พบ NVENC → ใช้ CPU (libx264) - iOS Compatible")
+    return "libx264"
+
+
+def expected_encoder(job, plan):
+    """The video encoder prepare_job() would pick, without logging (for estimates)"""
+    if job.smart_copy and plan is not None and not plan.needs_encoder and not job.renditions:
+        return COPY
+    return select_video_encoder(job.codec, job.use_gpu, log=lambda message: None)
+
+
+def prepare_job(job, log=print, probe_info=None):
+    """
+    Probe the input (unless `probe_info` is already known) and choose the
+    video encoder. Blocking. Returns (probe_info, plan, vcodec).
+    """
+    plan = None
+    # Reserving moov space needs the duration up front, renditions the source size
+    if job.smart_copy or job.chunks != 1 or job.moov_mode == MOOV_RESERVE or job.renditions:
+        try:
+            if probe_info is None:
+                probe_info = probe_media(job.input_file)
+            plan = plan_from_probe(probe_info, job.codec)
+            job.total_duration = plan.duration
+            if job.smart_copy:
+                log(f"🔎 Stream plan: {plan.describe()}")
+        except (ProbeError, OSError) as e:
+            log(f"⚠️ ตรวจสอบสตรีมไม่ได้ ({e}) → เข้ารหัสใหม่ทั้งหมด")
+    copy_plan = plan if job.smart_copy else None
+
+    # Renditions are scaled, so their video is always encoded
+    if copy_plan is not None and not copy_plan.needs_encoder and not job.renditions:
+        vcodec = "copy"
+        if copy_plan.mode == "remux":
+            log("⚡ ไฟล์รองรับ iOS อยู่แล้ว → remux (-c copy) ไม่ต้องเข้ารหัสใหม่")
+    else:
+        if job.codec not in ("h264", "h265"):
+            log(f"⚠️ ไม่รู้จัก codec: {job.codec}, ใช้ h264 แทน")
+        vcodec = select_video_encoder(job.codec, job.use_gpu, log)
+
+    if vcodec != "copy":
+        pick_preset(job, plan, vcodec, log)
+    return probe_info, plan, vcodec
+
+
+def pick_preset(job, plan, vcodec, log=print):
+    """Calibrated preset for the job's target speed, None for the encoder default"""
+    job.preset = None
+    if job.target_speed:
+        job.preset = calibration.pick_preset(
+            vcodec, job.target_speed,
+            plan.width if plan else 0, plan.height if plan else 0, plan.frame_rate if plan else 0.0)
+        if job.preset:
+            log(f"🎚️ preset {job.preset} (เป้าหมาย {job.target_speed}x)")
+
+
+def nvenc_sessions_needed(job, plan, vcodec):
+    """NVENC sessions a job opens at once: one per rendition or chunk"""
+    if job.renditions:
+        return len(ladder(job, plan))
+    if is_segmented(job, plan, vcodec):
+        return job.pieces or chunk_count(job, plan, vcodec)
+    return 1
+
+
+def chunk_count(job, plan, vcodec, threads=None):
+    """
+    Pieces the job's video is encoded in (1 = one ffmpeg). With chunks=auto
+    only libx264 encodes of SEGMENT_MIN_DURATION seconds or more are split,
+    one piece per PIECE_THREADS of the `threads` the job may use (default:
+    every usable core); NVENC encodes are split only on request, as each
+    piece takes a session.
+    """
+    if job.renditions or plan is None or plan.video_index is None or vcodec == "copy":
+        return 1
+    if job.chunks != CHUNKS_AUTO:
+        return max(1, job.chunks)
+    if vcodec != "libx264" or plan.duration < SEGMENT_MIN_DURATION:
+        return 1
+    return max(1, (threads or len(usable_cores())) // PIECE_THREADS)
+
+
+def is_segmented(job, plan, vcodec):
+    """The job is split into pieces: as decided for this run, or as chunk_count() would"""
+    if job.pieces is not None:
+        return job.pieces > 1
+    return chunk_count(job, plan, vcodec) > 1
+
+
+def ladder(job, plan):
+    """Renditions a ladder job writes, largest first, none above the source height"""
+    return renditions.pick_renditions(job.renditions, plan.height if plan is not None else 0)
+
+
+def job_mode(job, plan, vcodec):
+    """remux / audio-only / transcode / segmented / ladder / hls, as recorded in reports and metrics"""
+    if job.renditions:
+        return "hls" if job.hls else "ladder"
+    if is_segmented(job, plan, vcodec):
+        return "segmented"
+    if job.smart_copy and plan is not None:
+        return plan.mode
+    return "transcode"
+
+
+class ConversionEngine:
+    """
+    Queue of ConversionJob objects converted by at most `max_workers`
+    concurrent tasks on one event loop.
+
+    `on_event(event)` is called on the loop thread for every EngineEvent.
+    `core_scheduler` places the CPU encodes (default: a CoreScheduler over
+    every usable core). `nvenc_sessions` is how many NVENC encodes the GPU
+    accepts at once (default: nvenc_slots.configured_sessions()). With a
+    `journal` (job_journal.JobJournal) every submitted job and each of its
+    state changes is written to it. The full log of each job goes to a
+    compressed file in `log_dir` (default: job_logs.log_dir(), False: none).
+    Pending jobs start in `order`; `estimator` predicts their encode time
+    (default: an EncodeEstimator over the metrics log). `stager` stages
+    inputs and outputs on local scratch, `verifier` checks finished outputs.
+    """
+
+    def __init__(self, max_workers=None, on_event=None, core_scheduler=None, nvenc_sessions=None,
+                 journal=None, log_dir=None, order=ORDER_FIFO, estimator=None, stager=None,
+                 verifier=None):
+        self.max_workers = max_workers or default_worker_count()
+        self.on_event = on_event
+        self.core_scheduler = core_scheduler or CoreScheduler()
+        self.nvenc = NvencSlots(nvenc_sessions)
+        self.journal = journal
+        self.log_dir = log_dir
+        self._logs_pruned = False
+        self.order = order if order in QUEUE_ORDERS else ORDER_FIFO
+        self.estimator = estimator or EncodeEstimator()
+        self._estimate_pool = None
+        self._probes = {}       # job id -> (probe_info, plan) found while estimating
+        self.stager = stager
+        self.verifier = verifier
+
+        self.jobs = []          # every submitted job, in submission order
+        self._pending = []      # (job, prepared) waiting for a worker
+        self._running = 0
+        self._waiters = {}      # job id -> future of run()
+        self._subscribers = []  # queues of EventStream objects
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._stopped = False
+
+    # Event loop
+
+    def start(self):
+        """Run the engine on its own event loop in a background thread"""
+        if self._thread is not None:
+            return self
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+        self._loop = loop
+        self._thread = threading.Thread(target=run, name="conversion-engine", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self, timeout=2):
+        """Stop the background loop; stop the ffmpeg processes first (process_registry.stop_all)"""
+        if self._thread is None:
+            return
+        self._stopped = True
+        if self._estimate_pool is not None:
+            self._estimate_pool.shutdown(wait=False, cancel_futures=True)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self.stager is not None:
+            self.stager.close()
+        if self.verifier is not None:
+            self.verifier.close()
+        self._thread.join(timeout)
+
+    def _get_loop(self):
+        if self._loop is None:
+            try:
+                self._loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.start()  # Called from a plain thread (Tk): bring our own loop
+        return self._loop
+
+    def _in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _call(self, func, *args):
+        """Run func on the loop thread: right away if already there"""
+        loop = self._get_loop()
+        if self._in_loop():
+            func(*args)
+        else:
+            loop.call_soon_threadsafe(func, *args)
+
+    # Public queue interface (any thread)
+
+    def submit(self, job, prepared=None):
+        """
+        Queue a job. `prepared` is the result of prepare_job() if the caller
+        already probed the input. The report comes with the job's done event.
+        """
+        if self.journal is not None:
+            self.journal.add(job)
+        with self._lock:
+            self.jobs.append(job)
+        self._call(self._enqueue, job, prepared)
+        return job
+
+    def submit_many(self, jobs):
+        """Queue several jobs, written to the journal in one transaction"""
+        if self.journal is not None:
+            self.journal.add_many(jobs)
+        for job in jobs:
+            self.submit(job)
+        return jobs
+
+    async def run(self, job, prepared=None):
+        """Queue a job and wait for its report (inside the engine's loop)"""
+        future = self._get_loop().create_future()
+        self._waiters[job.id] = future
+        self.submit(job, prepared)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self.cancel(job.id)
+            raise
+
+    def events(self):
+        """Subscribe to every event from now on; use with `async for` inside the loop"""
+        self._get_loop()
+        return EventStream(self)
+
+    def set_order(self, order):
+        """Start pending jobs in another order (job_queue.QUEUE_ORDERS) from now on"""
+        if order in QUEUE_ORDERS:
+            self.order = order
+
+    def set_max_workers(self, count):
+        """Change concurrency; extra pending jobs start right away"""
+        self.max_workers = max(1, int(count))
+        self._call(self._dispatch)
+
+    def get(self, job_id):
+        for job in self.jobs:
+            if job.id == job_id:
+                return job
+        return None
+
+    def cancel(self, job_id):
+        """Cancel one job without touching the others"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_requested = True
+        self._call(self._cancel, job)
+        return True
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job.id)
+
+    def restore(self, jobs):
+        """List finished jobs of an earlier run (from the journal) without running them"""
+        with self._lock:
+            self.jobs.extend(job for job in jobs if job.finished)
+
+    def clear_finished(self):
+        """Forget finished jobs, in the journal too"""
+        with self._lock:
+            self.jobs = [job for job in self.jobs if not job.finished]
+        if self.journal is not None:
+            self.journal.remove_finished()
+
+    @property
+    def active(self):
+        """True while any job is pending or running"""
+        return any(not job.finished for job in self.jobs)
+
+    def running_jobs(self):
+        return [job for job in self.jobs if job.status == RUNNING]
+
+    def overall_progress(self):
+        """Average progress of all submitted jobs in percent"""
+        jobs = [job for job in self.jobs if job.status != CANCELLED]
+        if not jobs:
+            return 0.0
+        return sum(job.percent for job in jobs) / len(jobs)
+
+    def forecast(self):
+        """
+        (predicted time.time() the queue is done, {job id: predicted finish})
+        of the unfinished jobs: running jobs from their speed or estimate,
+        pending ones started in queue order as workers free up. A job not
+        estimated yet counts as instant.
+        """
+        now = time.time()
+        finishes = {}
+        for job in self.running_jobs():
+            finishes[job.id] = now + remaining_time(job)
+        workers = sorted(finishes.values())
+        workers += [now] * max(0, self.max_workers - len(workers))
+        heapq.heapify(workers)
+        pending = [job for job in self.jobs if job.status == PENDING]
+        for job in sorted(pending, key=lambda job: order_key(job, self.order)):
+            finish = heapq.heappop(workers) + (job.estimate or 0.0)
+            finishes[job.id] = finish
+            heapq.heappush(workers, finish)
+        return max(finishes.values(), default=now), finishes
+
+    def counts(self):
+        """Number of jobs in each state"""
+        result = {state: 0 for state in (PENDING, RUNNING) + FINISHED_STATES}
+        for job in self.jobs:
+            result[job.status] += 1
+        return result
+
+    # Events
+
+    def _emit(self, kind, job, message=None, report=None):
+        """Deliver an event on the loop thread (safe from executor threads)"""
+        self._call(self._deliver, EngineEvent(kind, job, message, report))
+
+    def _deliver(self, event):
+        if event.kind == EVENT_STATE and self.journal is not None:
+            self.journal.update(event.job)
+        if self.on_event:
+            self.on_event(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def _log(self, job, message):
+        if job.log is not None:
+            job.log.write(message)
+        self._emit(EVENT_LOG, job, message)
+
+    # Scheduling (loop thread)
+
+    def _enqueue(self, job, prepared):
+        if job.cancel_requested:
+            self._finish(job, self._cancelled_report(job))
+            return
+        self._pending.append((job, prepared))
+        self._emit(EVENT_STATE, job)
+        self._dispatch()
+        if job.status == PENDING and job.estimate is None:
+            # It has to wait: predict its encode time while it does
+            if self._estimate_pool is None:
+                self._estimate_pool = ThreadPoolExecutor(ESTIMATE_WORKERS, "estimate")
+            self._loop.run_in_executor(self._estimate_pool, self._estimate, job, prepared)
+
+    def _estimate(self, job, prepared):
+        """Probe a waiting job and predict its encode time (estimate pool thread)"""
+        if job.status != PENDING:
+            return  # Started or cancelled in the meantime
+        try:
+            if prepared is not None:
+                _, plan, vcodec = prepared
+            else:
+                probe_info = probe_media(job.input_file)
+                plan = plan_from_probe(probe_info, job.codec)
+                if job.status == PENDING:
+                    self._probes[job.id] = (probe_info, plan)
+                vcodec = expected_encoder(job, plan)
+            if plan is not None and not job.total_duration:
+                job.total_duration = plan.duration
+            job.estimate = self.estimator.predict(job, plan, vcodec, job_mode(job, plan, vcodec),
+                                                  os.path.getsize(job.input_file))
+        except (ProbeError, OSError, ValueError):
+            pass  # Found out again, and logged, when the job runs
+
+    def _dispatch(self):
+        """Start pending jobs while worker slots are free"""
+        while not self._stopped and self._running < self.max_workers and self._pending:
+            if self.order == ORDER_FIFO:
+                entry = self._pending[0]
+            else:
+                entry = min(self._pending, key=lambda entry: order_key(entry[0], self.order))
+            self._pending.remove(entry)
+            job, prepared = entry
+            self._running += 1
+            self._loop.create_task(self._run_job(job, prepared))
+        if self.stager is not None and self._pending:
+            upcoming = heapq.nsmallest(self.stager.lookahead, self._pending,
+                                       key=lambda entry: order_key(entry[0], self.order))
+            self.stager.stage_ahead([entry[0] for entry in upcoming])
+
+    def _cancel(self, job):
+        for entry in self._pending:
+            if entry[0] is job:
+                self._pending.remove(entry)
+                if self.stager is not None:
+                    self.stager.release(job)
+                self._finish(job, self._cancelled_report(job))
+                return
+        if job.process is not None:
+            self._terminate(job.process)
+        # A job still probing sees cancel_requested before it starts ffmpeg
+
+    def _terminate(self, process):
+        """SIGTERM now, kill if it is still running after KILL_TIMEOUT; never blocks"""
+        if process.poll() is None:
+            process.terminate()
+            self._loop.call_later(KILL_TIMEOUT, self._kill_if_running, process)
+
+    @staticmethod
+    def _kill_if_running(process):
+        if process.poll() is None:
+            process.kill()
+
+    def _cancelled_report(self, job):
+        job.status = CANCELLED
+        return {"input": job.input_file, "output": job.output_file,
+                "status": CANCELLED, "exit_code": None}
+
+    def _finish(self, job, report):
+        self._probes.pop(job.id, None)
+        self._emit(EVENT_STATE, job)
+        self._emit(EVENT_DONE, job, report=report)
+        waiter = self._waiters.pop(job.id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(report)
+        self._dispatch()
+
+    # Conversion (loop thread)
+
+    async def _run_job(self, job, prepared):
+        """Convert one job; returns nothing, the report goes out with the done event"""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        job.status = RUNNING
+        job.pieces = None
+        job.metrics = job_metrics = job.metrics or metrics.JobMetrics(job)
+        self._emit(EVENT_STATE, job)
+
+        report = {
+            "input": job.input_file,
+            "output": job.output_file,
+            "codec": job.codec,
+            "format": job.output_format,
+            "moov": job.moov_mode,
+            "vcodec": None,
+            "mode": None,
+        }
+        errors = []
+        returncode = None
+        sessions = 0
+        resume = None
+        plan = estimate_plan = vcodec = None
+        stager = self.stager
+        verifier = self.verifier if self.verifier is not None and self.verifier.enabled else None
+        running = True          # holds a worker slot
+        job.log = self._open_job_log(job)
+        if job.log is not None:
+            report["log"] = job.log.path
+        try:
+            # Files may be on a network share: no file system calls on the loop thread
+            report["input_size"] = await loop.run_in_executor(None, os.path.getsize, job.input_file)
+            if stager is not None:
+                await self._use_scratch(job, stager, report)
+            probe_info, estimate_plan = self._probes.pop(job.id, (None, None))
+            if prepared is None:
+                prepared = await loop.run_in_executor(
+                    None, prepare_job, job, lambda message: self._log(job, message), probe_info)
+                job_metrics.probe_finished()
+            probe_info, plan, vcodec = prepared
+            if "nvenc" in vcodec:
+                vcodec, sessions = self._claim_nvenc(job, plan, vcodec)
+            # chunks=auto splits by the threads a CPU encode starting now would get
+            job.pieces = chunk_count(job, plan, vcodec,
+                                     self.core_scheduler.share(self._expected_cpu_encodes()))
+            report["vcodec"] = job_metrics.encoder = vcodec
+            report["mode"] = job_metrics.mode = job_mode(job, plan, vcodec)
+            self._predict(job, plan or estimate_plan, vcodec, report)
+
+            output_dir = os.path.dirname(job.output_file)
+            if output_dir:
+                await loop.run_in_executor(None, lambda: os.makedirs(output_dir, exist_ok=True))
+
+            self._log(job, f"📂 ไฟล์ต้นฉบับ: {job.input_file}")
+            self._log(job, f"📁 ไฟล์เอาต์พุต: {job.output_file}")
+            if report["mode"] == "segmented":
+                self._log(job, f"🎬 Codec: {job.codec} ({vcodec}) | Format: {job.output_format} "
+                               f"| Chunks: {job.pieces}")
+            elif job.renditions:
+                report["renditions"] = ladder(job, plan)
+                self._log(job, f"🎬 Codec: {job.codec} ({vcodec}) | Format: "
+                               f"{'HLS (fMP4)' if job.hls else job.output_format} "
+                               f"| Renditions: {', '.join(report['renditions'])}")
+            else:
+                self._log(job, f"🎬 Codec: {job.codec} ({vcodec}) | Format: {job.output_format}")
+            if "nvenc" in vcodec and job.renditions:
+                self._log(job, "🚀 ใช้ GPU NVENC - Main Profile, Level ตามขนาดและ frame rate ของแต่ละ rendition")
+            elif "nvenc" in vcodec:
+                self._log(job, "🚀 ใช้ GPU NVENC - Main Profile, Level 4.0")
+            elif vcodec == "libx264" and job.renditions:
+                self._log(job, "🚀 ใช้ CPU libx264 - Profile/Level ตามขนาดและ frame rate ของแต่ละ rendition")
+            elif vcodec == "libx264":
+                self._log(job, "🚀 ใช้ CPU libx264 - Baseline Profile, Level 3.1")
+
+            if job.cancel_requested:
+                pass
+            elif report["mode"] == "segmented":
+                returncode = await self._encode_segmented(job, plan, vcodec, errors, sessions or None)
+            elif resumable(job, plan, vcodec):
+                resume = ResumableEncode(job, plan)
+                returncode = await self._encode_resumable(job, plan, vcodec, errors, resume)
+            else:
+                returncode = await self._encode(job, plan, vcodec, errors)
+
+            if returncode and "nvenc" in vcodec and not job.cancel_requested:
+                # NVENC failed (no free session, driver reset...): finish the job on the CPU
+                if sessions and is_session_error(errors):
+                    # More sessions are in use than we knew of (another program?)
+                    self.nvenc.limit_reached(sessions)
+                    reason = f"เปิด NVENC session ไม่ได้ (ลดเหลือ {self.nvenc.total} sessions)"
+                else:
+                    reason = f"NVENC ล้มเหลว (exit code {returncode})"
+                self.nvenc.release(sessions)
+                sessions = 0
+                vcodec = "libx264"
+                pick_preset(job, plan, vcodec, lambda message: self._log(job, message))
+                report["vcodec"] = job_metrics.encoder = vcodec
+                errors.clear()
+                if resume is not None and await loop.run_in_executor(None, resume.cut):
+                    report["resumed_at"] = round(resume.done_seconds, 3)
+                    self._log(job, f"⚠️ {reason} → เข้ารหัสต่อด้วย CPU (libx264) จากวินาทีที่ "
+                                   f"{resume.done_seconds:.1f} (keyframe สุดท้ายที่เขียนเสร็จ)")
+                    returncode = await self._resume_on_cpu(job, errors, resume)
+                else:
+                    self._log(job, f"⚠️ {reason} → เข้ารหัสใหม่ด้วย CPU (libx264)")
+                    if report["mode"] == "segmented":
+                        returncode = await self._encode_segmented(job, plan, vcodec, errors)
+                    else:
+                        returncode = await self._encode(job, plan, vcodec, errors)
+        except asyncio.CancelledError:
+            # The loop is shutting down (Ctrl+C): start nothing new
+            job.cancel_requested = True
+            self._stopped = True
+            raise
+        except Exception as e:
+            # Front-ends show job.error / the report's error
+            job.error = str(e)
+            errors.append(str(e))
+        finally:
+            job.process = None
+            self.nvenc.release(sessions)
+            if resume is not None:
+                resume.cleanup()
+            if job.cancel_requested:
+                job.status = CANCELLED
+            else:
+                job.status = DONE if returncode == 0 else FAILED
+            job_metrics.encode_finished()
+            if stager is not None:
+                stager.release(job)
+                job.staged_input = None
+            if job.status == DONE and (job.staged_output is not None or verifier is not None):
+                # The next job encodes while this output is moved to its place and checked
+                self._running -= 1
+                running = False
+                self._dispatch()
+            if job.staged_output is not None:
+                if job.status == DONE:
+                    try:
+                        await self._move_output(job, stager)
+                    except OSError as e:
+                        job.status = FAILED
+                        errors.append(f"ย้ายไฟล์จาก scratch ไม่สำเร็จ ({e}): {job.staged_output}")
+                else:
+                    stager.discard_output(job)
+                job.staged_output = None
+            if job.status == DONE and verifier is not None:
+                problems = await self._verify(job, verifier, plan or estimate_plan, vcodec, report)
+                if problems:
+                    # ffmpeg itself succeeded: the error is what the checks found
+                    job.status = FAILED
+                    errors[:] = problems
+
+            wall_time = time.monotonic() - started
+            entry = await loop.run_in_executor(None, self._record_metrics, job, report.get("renditions"))
+            report.update({
+                "status": job.status,
+                "exit_code": returncode,
+                "wall_time": round(wall_time, 3),
+                "duration": round(job.total_duration, 3),
+                # Media seconds encoded per wall-clock second, whole job included
+                "speed": round(job.total_duration / wall_time, 3) if wall_time > 0 else 0,
+                "ffmpeg_speed_avg": entry["speed_avg"],
+                "output_size": entry["output_bytes"] if job.status == DONE else 0,
+            })
+            for key in ("queue_wait", "probe_time", "encode_time", "fps_avg", "fps_peak",
+                        "speed_peak", "cpu_user", "cpu_system", "peak_rss"):
+                report[key] = entry[key]
+            if job.status == FAILED:
+                report["error"] = "\n".join(errors[-5:])
+            if job.log is not None:
+                job.log.write(f"# {job.status} exit_code={returncode}")
+                job.log.close()
+                job.log = None
+
+            if running:
+                self._running -= 1
+            self._finish(job, report)
+
+    async def _use_scratch(self, job, stager, report):
+        """Read the staged input if there is one, and stage the output"""
+        future = stager.claim_input(job)
+        if future is not None:
+            if not future.done():
+                self._log(job, "⏳ รอคัดลอกไฟล์ต้นฉบับไปยัง scratch ให้เสร็จ...")
+            job.staged_input = await asyncio.wrap_future(future)
+            if job.staged_input is not None:
+                report["staged_input"] = job.staged_input
+                self._log(job, f"📥 อ่านไฟล์ต้นฉบับจาก scratch: {job.staged_input}")
+        job.staged_output = await asyncio.get_running_loop().run_in_executor(
+            None, stager.output_for, job)
+        if job.staged_output is not None:
+            report["staged_output"] = job.staged_output
+
+    async def _move_output(self, job, stager):
+        self._log(job, f"📦 ย้ายไฟล์จาก scratch ไปยังปลายทาง: {job.output_file}")
+        started = time.monotonic()
+        await asyncio.wrap_future(stager.move_output(job))
+        self._log(job, f"📦 ย้ายไฟล์เสร็จใน {time.monotonic() - started:.1f}s")
+
+    def _record_metrics(self, job, names=None):
+        """Output sizes, estimator and metrics log of a finished job (blocking); its record"""
+        if names:
+            job.metrics.outputs = renditions.output_files(job.output_file, names, job.hls)
+        entry = job.metrics.finish(job.status)
+        self.estimator.observe(entry)
+        metrics.record_job(entry)
+        return entry
+
+    async def _verify(self, job, verifier, plan, vcodec, report):
+        """Check the outputs on the verifier's threads; the problems found"""
+        self._log(job, "🔍 ตรวจสอบไฟล์ผลลัพธ์...")
+        if report.get("resumed_at") is not None:
+            vcodec = "h264_nvenc"  # libx264 continued with NVENC's profile and level
+        problems, seconds = await asyncio.wrap_future(
+            verifier.submit(job, plan, vcodec, report.get("renditions")))
+        report["verify"] = "failed" if problems else "ok"
+        report["verify_time"] = round(seconds, 3)
+        for problem in problems:
+            self._log(job, f"❌ ตรวจสอบไม่ผ่าน: {problem}")
+        if not problems:
+            self._log(job, f"✅ ตรวจสอบไฟล์ผลลัพธ์ผ่าน ({seconds:.1f}s)")
+        return problems
+
+    def _predict(self, job, plan, vcodec, report):
+        """Estimate with the encoder the job really got, and keep what it is based on for learning"""
+        job_metrics = job.metrics
+        job_metrics.preset = job.preset
+        if plan is not None:
+            job_metrics.frame_pixels = frame_pixels(plan, job.renditions)
+            job_metrics.frame_rate = plan.frame_rate
+            job.total_duration = job.total_duration or plan.duration
+        job.estimate = self.estimator.predict(job, plan, vcodec, report["mode"],
+                                              report["input_size"])
+        job_metrics.predicted_time = job.estimate
+
+    def _open_job_log(self, job):
+        """Compressed full log of the job, or None if disabled or not writable"""
+        if self.log_dir is False:
+            return None
+        try:
+            directory = self.log_dir or job_logs.log_dir()
+            if not self._logs_pruned:
+                self._logs_pruned = True
+                job_logs.prune(directory)
+            return job_logs.JobLog.open_for(job, directory)
+        except OSError:
+            return None
+
+    def _claim_nvenc(self, job, plan, vcodec):
+        """
+        Take NVENC slots for the job; returns (vcodec, sessions taken). With
+        no free slot the job goes to libx264 instead of failing.
+        """
+        needed = nvenc_sessions_needed(job, plan, vcodec)
+        # Chunks can run fewer at a time; the other encodes need all their sessions
+        sessions = self.nvenc.acquire(needed, partial=is_segmented(job, plan, vcodec))
+        if sessions:
+            return vcodec, sessions
+        if self.nvenc.total:
+            self._log(job, f"⚠️ NVENC ใช้ครบ {self.nvenc.total} sessions แล้ว → ใช้ CPU (libx264) แทน")
+        else:
+            self._log(job, "⚠️ เปิด NVENC session ไม่ได้ → ใช้ CPU (libx264) แทน")
+        vcodec = "libx264"
+        pick_preset(job, plan, vcodec, lambda message: self._log(job, message))
+        return vcodec, 0
+
+    def _progress(self, job, current_time, speed, fps):
+        job.current_time = current_time
+        job.speed = speed
+        job.metrics.add_progress(fps, speed)
+        self._emit(EVENT_PROGRESS, job)
+
+    async def _encode(self, job, plan, vcodec, errors, output_file=None, moov_mode=None):
+        """
+        The job's encode in one ffmpeg process, into `output_file` with
+        `moov_mode` (default: the job's)
+        """
+        output_file = output_file or job.target_file
+        moov_mode = moov_mode or job.moov_mode
+        copy_plan = plan if job.smart_copy else None
+        threads = self._reserve_cores(job) if vcodec == "libx264" else None
+        if job.renditions:
+            command = renditions.build_command(
+                job.source_file, output_file, vcodec, ladder(job, plan), job.output_format,
+                plan, hls=job.hls, preset=job.preset,
+                copy_audio=job.smart_copy and plan is not None and plan.copy_audio,
+                moov_mode=moov_mode, duration=job.total_duration, threads=threads or 0)
+        else:
+            command = build_command(job.source_file, output_file, vcodec, job.output_format,
+                                    copy_plan, preset=job.preset, moov_mode=moov_mode,
+                                    duration=job.total_duration,
+                                    frame_rate=plan.frame_rate if plan is not None else 0.0,
+                                    threads=threads or 0)
+        returncode = await self._run_ffmpeg(job, command, errors, threads=threads)
+        if returncode == 0 and job.renditions and job.hls:
+            renditions.write_master_playlist(output_file, ladder(job, plan), vcodec, plan)
+        return returncode
+
+    def _expected_cpu_encodes(self):
+        """CPU encodes likely to run together: jobs waiting for a worker will start soon"""
+        return min(self.max_workers, self._running + len(self._pending))
+
+    def _reserve_cores(self, job):
+        """Thread count of a CPU encode about to start (see CoreScheduler.reserve)"""
+        return self.core_scheduler.reserve(job, self._expected_cpu_encodes())
+
+    async def _run_ffmpeg(self, job, command, errors, offset=0.0, threads=None):
+        """
+        One ffmpeg process: progress from stdout (plus `offset` seconds
+        already done), log lines from stderr. `threads` is set for a CPU
+        encode registered with the core scheduler, which is released at the end.
+        """
+        self._log(job, "🔧 คำสั่ง FFmpeg: " + " ".join(command))
+        try:
+            process = await process_registry.spawn_async(
+                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, limit=STREAM_LIMIT)
+        except BaseException:
+            self.core_scheduler.release(job)
+            raise
+        job.process = process
+        job.metrics.encode_started(lambda: job.process)
+        self.core_scheduler.apply_priority(job)
+        if threads is not None:
+            # Pin this ffmpeg and re-pin the others now that one more is running
+            self.core_scheduler.rebalance()
+            cores = self.core_scheduler.assignments.get(job.id)
+            if cores:
+                self._log(job, f"🧮 libx264 threads={threads}, CPU {format_cores(cores)}")
+        # The job may have been cancelled while ffmpeg was starting
+        if job.cancel_requested:
+            self._terminate(process)
+
+        try:
+            await asyncio.gather(
+                read_progress_async(process.stdout, lambda event: self._progress(
+                    job, offset + event.out_time, event.speed, event.fps)),
+                self._read_log(job, process.stderr, errors))
+            await process.aio.wait()
+        except asyncio.CancelledError:
+            # Never leave ffmpeg running when the loop goes away
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.aio.wait(), KILL_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.aio.wait()
+            raise
+        finally:
+            process_registry.release(process)
+            self.core_scheduler.release(job)
+        return process.returncode
+
+    async def _encode_resumable(self, job, plan, vcodec, errors, resume):
+        """NVENC into a fragmented part that survives a failure, then the part becomes the output"""
+        returncode = await self._encode(job, plan, vcodec, errors, output_file=resume.gpu_part,
+                                        moov_mode=MOOV_FRAGMENTED)
+        if returncode == 0 and not job.cancel_requested:
+            await asyncio.get_running_loop().run_in_executor(None, resume.finish)
+        return returncode
+
+    async def _resume_on_cpu(self, job, errors, resume):
+        """
+        libx264 from where the NVENC part ends, then the audio, then join the
+        parts; only the continuation starts part way, the other steps cover
+        the whole file
+        """
+        threads = self._reserve_cores(job)
+        steps = [(resume.continuation_command(threads), resume.done_seconds, threads)]
+        if resume.plan.audio_index is not None:
+            steps.append((resume.audio_command(), 0.0, None))
+        steps.append((resume.join_command(), 0.0, None))
+        for command, offset, step_threads in steps:
+            if job.cancel_requested:
+                return None
+            returncode = await self._run_ffmpeg(job, command, errors, offset=offset,
+                                                threads=step_threads)
+            if returncode != 0:
+                return returncode
+        error = await asyncio.get_running_loop().run_in_executor(None, resume.check_seam)
+        if error:
+            errors.append(f"ถอดรหัสรอยต่อ NVENC/libx264 ที่วินาที {resume.done_seconds:.1f} ไม่ได้: {error}")
+            return 1
+        self._log(job, f"🔗 ถอดรหัสรอยต่อที่วินาที {resume.done_seconds:.1f} ได้ปกติ")
+        return 0
+
+    async def _read_log(self, job, stream, errors):
+        """Read ffmpeg stderr (UTF-8) for the duration, important messages and the error tail"""
+        async for raw_line in stream:
+            # Replace invalid characters instead of crashing
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            if not line:
+                continue
+
+            duration = parse_duration_line(line)
+            if duration is not None and not job.total_duration:
+                job.total_duration = duration
+                self._emit(EVENT_PROGRESS, job)
+
+            if job.log is not None:
+                job.log.write(line)
+            errors.append(line)
+            del errors[:-ERROR_TAIL]
+            lower = line.lower()
+            if any(keyword in lower for keyword in LOG_KEYWORDS):
+                self._emit(EVENT_LOG, job, line)
+
+    async def _encode_segmented(self, job, plan, vcodec, errors, workers=None):
+        """
+        Parallel keyframe chunks, at most `workers` at a time (default: all);
+        SegmentedEncoder blocks, so it runs in the executor. libx264 pieces
+        share the threads the core scheduler gives the job: no more pieces
+        run at once than it has threads, each with an equal part of them.
+        """
+        # Imported on first use, it is not needed to show the window
+        from segmented import SegmentedEncoder
+
+        def log(message):
+            errors.append(message)
+            self._log(job, message)
+
+        piece_threads = 0
+        if vcodec == "libx264":
+            threads = self._reserve_cores(job)
+            if threads:
+                workers = min(job.pieces, threads)
+                piece_threads = max(1, threads // workers)
+            # The job's block is computed now, each chunk is pinned to it as it starts
+            self.core_scheduler.rebalance()
+            cores = self.core_scheduler.assignments.get(job.id)
+            if cores:
+                self._log(job, f"🧮 libx264 {workers} chunks พร้อมกัน x threads={piece_threads}, "
+                               f"CPU {format_cores(cores)}")
+        encoder = SegmentedEncoder(
+            job.source_file, job.target_file, vcodec, plan, job.output_format,
+            chunks=job.pieces, workers=workers, copy_audio=job.smart_copy, log=log,
+            moov_mode=job.moov_mode,
+            # Pieces report no common fps, derive it from the summed speed
+            on_progress=lambda done, speed: self._progress(job, done, speed, speed * plan.frame_rate),
+            preset=job.preset, log_file=job.log, threads=piece_threads,
+            on_spawn=lambda process: self.core_scheduler.place(job, process.pid))
+        # Cancelling the job terminates every chunk through the encoder
+        job.process = encoder
+        job.metrics.encode_started(lambda: job.process)
+        if job.cancel_requested:
+            encoder.terminate()
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, encoder.run)
+        except asyncio.CancelledError:
+            encoder.terminate()
+            await loop.run_in_executor(None, encoder.wait)
+            raise
+        finally:
+            self.core_scheduler.release(job)
+        return encoder.returncode
+
+
+def convert_job(job, on_event=None):
+    """Convert one job in a fresh event loop and return its report (blocking)"""
+    async def run():
+        return await ConversionEngine(1, on_event).run(job)
+    return asyncio.run(run())
@@ -1,65 +1,676 @@
-import subprocess
-import shutil
-import sys
-
-
-def check_nvenc():
-    """ตรวจสอบว่า ffmpeg รองรับ NVENC หรือไม่"""
-    try:
-        result = subprocess.run(
-            ["ffmpeg", "-encoders"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        encoders = result.stdout
-        return ("h264_nvenc" in encoders) or ("hevc_nvenc" in encoders)
-    except Exception as e:
-        print("❌ ไม่สามารถตรวจสอบ ffmpeg ได้:", e)
-        return False
-
-
-def convert_video(input_file, output_file, use_gpu=True, codec="h264"):
-    """แปลงวิดีโอด้วย GPU (NVENC) ถ้ามี, ถ้าไม่มี fallback ไป CPU"""
-
-    if use_gpu and check_nvenc():
-        print("✅ ใช้ GPU (NVENC) สำหรับการเข้ารหัส")
-        if codec == "h264":
-            vcodec = "h264_nvenc"
-        elif codec == "h265":
-            vcodec = "hevc_nvenc"
-        else:
-            print(f"⚠️ ไม่รู้จัก codec: {codec}, ใช้ h264 แทน")
-            vcodec = "h264_nvenc"
-    else:
-        print("⚠️ ไม่พบ NVENC → ใช้ CPU (libx264)")
-        vcodec = "libx264"
-
-    command = [
-        "ffmpeg",
-        "-hwaccel", "cuda",   # ใช้ GPU decode ถ้ามี
-        "-i", input_file,
-        "-c:v", vcodec,
-        "-preset", "p3" if "nvenc" in vcodec else "medium",
-        "-b:v", "5M",         # Bitrate วิดีโอ
-        "-c:a", "aac",
-        "-b:a", "192k",
-        output_file
-    ]
-
-    print("🚀 รันคำสั่ง:", " ".join(command))
-    subprocess.run(command, check=True)
-    print("🎉 แปลงไฟล์เสร็จแล้ว:", output_file)
-
-
-if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print(
-            "วิธีใช้: python convert.py <input_file> <output_file> [h264|h265]")
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
-    codec = sys.argv[3] if len(sys.argv) > 3 else "h264"
-
-    convert_video(input_file, output_file, use_gpu=True, codec=codec)
+import argparse
+import asyncio
+import glob
+import json
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+import calibration
+import ffmpeg_caps
+import metrics
+import nvenc_slots
+import process_registry
+import renditions
+from cpu_scheduler import CoreScheduler
+from folder_watch import POLL_INTERVAL, SETTLE_SECONDS, FolderWatcher
+from conversion_engine import (ConversionEngine, is_segmented, ladder, prepare_job,
+                               EVENT_DONE, EVENT_LOG, EVENT_PROGRESS)
+from ios_profile import ENCODER_PRESETS, MOOV_FASTSTART, MOOV_MODES, build_command
+from job_queue import ConversionJob, CHUNKS_AUTO, DONE, FAILED, CANCELLED, ORDER_FIFO, QUEUE_ORDERS
+from manifest import INPUT_PLACEHOLDER, OUTPUT_PLACEHOLDER, Manifest, arguments_hash, content_id
+from staging import DEFAULT_LOOKAHEAD, DEFAULT_MAX_BYTES, SCRATCH_ENV, Stager
+from verify import DURATION_TOLERANCE, VERIFY_WORKERS, Verifier
+
+
+# Inputs picked up when walking directories (same list as the GUI file dialog)
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".wmv", ".flv", ".webm", ".ts", ".m4v")
+OUTPUT_FORMATS = ("mp4", "mov", "m4v")
+
+
+def job_arguments(job, plan, vcodec):
+    """ffmpeg arguments that define the output, with the file names left out"""
+    copy_plan = plan if job.smart_copy else None
+    if job.renditions:
+        return renditions.build_command(
+            INPUT_PLACEHOLDER, OUTPUT_PLACEHOLDER, vcodec, ladder(job, plan), job.output_format,
+            plan, hls=job.hls, progress=False, preset=job.preset,
+            copy_audio=job.smart_copy and plan is not None and plan.copy_audio,
+            moov_mode=job.moov_mode, duration=job.total_duration)
+    arguments = build_command(INPUT_PLACEHOLDER, OUTPUT_PLACEHOLDER, vcodec,
+                              job.output_format, copy_plan, progress=False, preset=job.preset,
+                              moov_mode=job.moov_mode, duration=job.total_duration,
+                              frame_rate=plan.frame_rate if plan is not None else 0.0)
+    if is_segmented(job, plan, vcodec):
+        arguments += ["#chunks", str(job.chunks or "auto")]
+    return arguments
+
+
+def _reused_report(job, vcodec, mode, started, source=None):
+    report = {
+        "input": job.input_file,
+        "output": job.output_file,
+        "codec": job.codec,
+        "format": job.output_format,
+        "input_size": os.path.getsize(job.input_file),
+        "vcodec": vcodec,
+        "mode": mode,
+        "status": DONE,
+        "exit_code": 0,
+        "wall_time": round(time.monotonic() - started, 3),
+        "duration": round(job.total_duration, 3),
+        "speed": 0,
+        "output_size": os.path.getsize(job.output_file),
+        "skipped": True,
+    }
+    if source:
+        report["source"] = source
+    return report
+
+
+def check_incremental(job, identity, manifest, force=False, log=print):
+    """
+    Probe a job and check it against the batch manifest (blocking).
+
+    Returns (report, prepared, args_hash). `report` is set when the output
+    is up to date or was copied from an identical input converted with the
+    same arguments; otherwise the job still has to be converted.
+    """
+    started = time.monotonic()
+    job.metrics = metrics.JobMetrics(job)
+    prepared = prepare_job(job, log, manifest.known_probe(identity))
+    job.metrics.probe_finished()
+    probe_info, plan, vcodec = prepared
+    args_hash = arguments_hash(job_arguments(job, plan, vcodec))
+
+    if not force:
+        if manifest.is_up_to_date(job.output_file, identity, args_hash):
+            job.status = DONE
+            return _reused_report(job, vcodec, "up-to-date", started), prepared, args_hash
+
+        # A ladder is several files: only the up-to-date check applies to it
+        entry = None
+        if not job.renditions:
+            entry = manifest.find_output(identity, args_hash, exclude=job.output_file)
+        if entry is not None:
+            source = manifest.output_path(entry)
+            os.makedirs(os.path.dirname(job.output_file) or ".", exist_ok=True)
+            shutil.copyfile(source, job.output_file)
+            manifest.record(job.output_file, identity, args_hash, probe_info,
+                            checksum=entry["output"]["checksum"])
+            job.status = DONE
+            return _reused_report(job, vcodec, "dedup", started, source), prepared, args_hash
+
+    manifest.forget(job.output_file)
+    return None, prepared, args_hash
+
+
+def record_output(manifest, job, identity, args_hash, probe_info, names=None):
+    """Record a converted job in the manifest with every file it wrote (blocking)"""
+    files = renditions.output_files(job.output_file, names, job.hls) if names else ()
+    manifest.record(job.output_file, identity, args_hash, probe_info, files=files)
+
+
+async def convert_incremental(engine, job, identity, manifest, probe_slots, force=False):
+    """
+    engine.run() backed by the batch manifest: skip or reuse if possible,
+    otherwise convert and record the result. The probe waits for one of
+    `probe_slots` (asyncio.Semaphore) so a big batch does not start an
+    ffprobe for every file at once.
+    """
+    loop = asyncio.get_running_loop()
+    async with probe_slots:
+        report, prepared, args_hash = await loop.run_in_executor(
+            None, check_incremental, job, identity, manifest, force, lambda message: None)
+    if report is not None:
+        return report
+    report = await engine.run(job, prepared)
+    if job.status == DONE:
+        probe_info, plan, vcodec = prepared
+        if report.get("vcodec") not in (None, vcodec):
+            # The engine encoded with another encoder (libx264 when no NVENC session was free)
+            args_hash = arguments_hash(job_arguments(job, plan, report["vcodec"]))
+        await loop.run_in_executor(None, record_output, manifest, job, identity, args_hash, probe_info,
+                                   report.get("renditions"))
+    return report
+
+
+async def convert_group(engine, group, manifest, probe_slots, force=False):
+    """
+    Convert jobs whose inputs have the same content one after another, so
+    only the first one encodes and the others reuse its output.
+    """
+    return [await convert_incremental(engine, job, identity, manifest, probe_slots, force)
+            for job, identity in group]
+
+
+async def convert_single(job):
+    """Run one job, printing its log and progress from the engine's event stream"""
+    engine = ConversionEngine(max_workers=1)
+    events = engine.events()
+    engine.submit(job)
+    try:
+        async for event in events:
+            if event.kind == EVENT_PROGRESS:
+                print(f"\r⏳ {job.percent:5.1f}%  {job.speed:.1f}x", end="", flush=True)
+            elif event.kind == EVENT_LOG:
+                print(f"\r{event.message}")
+            elif event.kind == EVENT_DONE:
+                print()
+                return event.report
+    finally:
+        events.close()
+
+
+def convert_video(input_file, output_file, use_gpu=True, codec="h264"):
+    """แปลงวิดีโอด้วย GPU (NVENC) ถ้ามี, ถ้าไม่มี fallback ไป CPU - iOS Compatible"""
+    output_format = Path(output_file).suffix.lstrip(".").lower()
+    if output_format not in OUTPUT_FORMATS:
+        output_format = "mp4"
+
+    if codec not in ("h264", "h265"):
+        print(f"⚠️ ไม่รู้จัก codec: {codec}, ใช้ h264 แทน")
+        codec = "h264"
+
+    job = ConversionJob(input_file, output_file, use_gpu, codec, output_format)
+
+    print("🚀 แปลงไฟล์:", input_file)
+    try:
+        report = asyncio.run(convert_single(job))
+    except KeyboardInterrupt:
+        print("\n🛑 หยุดการแปลงไฟล์...")
+        process_registry.stop_all()
+        return False
+    print(f"🎬 Mode: {report['mode']} ({report['vcodec']})")
+    if report["status"] != DONE:
+        print(f"❌ การแปลงไฟล์ล้มเหลว (exit code: {report['exit_code']})")
+        if report.get("error"):
+            print(report["error"])
+        if report.get("log"):
+            print(f"📄 log ทั้งหมดของ ffmpeg: {report['log']}")
+        return False
+    print("🎉 แปลงไฟล์เสร็จแล้ว:", output_file)
+    return True
+
+
+def _glob_base(pattern):
+    """Directory part of a glob pattern before the first wildcard"""
+    parts = Path(pattern).parts
+    base = []
+    for part in parts:
+        if glob.has_magic(part):
+            break
+        base.append(part)
+    return Path(*base) if base else Path(".")
+
+
+def collect_inputs(sources):
+    """
+    Expand directories (walked recursively), globs and files into
+    (input_path, relative_path) pairs; the relative path is mirrored
+    under the output root.
+    """
+    seen = set()
+    result = []
+
+    def add(path, base):
+        path = Path(path)
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen or not path.is_file():
+            return
+        seen.add(key)
+        result.append((path, path.relative_to(base) if base else Path(path.name)))
+
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(VIDEO_EXTENSIONS):
+                        add(Path(root) / name, Path(source))
+        elif glob.has_magic(source):
+            base = _glob_base(source)
+            for match in sorted(glob.glob(source, recursive=True)):
+                add(match, base)
+        else:
+            add(source, None)
+    return result
+
+
+def output_path_for(relative_path, output_root, output_format, hls=False):
+    if hls:
+        # One folder per input: master playlist, media playlists and segments
+        return Path(output_root) / relative_path.with_suffix("") / renditions.HLS_MASTER_PLAYLIST
+    return Path(output_root) / relative_path.with_suffix(f".{output_format}")
+
+
+class ReportWriter:
+    """Write per-file results as JSONL while running, or one JSON document at the end"""
+
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = path is not None and path.endswith(".jsonl")
+        self.results = []
+        self._lock = threading.Lock()
+        if self.jsonl:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding='utf-8')
+
+    def add(self, result):
+        with self._lock:
+            self.results.append(result)
+            if self.jsonl:
+                self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def close(self, summary):
+        if self.jsonl:
+            self._file.close()
+        elif self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "w", encoding='utf-8') as f:
+                json.dump({"summary": summary, "files": self.results}, f,
+                          ensure_ascii=False, indent=2)
+
+
+def make_job(args, path, relative_path):
+    """ConversionJob for one input of `batch` or `watch`, output mirrored under args.output"""
+    return ConversionJob(str(path), str(output_path_for(relative_path, args.output, args.format, args.hls)),
+                         not args.no_gpu, args.codec, args.format,
+                         smart_copy=not args.no_smart_copy, chunks=args.chunks,
+                         target_speed=args.target_speed, moov_mode=args.moov,
+                         renditions=args.renditions, hls=args.hls)
+
+
+def make_engine(args):
+    """Conversion engine with the batch options (staging, verification, cores...)"""
+    stager = None
+    if args.stage is not None:
+        stager = Stager(args.stage or None, args.stage_ahead, int(args.scratch_limit * 1024 ** 3),
+                        remote_only=not args.stage_all)
+    verifier = None
+    if args.verify or args.verify_samples:
+        verifier = Verifier(args.verify_workers, args.verify_tolerance, args.verify_samples)
+    return ConversionEngine(max_workers=args.jobs, core_scheduler=CoreScheduler(
+        partition=not args.no_core_partition, nice=args.nice), nvenc_sessions=args.nvenc_sessions,
+        order=args.order, stager=stager, verifier=verifier)
+
+
+def close_engine(engine):
+    """Delete the staged files and stop the verification threads of a make_engine() engine"""
+    if engine.stager is not None:
+        engine.stager.close()
+    if engine.verifier is not None:
+        engine.verifier.close()
+
+
+def describe_result(result):
+    """'input (details)' line of a finished file"""
+    if result.get("skipped"):
+        detail = result["mode"]
+    elif "wall_time" in result:
+        detail = f"{result['wall_time']:.1f}s, {result['speed']:.1f}x, {result['mode']}"
+        if result.get("verify") == "failed":
+            detail += "; ตรวจสอบไม่ผ่าน: " + "; ".join(result["error"].splitlines())
+    else:
+        detail = result.get("error", "")
+    return f"{result['input']} ({detail})"
+
+
+def failed_results(group, error):
+    """Reports of the jobs of a group that an exception stopped"""
+    results = []
+    for job, identity in group:
+        if not job.finished:
+            job.status = FAILED
+            results.append({"input": job.input_file, "output": job.output_file,
+                            "status": FAILED, "exit_code": None, "error": str(error)})
+    return results
+
+
+async def convert_batch(jobs, manifest, report, args):
+    """Convert `jobs` on one engine, adding each result to `report` as it finishes"""
+    loop = asyncio.get_running_loop()
+    engine = make_engine(args)
+    finished = 0
+    # Reading inputs (partial hashes, ffprobe) goes as wide as the encodes, no wider
+    probe_slots = asyncio.Semaphore(args.jobs)
+
+    async def identify(job):
+        async with probe_slots:
+            return await loop.run_in_executor(None, manifest.identify, job.input_file)
+
+    # Group identical inputs (same size and partial hash) into one task
+    identities = await asyncio.gather(*(identify(job) for job in jobs))
+    groups = {}
+    for job, identity in zip(jobs, identities):
+        groups.setdefault(content_id(identity), []).append((job, identity))
+
+    async def convert_and_report(group):
+        nonlocal finished
+        try:
+            results = await convert_group(engine, group, manifest, probe_slots, args.force)
+        except Exception as e:
+            results = failed_results(group, e)
+        for result in results:
+            report.add(result)
+            finished += 1
+            icon = "✅" if result["status"] == DONE else "❌"
+            print(f"{icon} [{finished}/{len(jobs)}] {describe_result(result)}")
+
+    try:
+        await asyncio.gather(*(convert_and_report(group) for group in groups.values()))
+    finally:
+        close_engine(engine)
+
+
+def run_batch(args):
+    """`convert.py batch`: convert many files in parallel and write a report"""
+    if not ffmpeg_caps.find_ffmpeg():
+        print("❌ ไม่พบ ffmpeg ในระบบ กรุณาติดตั้ง ffmpeg ก่อน")
+        return 2
+
+    metrics.configure(args.metrics_log, args.textfile_dir)
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("⚠️ ไม่พบไฟล์วิดีโอ")
+        return 1
+
+    if args.hls and not args.renditions:
+        args.renditions = list(renditions.DEFAULT_LADDER)
+    jobs = [make_job(args, path, rel) for path, rel in inputs]
+    print(f"🗂️ {len(jobs)} ไฟล์, ทำงานพร้อมกัน {args.jobs} งาน → {args.output}")
+
+    manifest = Manifest(args.output)
+    report = ReportWriter(args.report)
+    started = time.monotonic()
+    try:
+        asyncio.run(convert_batch(jobs, manifest, report, args))
+    except KeyboardInterrupt:
+        # asyncio.run() already cancelled the jobs and stopped their ffmpeg
+        print("\n🛑 หยุดการแปลงไฟล์...")
+        process_registry.stop_all()
+
+    counts = {state: sum(1 for job in jobs if job.status == state)
+              for state in (DONE, FAILED, CANCELLED)}
+    summary = {
+        "files": len(jobs),
+        "done": counts[DONE],
+        "failed": counts[FAILED],
+        "cancelled": counts[CANCELLED],
+        "skipped": sum(1 for result in report.results if result.get("skipped")),
+        "verify_failed": sum(1 for result in report.results if result.get("verify") == "failed"),
+        "jobs": args.jobs,
+        "wall_time": round(time.monotonic() - started, 3),
+    }
+    report.close(summary)
+    print(f"🎉 เสร็จ {counts[DONE]}/{len(jobs)} ไฟล์ ใน {summary['wall_time']:.1f}s"
+          + (f", ล้มเหลว {counts[FAILED]}" if counts[FAILED] else ""))
+    return 0 if counts[DONE] == len(jobs) else 1
+
+
+async def watch_folders(manifest, report, args):
+    """Convert each video that is complete in the watched folders, until SIGTERM or Ctrl+C"""
+    loop = asyncio.get_running_loop()
+    engine = make_engine(args)
+    active = {}     # input path -> task converting it
+    again = set()   # inputs that changed while they were converted
+    finished = 0
+    probe_slots = asyncio.Semaphore(args.jobs)
+
+    async def convert_file(path, relative_path):
+        nonlocal finished
+        job = make_job(args, path, Path(relative_path))
+        group = []
+        try:
+            async with probe_slots:
+                identity = await loop.run_in_executor(None, manifest.identify, job.input_file)
+            group = [(job, identity)]
+            results = await convert_group(engine, group, manifest, probe_slots, args.force)
+        except Exception as e:
+            results = failed_results(group or [(job, None)], e)
+        for result in results:
+            report.add(result)
+            finished += 1
+            icon = "✅" if result["status"] == DONE else "❌"
+            print(f"{icon} [{finished}] {describe_result(result)}")
+
+    def on_ready(path, relative_path):
+        if path in active:
+            again.add(path)  # Converted again once the current run ends
+            return
+        print(f"📥 ไฟล์ใหม่: {path}")
+        task = loop.create_task(convert_file(path, relative_path))
+        active[path] = task
+        task.add_done_callback(lambda _: done(path, relative_path))
+
+    def done(path, relative_path):
+        del active[path]
+        if path in again and not watcher_stopped:
+            again.discard(path)
+            on_ready(path, relative_path)
+
+    watcher = FolderWatcher(args.inputs, on_ready, VIDEO_EXTENSIONS, exclude=[args.output],
+                            settle=args.settle, poll_interval=args.poll_interval,
+                            use_inotify=not args.poll)
+    watcher_stopped = False
+    try:
+        loop.add_signal_handler(signal.SIGTERM, watcher.close)
+    except (NotImplementedError, AttributeError):
+        pass  # Windows: Ctrl+C only
+    print(f"👀 ติดตาม {', '.join(args.inputs)} → {args.output} ทำงานพร้อมกัน {args.jobs} งาน, "
+          "Ctrl+C เพื่อหยุด")
+    try:
+        await watcher.run()
+    finally:
+        watcher_stopped = True
+        watcher.close()
+        engine.cancel_all()
+        if active:
+            await asyncio.gather(*active.values(), return_exceptions=True)
+        close_engine(engine)
+
+
+def run_watch(args):
+    """`convert.py watch`: headless daemon that converts the files dropped into folders"""
+    if not ffmpeg_caps.find_ffmpeg():
+        print("❌ ไม่พบ ffmpeg ในระบบ กรุณาติดตั้ง ffmpeg ก่อน")
+        return 2
+    output = os.path.abspath(args.output)
+    for directory in args.inputs:
+        if not os.path.isdir(directory):
+            print(f"❌ ไม่พบโฟลเดอร์: {directory}")
+            return 2
+        directory = os.path.abspath(directory)
+        if output == directory or directory.startswith(output + os.sep):
+            # Every output would be picked up as a new input
+            print(f"❌ โฟลเดอร์ปลายทางต้องไม่ใช่โฟลเดอร์ที่ติดตาม: {directory}")
+            return 2
+
+    metrics.configure(args.metrics_log, args.textfile_dir)
+    if args.hls and not args.renditions:
+        args.renditions = list(renditions.DEFAULT_LADDER)
+    manifest = Manifest(args.output)
+    report = ReportWriter(args.report)
+    started = time.monotonic()
+    try:
+        asyncio.run(watch_folders(manifest, report, args))
+    except KeyboardInterrupt:
+        print("\n🛑 หยุดติดตามโฟลเดอร์...")
+        process_registry.stop_all()
+
+    results = report.results
+    summary = {
+        "files": len(results),
+        "done": sum(1 for result in results if result["status"] == DONE),
+        "failed": sum(1 for result in results if result["status"] == FAILED),
+        "cancelled": sum(1 for result in results if result["status"] == CANCELLED),
+        "skipped": sum(1 for result in results if result.get("skipped")),
+        "jobs": args.jobs,
+        "wall_time": round(time.monotonic() - started, 3),
+    }
+    report.close(summary)
+    print(f"🎉 แปลงเสร็จ {summary['done']}/{summary['files']} ไฟล์"
+          + (f", ล้มเหลว {summary['failed']}" if summary["failed"] else ""))
+    return 0 if summary["done"] == summary["files"] - summary["cancelled"] else 1
+
+
+def ladder_argument(text):
+    try:
+        return renditions.parse_ladder(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_batch_parser(watch=False):
+    if watch:
+        parser = argparse.ArgumentParser(
+            prog="convert.py watch",
+            description="ติดตามโฟลเดอร์ แล้วแปลงไฟล์วิดีโอที่วางลงไปทันทีที่เขียนเสร็จ (daemon ไม่มีหน้าต่าง)")
+        parser.add_argument("inputs", nargs="+", help="โฟลเดอร์ที่ติดตาม (รวมโฟลเดอร์ย่อย)")
+        parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                            help="ถือว่าไฟล์เขียนเสร็จเมื่อขนาดไม่เปลี่ยนนานกี่วินาที "
+                                 "(ใช้กับ polling และไฟล์ที่ไม่เห็นตอนปิดไฟล์)")
+        parser.add_argument("--poll", action="store_true",
+                            help="ตรวจโฟลเดอร์แบบ polling แทน inotify")
+        parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                            help="ระยะห่างของการตรวจโฟลเดอร์แบบ polling (วินาที)")
+    else:
+        parser = argparse.ArgumentParser(
+            prog="convert.py batch",
+            description="แปลงไฟล์จำนวนมากแบบขนาน (iOS Compatible, ค่าเดียวกับ GUI)")
+        parser.add_argument("inputs", nargs="+",
+                            help="ไฟล์, โฟลเดอร์ (ค้นหาแบบ recursive) หรือ glob เช่น 'rec/**/*.ts'")
+    parser.add_argument("-o", "--output", required=True,
+                        help="โฟลเดอร์ปลายทาง (จำลองโครงสร้างโฟลเดอร์ต้นฉบับ)")
+    parser.add_argument("-j", "--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="จำนวนงานที่ทำพร้อมกัน")
+    parser.add_argument("--order", choices=QUEUE_ORDERS, default=ORDER_FIFO,
+                        help="ลำดับเริ่มงานที่รอคิว: fifo (ตามลำดับไฟล์), shortest (งานที่คาดว่าเสร็จเร็วสุดก่อน "
+                             "จากความยาว/ขนาดวิดีโอและความเร็วที่เคยวัดได้บนเครื่องนี้), deadline หรือ priority")
+    parser.add_argument("--stage", nargs="?", const="", metavar="SCRATCH_DIR",
+                        help="คัดลอกไฟล์ต้นฉบับที่อยู่บน network share (SMB/NFS) ล่วงหน้าไปยังดิสก์ในเครื่อง "
+                             "ระหว่างที่งานก่อนหน้ากำลังเข้ารหัส และเขียนไฟล์ผลลัพธ์ลงดิสก์ในเครื่องก่อนย้ายไปปลายทาง "
+                             f"(ค่าเริ่มต้น: ${SCRATCH_ENV} หรือโฟลเดอร์ temp)")
+    parser.add_argument("--stage-ahead", type=int, default=DEFAULT_LOOKAHEAD,
+                        help="จำนวนไฟล์ในคิวที่คัดลอกล่วงหน้า")
+    parser.add_argument("--scratch-limit", type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3,
+                        help="พื้นที่ scratch สูงสุด (GB)")
+    parser.add_argument("--stage-all", action="store_true",
+                        help="คัดลอกทุกไฟล์ผ่าน scratch ไม่ใช่เฉพาะไฟล์บน network share")
+    parser.add_argument("--verify", action="store_true",
+                        help="ตรวจสอบไฟล์ผลลัพธ์หลังแปลงเสร็จ (อ่าน container ได้, ความยาวตรงกับต้นฉบับ, "
+                             "profile/level/pix_fmt ตามข้อกำหนด iOS) ระหว่างที่งานถัดไปกำลังเข้ารหัส")
+    parser.add_argument("--verify-samples", type=int, default=0,
+                        help="ถอดรหัสตัวอย่าง N ช่วงกระจายทั่วไฟล์ (ช่วงสุดท้ายที่ท้ายไฟล์) เพื่อหาไฟล์เสีย "
+                             "(เปิด --verify ด้วย)")
+    parser.add_argument("--verify-tolerance", type=float, default=DURATION_TOLERANCE,
+                        help="ความยาวที่ต่างจากต้นฉบับได้ (วินาที อย่างน้อย 1%% ของความยาว)")
+    parser.add_argument("--verify-workers", type=int, default=VERIFY_WORKERS,
+                        help="จำนวนไฟล์ที่ตรวจสอบพร้อมกัน")
+    parser.add_argument("--codec", choices=("h264", "h265"), default="h264")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="mp4")
+    parser.add_argument("--no-gpu", action="store_true", help="ไม่ใช้ NVENC")
+    parser.add_argument("--nvenc-sessions", type=int,
+                        help="จำนวนงาน NVENC ที่ GPU รับได้พร้อมกัน (ค่าเริ่มต้น: "
+                             f"${nvenc_slots.SESSIONS_ENV} หรือ {nvenc_slots.DEFAULT_SESSIONS}) "
+                             "งานที่เกินจะใช้ CPU (libx264) แทน")
+    parser.add_argument("--no-smart-copy", action="store_true",
+                        help="เข้ารหัสใหม่เสมอ แม้ไฟล์จะรองรับ iOS อยู่แล้ว")
+    parser.add_argument("--moov", choices=MOOV_MODES, default=MOOV_FASTSTART,
+                        help="ตำแหน่ง moov: faststart (เขียนไฟล์ใหม่ทั้งไฟล์ตอนจบ), fragmented (fMP4 "
+                             "ไม่ต้องเขียนซ้ำ) หรือ reserve (จองพื้นที่ moov ไว้ต้นไฟล์ตามความยาววิดีโอ)")
+    parser.add_argument("--renditions", type=ladder_argument,
+                        help="ถอดรหัสครั้งเดียวแล้วเข้ารหัสหลายขนาดใน ffmpeg ตัวเดียว เช่น 1080p,720p,480p "
+                             f"(มี {', '.join(renditions.RENDITIONS)}; ไม่ขยายเกินขนาดต้นฉบับ)")
+    parser.add_argument("--hls", action="store_true",
+                        help="เขียน renditions เป็น HLS (fMP4) พร้อม master.m3u8 ในโฟลเดอร์ของแต่ละไฟล์ "
+                             f"(ค่าเริ่มต้น {','.join(renditions.DEFAULT_LADDER)})")
+    parser.add_argument("--chunks", type=int, default=CHUNKS_AUTO,
+                        help="แบ่งแต่ละไฟล์เป็น N ส่วนที่ keyframe แล้วเข้ารหัสพร้อมกัน (1 = ไม่แบ่ง, "
+                             "ค่าเริ่มต้น 0 = อัตโนมัติ: แบ่งเฉพาะไฟล์ยาว 10 นาทีขึ้นไปที่เข้ารหัสด้วย CPU "
+                             "ตามจำนวนคอร์ที่ว่าง)")
+    parser.add_argument("--target-speed", type=float,
+                        help="ใช้ preset ที่ช้าที่สุด (คุณภาพดีที่สุด) ที่ยังเร็วอย่างน้อย N เท่าของเวลาจริง "
+                             "ตามผล calibrate เช่น 4")
+    parser.add_argument("--no-core-partition", action="store_true",
+                        help="ไม่แบ่งคอร์ CPU ให้แต่ละงาน libx264 (ปล่อยให้ ffmpeg ใช้ทุกคอร์ตามค่าเริ่มต้น)")
+    parser.add_argument("--nice", type=int,
+                        help="ลดลำดับความสำคัญของ ffmpeg (nice N และ ionice ต่ำสุด) เพื่อไม่ให้เครื่องหน่วง")
+    parser.add_argument("--report", help="ไฟล์รายงาน .json หรือ .jsonl")
+    parser.add_argument("--metrics-log",
+                        help="ไฟล์ JSONL สำหรับ metrics ของแต่ละงาน (ค่าเริ่มต้น: job_metrics.jsonl ในโฟลเดอร์ข้อมูลแอป)")
+    parser.add_argument("--textfile-dir",
+                        help=f"โฟลเดอร์ textfile collector ของ node-exporter (หรือตั้งค่า {metrics.TEXTFILE_DIR_ENV})")
+    parser.add_argument("--force", action="store_true",
+                        help="แปลงใหม่ทั้งหมด แม้ manifest จะบอกว่าไฟล์ปลายทางเป็นปัจจุบันแล้ว")
+    return parser
+
+
+def run_calibrate(args):
+    """`convert.py calibrate`: measure encoders/presets and save the machine profile"""
+    if not ffmpeg_caps.find_ffmpeg():
+        print("❌ ไม่พบ ffmpeg ในระบบ กรุณาติดตั้ง ffmpeg ก่อน")
+        return 2
+    encoders = args.encoders or calibration.available_encoders()
+    print(f"🧪 Calibrate: {', '.join(encoders)}")
+    profile = calibration.calibrate(encoders, args.samples)
+    if not profile["results"]:
+        print("❌ ไม่มี encoder ที่ทดสอบผ่าน")
+        return 1
+
+    print("🎯 preset ที่เลือกสำหรับ 1080p30:")
+    for vcodec in encoders:
+        picks = [f"{speed}x → {calibration.pick_preset(vcodec, speed, 1920, 1080, 30, profile)}"
+                 for speed in (1, 2, 4, 8)]
+        print(f"   {vcodec}: " + ", ".join(picks))
+    print("💾 บันทึกโปรไฟล์แล้ว")
+    return 0
+
+
+def build_calibrate_parser():
+    parser = argparse.ArgumentParser(
+        prog="convert.py calibrate",
+        description="วัดความเร็วของแต่ละ encoder/preset บนเครื่องนี้ แล้วบันทึกเป็นโปรไฟล์")
+    parser.add_argument("samples", nargs="*",
+                        help="ไฟล์ตัวอย่างเพิ่มเติม (ใช้ช่วงต้นของไฟล์) นอกเหนือจาก testsrc2")
+    parser.add_argument("--encoders", nargs="+", choices=sorted(ENCODER_PRESETS),
+                        help="encoder ที่จะทดสอบ (ค่าเริ่มต้น: ทุกตัวที่ ffmpeg รองรับ)")
+    return parser
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "calibrate":
+        sys.exit(run_calibrate(build_calibrate_parser().parse_args(sys.argv[2:])))
+
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch_args = build_batch_parser().parse_args(sys.argv[2:])
+        batch_args.jobs = max(1, batch_args.jobs)
+        sys.exit(run_batch(batch_args))
+
+    if len(sys.argv) > 1 and sys.argv[1] == "watch":
+        watch_args = build_batch_parser(watch=True).parse_args(sys.argv[2:])
+        watch_args.jobs = max(1, watch_args.jobs)
+        sys.exit(run_watch(watch_args))
+
+    if len(sys.argv) < 3:
+        print(
+            "วิธีใช้: python convert.py <input_file> <output_file> [h264|h265]")
+        print(
+            "       python convert.py batch <input_dir|glob>... -o <output_dir> [-j N] [--report report.jsonl]")
+        print(
+            "       python convert.py watch <input_dir>... -o <output_dir> [-j N] [--verify]")
+        print(
+            "       python convert.py calibrate [sample_file...]")
+        sys.exit(1)
+
+    input_file = sys.argv[1]
+    output_file = sys.argv[2]
+    codec = sys.argv[3] if len(sys.argv) > 3 else "h264"
+
+    success = convert_video(input_file, output_file, use_gpu=True, codec=codec)
+    sys.exit(0 if success else 1)
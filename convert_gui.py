@@ -1,18 +1,36 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import subprocess
-import shutil
 import sys
 import os
 import threading
+import time
 from pathlib import Path
 
+import ffmpeg_caps
+import process_registry
+import renditions
+from ios_profile import MOOV_FASTSTART, MOOV_MODES
+from job_queue import (ConversionJob, default_worker_count, CHUNKS_AUTO, ORDER_FIFO, QUEUE_ORDERS,
+                       PENDING, RUNNING, DONE, FAILED, CANCELLED)
+from log_view import LogView
+from ui_channel import UIUpdateChannel
+
+# Rendition ladders offered in the GUI (one decode, several sizes)
+LADDER_OFF = "off"
+LADDER_CHOICES = [LADDER_OFF, "1080p,720p,480p", "720p,480p,360p", "1080p,720p,480p,360p"]
+
+# Seconds between refreshes of the predicted finish times
+FORECAST_INTERVAL = 1.0
+
+# Set by bench_startup.py: file that receives the time the first window is drawn
+STARTUP_REPORT_ENV = "CONVERT2IOS_STARTUP_REPORT"
+
 
 class VideoConverterGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Video Converter - iOS Compatible")
-        self.root.geometry("600x400")
+        self.root.geometry("800x650")
         self.root.resizable(True, True)
 
         # Variables
@@ -22,20 +40,42 @@ class VideoConverterGUI:
         self.codec_var = tk.StringVar(value="h264")
         self.use_gpu_var = tk.BooleanVar(value=True)
         self.format_var = tk.StringVar(value="mp4")  # Output format selection
-
-        # Process tracking
-        self.current_process = None
-        self.conversion_thread = None
-
-        # Progress tracking
-        self.total_duration = 0
-        self.current_time = 0
-        self.conversion_speed = 0
+        # Where the MP4/MOV index goes (faststart rewrites the whole file at the end)
+        self.moov_var = tk.StringVar(value=MOOV_FASTSTART)
+        # Copy streams that are already iOS compatible instead of re-encoding
+        self.smart_copy_var = tk.BooleanVar(value=True)
+
+        self.workers_var = tk.IntVar(value=default_worker_count())
+        # Parallel keyframe chunks per file (0 = auto: long files only, 1 = one piece)
+        self.chunks_var = tk.IntVar(value=CHUNKS_AUTO)
+        # Several sizes from one decode, optionally as an HLS (fMP4) stream
+        self.ladder_var = tk.StringVar(value=LADDER_OFF)
+        self.hls_var = tk.BooleanVar(value=False)
+        # Which waiting job starts next, and the priority/deadline given to new jobs
+        self.order_var = tk.StringVar(value=ORDER_FIFO)
+        self.priority_var = tk.IntVar(value=0)
+        self.deadline_var = tk.StringVar()  # HH:MM, empty for none
+        # Copy inputs on network shares to local scratch ahead of their encode
+        self.stage_var = tk.BooleanVar(value=False)
+        # Check each output after its encode (and decode this many samples of it)
+        self.verify_var = tk.BooleanVar(value=False)
+        self.verify_samples_var = tk.IntVar(value=0)
+        self.forecast_at = 0.0
+
+        # Conversion engine (one asyncio loop for every ffmpeg job), see `engine`
+        self._engine = None
+        # SQLite journal of the queue, survives crashes and restarts, see `journal`
+        self._journal = None
+        self.queue_idle_reported = True
+
+        # Workers never touch Tk directly, they post to this channel
+        self.ui = UIUpdateChannel(self.root, self.append_log_lines)
 
         # Setup cleanup on window close
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
         self.setup_ui()
+        self.ui.start()
 
     def setup_ui(self):
         # Main frame
@@ -97,11 +137,74 @@ class VideoConverterGUI:
                                     values=["mp4", "mov", "m4v"], state="readonly", width=8)
         format_combo.grid(row=0, column=3, sticky=tk.W, padx=(10, 0))
 
+        ttk.Label(codec_frame, text="Moov:").grid(
+            row=0, column=4, sticky=tk.W, padx=(20, 0))
+        ttk.Combobox(codec_frame, textvariable=self.moov_var, values=list(MOOV_MODES),
+                     state="readonly", width=10).grid(row=0, column=5, sticky=tk.W, padx=(10, 0))
+
         # GPU acceleration checkbox
         ttk.Checkbutton(codec_frame, text="Use GPU Acceleration (NVENC)",
                         variable=self.use_gpu_var).grid(row=1, column=0, columnspan=2,
                                                         sticky=tk.W, pady=(10, 0))
 
+        ttk.Checkbutton(codec_frame, text="Smart Copy (remux iOS-ready streams)",
+                        variable=self.smart_copy_var).grid(row=4, column=0, columnspan=4,
+                                                           sticky=tk.W, pady=(5, 0))
+        ttk.Checkbutton(codec_frame, text="Stage network files on local disk",
+                        variable=self.stage_var, command=self.update_staging).grid(
+            row=4, column=4, columnspan=2, sticky=tk.W, padx=(20, 0), pady=(5, 0))
+
+        # Number of parallel conversions
+        ttk.Label(codec_frame, text="Workers:").grid(
+            row=1, column=2, sticky=tk.W, padx=(20, 0), pady=(10, 0))
+        ttk.Spinbox(codec_frame, from_=1, to=os.cpu_count() or 1,
+                    textvariable=self.workers_var, width=6,
+                    command=self.update_worker_count).grid(
+            row=1, column=3, sticky=tk.W, padx=(10, 0), pady=(10, 0))
+
+        # Split long files at keyframes and encode the pieces in parallel
+        ttk.Label(codec_frame, text="Chunks/file (0 = auto):").grid(
+            row=1, column=4, sticky=tk.W, padx=(20, 0), pady=(10, 0))
+        ttk.Spinbox(codec_frame, from_=CHUNKS_AUTO, to=(os.cpu_count() or 1) * 2,
+                    textvariable=self.chunks_var, width=6).grid(
+            row=1, column=5, sticky=tk.W, padx=(10, 0), pady=(10, 0))
+
+        # Rendition ladder: split/scale one decode into several encodes
+        ttk.Label(codec_frame, text="Renditions:").grid(
+            row=2, column=4, sticky=tk.W, padx=(20, 0), pady=(5, 0))
+        ttk.Combobox(codec_frame, textvariable=self.ladder_var, values=LADDER_CHOICES,
+                     state="readonly", width=18).grid(row=2, column=5, sticky=tk.W,
+                                                      padx=(10, 0), pady=(5, 0))
+        ttk.Checkbutton(codec_frame, text="HLS (fMP4) + master.m3u8",
+                        variable=self.hls_var).grid(row=3, column=4, columnspan=2,
+                                                    sticky=tk.W, padx=(20, 0), pady=(2, 0))
+
+        # Queue order, and priority/deadline of the jobs added next
+        ttk.Label(codec_frame, text="Queue order:").grid(
+            row=5, column=0, sticky=tk.W, pady=(5, 0))
+        order_combo = ttk.Combobox(codec_frame, textvariable=self.order_var, values=list(QUEUE_ORDERS),
+                                   state="readonly", width=10)
+        order_combo.grid(row=5, column=1, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+        order_combo.bind("<<ComboboxSelected>>", lambda event: self.update_queue_order())
+        ttk.Label(codec_frame, text="Priority:").grid(
+            row=5, column=2, sticky=tk.W, padx=(20, 0), pady=(5, 0))
+        ttk.Spinbox(codec_frame, from_=0, to=9, textvariable=self.priority_var, width=6).grid(
+            row=5, column=3, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+        ttk.Label(codec_frame, text="Deadline (HH:MM):").grid(
+            row=5, column=4, sticky=tk.W, padx=(20, 0), pady=(5, 0))
+        ttk.Entry(codec_frame, textvariable=self.deadline_var, width=8).grid(
+            row=5, column=5, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+
+        # Post-encode verification, overlapping with the next encodes
+        ttk.Checkbutton(codec_frame, text="Verify outputs (duration, profile/level)",
+                        variable=self.verify_var, command=self.update_verification).grid(
+            row=6, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        ttk.Label(codec_frame, text="Decode samples:").grid(
+            row=6, column=2, sticky=tk.W, padx=(20, 0), pady=(5, 0))
+        ttk.Spinbox(codec_frame, from_=0, to=20, textvariable=self.verify_samples_var, width=6,
+                    command=self.update_verification).grid(
+            row=6, column=3, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+
         # iOS compatibility note
         ttk.Label(codec_frame, text="📱 Baseline Profile + Level 3.1 = Maximum iOS Compatibility",
                   font=("Arial", 9), foreground="blue").grid(row=2, column=0, columnspan=4,
@@ -120,27 +223,69 @@ class VideoConverterGUI:
                                       command=self.start_conversion, style="Accent.TButton")
         self.convert_btn.pack(side=tk.LEFT, padx=(0, 10))
 
-        self.stop_btn = ttk.Button(button_frame, text="Stop Conversion",
+        self.cancel_btn = ttk.Button(button_frame, text="Cancel Selected",
+                                     command=self.cancel_selected_jobs, state="disabled")
+        self.cancel_btn.pack(side=tk.LEFT, padx=(0, 10))
+
+        self.stop_btn = ttk.Button(button_frame, text="Stop All",
                                    command=self.stop_conversion, state="disabled")
         self.stop_btn.pack(side=tk.LEFT, padx=(0, 10))
 
+        ttk.Button(button_frame, text="Clear Finished",
+                   command=self.clear_finished_jobs).pack(side=tk.LEFT, padx=(0, 10))
+
         ttk.Button(button_frame, text="Release Locks",
                    command=self.release_all_locks).pack(side=tk.LEFT)
 
-        # Progress bar
-        self.progress = ttk.Progressbar(main_frame, mode='indeterminate')
-        self.progress.grid(row=6, column=0, columnspan=3,
+        # Job queue list
+        queue_frame = ttk.Frame(main_frame)
+        queue_frame.grid(row=6, column=0, columnspan=3,
+                         sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        queue_frame.columnconfigure(0, weight=1)
+        queue_frame.rowconfigure(0, weight=1)
+
+        self.queue_tree = ttk.Treeview(
+            queue_frame, columns=("status", "progress", "speed", "eta"), height=6)
+        self.queue_tree.heading("#0", text="File")
+        self.queue_tree.heading("status", text="Status")
+        self.queue_tree.heading("progress", text="Progress")
+        self.queue_tree.heading("speed", text="Speed")
+        self.queue_tree.heading("eta", text="Done at")
+        self.queue_tree.column("#0", width=380)
+        self.queue_tree.column("status", width=100, anchor=tk.CENTER)
+        self.queue_tree.column("progress", width=90, anchor=tk.CENTER)
+        self.queue_tree.column("speed", width=70, anchor=tk.CENTER)
+        self.queue_tree.column("eta", width=80, anchor=tk.CENTER)
+        self.queue_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.queue_tree.bind("<<TreeviewSelect>>",
+                             lambda event: self.update_buttons())
+
+        queue_scroll = ttk.Scrollbar(queue_frame, orient=tk.VERTICAL,
+                                     command=self.queue_tree.yview)
+        queue_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.queue_tree.configure(yscrollcommand=queue_scroll.set)
+
+        # Overall queue progress bar
+        self.progress = ttk.Progressbar(main_frame, mode='determinate', maximum=100)
+        self.progress.grid(row=7, column=0, columnspan=3,
                            sticky=(tk.W, tk.E), pady=5)
 
-        # Status text
+        # Status text: only the tail is kept in the widget, older pages load on scroll-up
+        log_frame = ttk.Frame(main_frame)
+        log_frame.grid(row=8, column=0, columnspan=2,
+                       sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
+        log_frame.columnconfigure(0, weight=1)
+        log_frame.rowconfigure(0, weight=1)
         self.status_text = tk.Text(
-            main_frame, height=8, width=70, wrap=tk.WORD)
-        self.status_text.grid(row=7, column=0, columnspan=2,
-                              sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
+            log_frame, height=8, width=70, wrap=tk.WORD)
+        self.status_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        log_scroll = ttk.Scrollbar(log_frame, orient=tk.VERTICAL)
+        log_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.log_view = LogView(self.status_text, log_scroll)
 
-        # Progress percentage display
+        # Progress percentage display (whole queue)
         progress_frame = ttk.Frame(main_frame)
-        progress_frame.grid(row=7, column=2, sticky=(
+        progress_frame.grid(row=8, column=2, sticky=(
             tk.N, tk.S), padx=(10, 0), pady=10)
 
         ttk.Label(progress_frame, text="Progress:", font=(
@@ -159,20 +304,52 @@ class VideoConverterGUI:
             "Arial", 9, "bold")).pack(anchor=tk.W)
         self.speed_label = ttk.Label(
             progress_frame, text="0x", font=("Arial", 10))
-        self.speed_label.pack(anchor=tk.W, pady=(5, 0))
+        self.speed_label.pack(anchor=tk.W, pady=(5, 10))
 
-        # Configure row weight for text area
-        main_frame.rowconfigure(7, weight=1)
+        ttk.Label(progress_frame, text="Jobs:", font=(
+            "Arial", 9, "bold")).pack(anchor=tk.W)
+        self.jobs_label = ttk.Label(
+            progress_frame, text="0 / 0", font=("Arial", 10))
+        self.jobs_label.pack(anchor=tk.W, pady=(5, 10))
+
+        # Predicted finish of the whole queue
+        ttk.Label(progress_frame, text="Queue done at:", font=(
+            "Arial", 9, "bold")).pack(anchor=tk.W)
+        self.forecast_label = ttk.Label(
+            progress_frame, text="-", font=("Arial", 10))
+        self.forecast_label.pack(anchor=tk.W, pady=(5, 0))
+
+        # Configure row weights for queue list and text area
+        main_frame.rowconfigure(6, weight=1)
+        main_frame.rowconfigure(8, weight=1)
+
+    def suggest_output_path(self, input_file):
+        """Auto-suggest output filename next to the input with UTF-8 support"""
+        input_path = Path(input_file)
+        selected_format = self.format_var.get()
+        output_path = input_path.with_suffix(f'.{selected_format}')
+        # If same extension, add _converted
+        if input_path.suffix.lower() == f'.{selected_format}':
+            output_path = input_path.with_stem(
+                input_path.stem + '_converted')
+        return str(output_path)
 
     def browse_input_file(self):
-        filename = filedialog.askopenfilename(
-            title="Select Input Video File",
+        filenames = filedialog.askopenfilenames(
+            title="Select Input Video File(s)",
             filetypes=[
                 ("Video files", "*.mp4 *.avi *.mkv *.mov *.wmv *.flv *.webm *.ts *.m4v"),
                 ("All files", "*.*")
             ]
         )
-        if filename:
+        if len(filenames) > 1:
+            # Many files: queue them all with suggested output names
+            for filename in filenames:
+                normalized_path = os.path.normpath(filename)
+                self.enqueue_job(normalized_path,
+                                 self.suggest_output_path(normalized_path))
+        elif filenames:
+            filename = filenames[0]
             # Ensure proper UTF-8 handling for paths
             try:
                 # Normalize the path to handle UTF-8 characters properly
@@ -181,14 +358,8 @@ class VideoConverterGUI:
 
                 # Auto-suggest output filename with UTF-8 support
                 if not self.output_file.get():
-                    input_path = Path(normalized_path)
-                    selected_format = self.format_var.get()
-                    output_path = input_path.with_suffix(f'.{selected_format}')
-                    # If same extension, add _converted
-                    if input_path.suffix.lower() == f'.{selected_format}':
-                        output_path = input_path.with_stem(
-                            input_path.stem + '_converted')
-                    self.output_file.set(str(output_path))
+                    self.output_file.set(
+                        self.suggest_output_path(normalized_path))
 
                 self.log_message(f"📁 เลือกไฟล์: {normalized_path}")
 
@@ -236,23 +407,12 @@ class VideoConverterGUI:
         self.log_message("🗑️ ล้างการเลือกไฟล์ output")
 
     def log_message(self, message):
-        """Add message to status text area"""
-        self.status_text.insert(tk.END, message + "\n")
-        self.status_text.see(tk.END)
-        self.root.update_idletasks()
+        """Queue a message for the status text area (safe from any thread)"""
+        self.ui.post_log(message)
 
-    def parse_duration(self, duration_str):
-        """Parse duration string (HH:MM:SS.ms) to seconds"""
-        try:
-            parts = duration_str.split(':')
-            if len(parts) == 3:
-                hours = float(parts[0])
-                minutes = float(parts[1])
-                seconds = float(parts[2])
-                return hours * 3600 + minutes * 60 + seconds
-        except:
-            pass
-        return 0
+    def append_log_lines(self, lines):
+        """Add a batch of messages to the status text area (Tk thread only)"""
+        self.log_view.append(lines)
 
     def format_time(self, seconds):
         """Format seconds to HH:MM:SS"""
@@ -261,229 +421,194 @@ class VideoConverterGUI:
         secs = int(seconds % 60)
         return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
-    def update_progress_display(self, current_time=None, speed=None):
-        """Update the progress percentage and time display"""
-        if current_time is not None:
-            self.current_time = current_time
-        if speed is not None:
-            self.conversion_speed = speed
-
-        # Calculate percentage
-        if self.total_duration > 0:
-            percentage = min(
-                100, (self.current_time / self.total_duration) * 100)
-            self.progress_percent_label.configure(text=f"{percentage:.1f}%")
-
-            # Update progress bar to determinate mode
-            self.progress.configure(
-                mode='determinate', maximum=100, value=percentage)
-        else:
-            self.progress_percent_label.configure(text="0%")
-
-        # Update time display
-        current_formatted = self.format_time(self.current_time)
-        total_formatted = self.format_time(self.total_duration)
+    def update_progress_display(self, job=None):
+        """
+        Request a redraw of the job row and the queue totals (any thread).
+
+        Requests are coalesced: however often a worker calls this, each job
+        row and the totals are redrawn at most once per UI tick.
+        """
+        if job is not None:
+            self.ui.post_coalesced(("job", job.id), self.update_job_row, job)
+        self.ui.post_coalesced("queue", self.update_queue_display)
+
+    def update_queue_display(self):
+        """Redraw the whole-queue progress display (Tk thread only)"""
+        jobs = [j for j in self.engine.jobs if j.status != CANCELLED]
+
+        # Overall percentage across the queue
+        percentage = self.engine.overall_progress()
+        self.progress_percent_label.configure(text=f"{percentage:.1f}%")
+        self.progress.configure(mode='determinate', maximum=100, value=percentage)
+
+        # Update time display (sum over all jobs)
+        current_time = sum(j.total_duration if j.status == DONE else j.current_time
+                           for j in jobs)
+        total_duration = sum(j.total_duration for j in jobs)
         self.time_progress_label.configure(
-            text=f"{current_formatted} / {total_formatted}")
+            text=f"{self.format_time(current_time)} / {self.format_time(total_duration)}")
 
-        # Update speed display
-        if self.conversion_speed > 0:
-            self.speed_label.configure(text=f"{self.conversion_speed:.1f}x")
+        # Update speed display (aggregate of running jobs)
+        speed = sum(j.speed for j in jobs if j.status == RUNNING)
+        if speed > 0:
+            self.speed_label.configure(text=f"{speed:.1f}x")
         else:
             self.speed_label.configure(text="0x")
 
-    def parse_ffmpeg_progress(self, line):
-        """Parse FFmpeg output line for progress information"""
-        import re
-
-        # Parse duration from initial output
-        if "Duration:" in line:
-            duration_match = re.search(
-                r'Duration: (\d{2}:\d{2}:\d{2}\.\d{2})', line)
-            if duration_match:
-                self.total_duration = self.parse_duration(
-                    duration_match.group(1))
-                self.update_progress_display()
-
-        # Parse current time and speed from progress lines
-        elif "time=" in line and "speed=" in line:
-            time_match = re.search(r'time=(\d{2}:\d{2}:\d{2}\.\d{2})', line)
-            speed_match = re.search(r'speed=\s*(\d+\.?\d*)x', line)
-
-            current_time = 0
-            speed = 0
-
-            if time_match:
-                current_time = self.parse_duration(time_match.group(1))
-
-            if speed_match:
-                speed = float(speed_match.group(1))
-
-            self.update_progress_display(current_time, speed)
-
-    def check_nvenc(self):
-        """ตรวจสอบว่า ffmpeg รองรับ NVENC หรือไม่"""
-        try:
-            result = subprocess.run(
-                ["ffmpeg", "-encoders"],
-                capture_output=True,
-                text=True,
-                check=True,
-                encoding='utf-8',
-                errors='replace'
-            )
-            encoders = result.stdout
-            return ("h264_nvenc" in encoders) or ("hevc_nvenc" in encoders)
-        except Exception as e:
-            self.log_message(f"❌ ไม่สามารถตรวจสอบ ffmpeg ได้: {e}")
-            return False
-
-    def convert_video(self, input_file, output_file, use_gpu=True, codec="h264", output_format="mp4"):
-        """แปลงวิดีโอด้วย GPU (NVENC) ถ้ามี, ถ้าไม่มี fallback ไป CPU - iOS Compatible"""
-
-        if use_gpu and self.check_nvenc():
-            self.log_message(
-                "✅ ใช้ GPU (NVENC) สำหรับการเข้ารหัส (iOS Compatible)")
-            if codec == "h264":
-                vcodec = "h264_nvenc"
-            elif codec == "h265":
-                vcodec = "hevc_nvenc"
-            else:
-                self.log_message(f"⚠️ ไม่รู้จัก codec: {codec}, ใช้ h264 แทน")
-                vcodec = "h264_nvenc"
+        counts = self.engine.counts()
+        finished = counts[DONE] + counts[FAILED]
+        self.jobs_label.configure(text=f"{finished} / {len(jobs)}")
+
+        if time.monotonic() - self.forecast_at >= FORECAST_INTERVAL:
+            self.update_forecast()
+
+    def update_forecast(self):
+        """Show the predicted finish of the queue and of each waiting job (Tk thread only)"""
+        self.forecast_at = time.monotonic()
+        queue_done, finishes = self.engine.forecast()
+        if finishes:
+            remaining = max(0.0, queue_done - time.time())
+            self.forecast_label.configure(
+                text=f"{time.strftime('%H:%M:%S', time.localtime(queue_done))} "
+                     f"(+{self.format_time(remaining)})")
         else:
-            self.log_message(
-                "⚠️ ไม่พบ NVENC → ใช้ CPU (libx264) - iOS Compatible")
-            vcodec = "libx264"
-
-        # Build iOS compatible command - Maximum Compatibility
-        # Special handling for different input formats
-        base_command = [
-            "ffmpeg",
-            "-fflags", "+genpts+discardcorrupt",  # Handle corrupted/problematic streams
-            "-i", input_file,
-            "-c:v", vcodec,
-        ]
-
-        # Add codec-specific settings
-        if "nvenc" in vcodec:
-            # NVENC settings - more flexible
-            video_settings = [
-                "-preset", "p4",      # NVENC preset
-                "-profile:v", "main",  # NVENC supports main better than baseline
-                "-level:v", "4.0",    # Higher level for NVENC
-                "-rc", "cbr",         # Constant bitrate for NVENC
-                "-b:v", "3M",         # Bitrate for NVENC
-                "-maxrate", "3M",
-                "-bufsize", "6M",
-            ]
+            self.forecast_label.configure(text="-")
+        for job in self.engine.jobs:
+            iid = str(job.id)
+            if self.queue_tree.exists(iid):
+                self.queue_tree.set(iid, "eta", self.eta_text(job, finishes.get(job.id)))
+
+    def eta_text(self, job, finish):
+        """Clock time a job is predicted to finish, ⚠️ if that misses its deadline"""
+        if finish is None:
+            return ""
+        text = time.strftime("%H:%M", time.localtime(finish))
+        if job.deadline is not None and finish > job.deadline:
+            text = "⚠️ " + text
+        return text
+
+    def update_job_row(self, job):
+        """Create or refresh the queue list row for a job (Tk thread only)"""
+        if self.engine.get(job.id) is None:
+            return  # Removed by "Clear Finished" before the redraw
+        status_text = {
+            PENDING: "⏳ Pending",
+            RUNNING: "🔄 Running",
+            DONE: "✅ Done",
+            FAILED: "❌ Failed",
+            CANCELLED: "🛑 Cancelled",
+        }[job.status]
+        speed_text = f"{job.speed:.1f}x" if job.status == RUNNING and job.speed > 0 else ""
+        values = (status_text, f"{job.percent:.1f}%", speed_text)
+
+        iid = str(job.id)
+        if self.queue_tree.exists(iid):
+            # The finish time column is kept, update_forecast() refreshes it
+            values += ("" if job.finished else self.queue_tree.set(iid, "eta"),)
+            self.queue_tree.item(iid, values=values)
         else:
-            # CPU libx264 settings - maximum compatibility
-            video_settings = [
-                "-preset", "medium",  # CPU preset
-                "-profile:v", "baseline",  # Maximum iOS compatibility
-                "-level", "3.1",      # Lower level for older devices
-                "-b:v", "2M",         # Lower bitrate for CPU
-                "-maxrate", "2M",
-                "-bufsize", "4M",
-            ]
-
-        # Common video settings
-        common_video = [
-            "-pix_fmt", "yuv420p",  # Required by all iOS devices
-            "-g", "60",           # GOP length
-            "-keyint_min", "30",  # Minimum keyframe interval
-            "-sc_threshold", "0",  # Disable scene change detection
-        ]
-
-        # Audio settings
-        audio_settings = [
-            "-c:a", "aac",        # iOS native audio codec
-            "-b:a", "128k",       # Conservative audio bitrate
-            "-ar", "44100",       # iOS standard sample rate
-            "-ac", "2",           # Stereo audio
-        ]
-
-        # Container and compatibility settings
-        container_settings = [
-            "-movflags", "+faststart",  # Simplified movflags for better compatibility
-            "-f", output_format,  # Use selected output format
-            "-avoid_negative_ts", "make_zero",  # Fix timestamp issues
-            "-max_muxing_queue_size", "1024",   # Handle complex streams
-            "-y",                 # Overwrite output file
-            output_file
-        ]
-
-        # Combine all settings
-        command = base_command + video_settings + \
-            common_video + audio_settings + container_settings
-
-        # Log input file info
-        self.log_message(f"📂 ไฟล์ต้นฉบับ: {input_file}")
-        self.log_message(f"📁 ไฟล์เอาต์พุต: {output_file}")
-        self.log_message(
-            f"🎬 Codec: {codec} ({vcodec}) | Format: {output_format}")
-        if "nvenc" in vcodec:
-            self.log_message("🚀 ใช้ GPU NVENC - Main Profile, Level 4.0")
-        else:
-            self.log_message("🚀 ใช้ CPU libx264 - Baseline Profile, Level 3.1")
-        self.log_message("🔧 คำสั่ง FFmpeg: " + " ".join(command))
-
-        try:
-            # Run ffmpeg with real-time output and UTF-8 encoding
-            self.current_process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                universal_newlines=True,
-                encoding='utf-8',
-                errors='replace'  # Replace invalid characters instead of crashing
-            )
-
-            # Read output in real-time
-            for line in self.current_process.stdout:
-                if line.strip():
-                    # Parse progress information
-                    self.parse_ffmpeg_progress(line.strip())
-
-                    # Log important messages and errors
-                    if any(keyword in line.lower() for keyword in
-                           ['error', 'warning', 'duration:', 'video:', 'audio:', 'stream', 'invalid', 'failed', 'not found']):
-                        self.log_message(line.strip())
-
-                # Check if process was terminated
-                if self.current_process.poll() is not None:
-                    break
-
-            self.current_process.wait()
-
-            if self.current_process.returncode == 0:
-                self.log_message("🎉 แปลงไฟล์เสร็จแล้ว: " + output_file)
-                return True
-            else:
-                self.log_message(
-                    f"❌ การแปลงไฟล์ล้มเหลว (exit code: {self.current_process.returncode})")
+            self.queue_tree.insert("", tk.END, iid=iid, text=job.name, values=values)
+
+    @property
+    def engine(self):
+        """Conversion engine, created on first use: asyncio is not needed to show the window"""
+        if self._engine is None:
+            from conversion_engine import ConversionEngine
+            self._engine = ConversionEngine(max_workers=self.workers_var.get(),
+                                            on_event=self.engine_event, journal=self.journal,
+                                            order=self.order_var.get(),
+                                            stager=self.make_stager() if self.stage_var.get() else None,
+                                            verifier=self.make_verifier())
+        return self._engine
+
+    @property
+    def journal(self):
+        """Job journal, opened on first use; None if it cannot be opened"""
+        if self._journal is None:
+            try:
+                from job_journal import JobJournal
+                self._journal = JobJournal()
+            except Exception as e:
+                self._journal = False
+                self.log_message(f"⚠️ เปิดบันทึกคิวงาน (journal) ไม่ได้: {e}")
+        return self._journal or None
+
+    def recover_jobs(self):
+        """Pick up what an earlier run left in the journal (probing runs on a thread)"""
+        journal = self.journal
+        if journal is None:
+            return
 
-                # If NVENC failed, suggest CPU fallback
-                if "nvenc" in vcodec and use_gpu:
-                    self.log_message(
-                        "💡 NVENC อาจมีปัญหา - ลองปิด GPU Acceleration")
-                    return False
+        def recover():
+            try:
+                queued, finished = journal.recover(log=self.log_message)
+            except Exception as e:
+                self.log_message(f"⚠️ กู้คืนคิวงานไม่ได้: {e}")
+                return
+            if queued or finished:
+                self.ui.post(self.restore_jobs, queued, finished)
+
+        threading.Thread(target=recover, daemon=True).start()
+
+    def restore_jobs(self, queued, finished):
+        """List the recovered finished jobs and queue the unfinished ones again (Tk thread)"""
+        self.engine.restore(finished)
+        if queued:
+            self.queue_idle_reported = False
+            self.engine.submit_many(queued)
+        for job in finished + queued:
+            self.update_job_row(job)
+        self.log_message(f"♻️ กู้คืนคิวงานจากครั้งก่อน: เข้าคิวใหม่ {len(queued)} งาน, "
+                         f"เสร็จแล้ว {len(finished)} งาน")
+        self.update_progress_display()
 
-                self.log_message("💡 คำแนะนำ:")
-                self.log_message("   - ลองปิด GPU Acceleration")
-                self.log_message("   - ลองเปลี่ยนจาก MOV เป็น MP4")
-                self.log_message("   - ตรวจสอบว่าไฟล์ต้นฉบับไม่เสียหาย")
-                self.log_message("   - ลองใช้ H.264 แทน H.265")
-                return False
+    def engine_event(self, event):
+        """Called on the engine's loop thread for every job event"""
+        from conversion_engine import EVENT_DONE, EVENT_LOG, EVENT_PROGRESS, EVENT_STATE
+        job = event.job
+        if event.kind == EVENT_PROGRESS:
+            self.update_progress_display(job)
+        elif event.kind == EVENT_LOG:
+            self.log_message(f"[#{job.id}] {event.message}")
+        elif event.kind == EVENT_STATE:
+            self.job_changed(job)
+        elif event.kind == EVENT_DONE:
+            self.report_result(job, event.report)
+
+    def report_result(self, job, report):
+        """Log how a job ended, with hints when it failed"""
+        tag = f"[#{job.id}]"
+        if job.status == CANCELLED:
+            self.log_message(f"{tag} 🛑 ยกเลิกการแปลงไฟล์แล้ว")
+        elif job.status == DONE:
+            self.log_message(f"{tag} 🎉 แปลงไฟล์เสร็จแล้ว: " + job.output_file)
+        elif report.get("verify") == "failed":
+            # ffmpeg succeeded; the problems were logged by the engine
+            self.log_message(f"{tag} ❌ ไฟล์ผลลัพธ์ไม่ผ่านการตรวจสอบ: {job.output_file}")
+            if report.get("log"):
+                self.log_message(f"{tag} 📄 log ทั้งหมดของ ffmpeg: {report['log']}")
+        elif report.get("mode") == "segmented":
+            self.log_message(f"{tag} ❌ การแปลงไฟล์แบบแบ่งส่วนล้มเหลว")
+            if report.get("log"):
+                self.log_message(f"{tag} 📄 log ทั้งหมดของ ffmpeg: {report['log']}")
+        elif report.get("exit_code") is not None:
+            self.log_message(f"{tag} ❌ การแปลงไฟล์ล้มเหลว (exit code: {report['exit_code']})")
+            if report.get("log"):
+                self.log_message(f"{tag} 📄 log ทั้งหมดของ ffmpeg: {report['log']}")
+
+            # If NVENC failed, suggest CPU fallback
+            if "nvenc" in (report.get("vcodec") or ""):
+                self.log_message(f"{tag} 💡 NVENC อาจมีปัญหา - ลองปิด GPU Acceleration")
+                return
 
-        except Exception as e:
-            self.log_message(f"❌ เกิดข้อผิดพลาด: {e}")
-            return False
+            self.log_message("💡 คำแนะนำ:")
+            self.log_message("   - ลองปิด GPU Acceleration")
+            self.log_message("   - ลองเปลี่ยนจาก MOV เป็น MP4")
+            self.log_message("   - ตรวจสอบว่าไฟล์ต้นฉบับไม่เสียหาย")
+            self.log_message("   - ลองใช้ H.264 แทน H.265")
 
     def start_conversion(self):
-        """Start conversion in a separate thread"""
+        """Validate the selected files and add them to the job queue"""
         input_file = self.input_file.get().strip()
         output_file = self.output_file.get().strip()
 
@@ -496,160 +621,232 @@ class VideoConverterGUI:
             messagebox.showerror("Error", "กรุณาระบุไฟล์ output")
             return
 
-        # Check if input file exists with proper UTF-8 handling
-        try:
-            if not os.path.exists(input_file):
-                messagebox.showerror(
-                    "Error", f"ไฟล์ input ไม่พบ: {input_file}")
+        # Check if input file exists with proper UTF-8 handling; on a network
+        # share that can take seconds, so not on the Tk thread
+        def check():
+            try:
+                exists = os.path.exists(input_file)
+            except UnicodeError as e:
+                self.ui.post(messagebox.showerror, "Error", f"ข้อผิดพลาดในการอ่านชื่อไฟล์: {e}")
                 return
-        except UnicodeError as e:
-            messagebox.showerror("Error", f"ข้อผิดพลาดในการอ่านชื่อไฟล์: {e}")
-            return
+            self.ui.post(self.input_checked, input_file, output_file, exists)
 
-        # Validate output directory exists and is writable
-        try:
-            output_dir = os.path.dirname(output_file)
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir, exist_ok=True)
-                self.log_message(f"📁 สร้างโฟลเดอร์: {output_dir}")
-        except Exception as e:
+        threading.Thread(target=check, daemon=True).start()
+
+    def input_checked(self, input_file, output_file, exists):
+        """Queue the file once its input was found (Tk thread)"""
+        if not exists:
             messagebox.showerror(
-                "Error", f"ไม่สามารถสร้างโฟลเดอร์เอาต์พุตได้: {e}")
+                "Error", f"ไฟล์ input ไม่พบ: {input_file}")
             return
+        if self.enqueue_job(input_file, output_file) and self.input_file.get().strip() == input_file:
+            # Ready for the next file
+            self.input_file.set("")
+            self.output_file.set("")
+
+    def enqueue_job(self, input_file, output_file):
+        """Create a job with the current settings and submit it to the queue"""
+        hls = self.hls_var.get()
+        ladder = None
+        if self.ladder_var.get() != LADDER_OFF:
+            ladder = renditions.parse_ladder(self.ladder_var.get())
+        elif hls:
+            ladder = list(renditions.DEFAULT_LADDER)
+        if hls:
+            # movie.mp4 -> movie/master.m3u8, next to the segments
+            output_file = renditions.hls_output_path(output_file)
 
         # Check if ffmpeg is available
-        if not shutil.which("ffmpeg"):
+        if not ffmpeg_caps.find_ffmpeg():
             messagebox.showerror(
                 "Error", "ไม่พบ ffmpeg ในระบบ\nกรุณาติดตั้ง ffmpeg ก่อน")
-            return
-
-        # Clear status text and reset progress
-        self.status_text.delete(1.0, tk.END)
-        self.total_duration = 0
-        self.current_time = 0
-        self.conversion_speed = 0
-        self.update_progress_display()
-
-        # Disable convert button, enable stop button, and start progress
-        self.convert_btn.configure(state="disabled", text="Converting...")
-        self.stop_btn.configure(state="normal")
-        self.progress.configure(mode='indeterminate')
-        self.progress.start()
-
-        # Start conversion in thread
-        self.conversion_thread = threading.Thread(
-            target=self.conversion_worker)
-        self.conversion_thread.daemon = True
-        self.conversion_thread.start()
+            return None
+
+        job = ConversionJob(
+            input_file,
+            output_file,
+            self.use_gpu_var.get(),
+            self.codec_var.get(),
+            self.format_var.get(),
+            self.smart_copy_var.get(),
+            self.get_chunk_count(),
+            moov_mode=self.moov_var.get(),
+            renditions=ladder,
+            hls=hls,
+            priority=self.get_priority(),
+            deadline=self.get_deadline()
+        )
+        self.update_job_row(job)
+        self.log_message(f"[#{job.id}] ➕ เพิ่มในคิว: {job.name}")
+        self.queue_idle_reported = False
+        return self.engine.submit(job)
 
-    def conversion_worker(self):
-        """Run conversion in separate thread"""
+    def get_chunk_count(self):
+        """Chunks per file from the spinbox (auto if the entry is not a number)"""
         try:
-            success = self.convert_video(
-                self.input_file.get(),
-                self.output_file.get(),
-                self.use_gpu_var.get(),
-                self.codec_var.get(),
-                self.format_var.get()
-            )
+            return max(CHUNKS_AUTO, self.chunks_var.get())
+        except tk.TclError:
+            return CHUNKS_AUTO
 
-            # Update UI in main thread
-            self.root.after(0, self.conversion_finished, success)
-
-        except Exception as e:
-            self.root.after(0, self.conversion_error, str(e))
-        finally:
-            # Clear process reference when done
-            self.current_process = None
-
-    def conversion_finished(self, success):
-        """Called when conversion is finished"""
-        self.progress.stop()
-        self.convert_btn.configure(state="normal", text="Convert Video")
-        self.stop_btn.configure(state="disabled")
-
-        if success:
-            # Show 100% completion
-            self.progress_percent_label.configure(text="100%")
-            self.progress.configure(mode='determinate', maximum=100, value=100)
-            messagebox.showinfo("Success", "แปลงไฟล์เสร็จแล้ว!")
+    def get_priority(self):
+        """Priority for new jobs from the spinbox (0 if the entry is not a number)"""
+        try:
+            return self.priority_var.get()
+        except tk.TclError:
+            return 0
+
+    def get_deadline(self):
+        """Next occurrence of the HH:MM in the deadline entry as time.time(), None if empty"""
+        text = self.deadline_var.get().strip()
+        if not text:
+            return None
+        try:
+            hours, minutes = (int(part) for part in text.split(":"))
+            if not (0 <= hours < 24 and 0 <= minutes < 60):
+                raise ValueError(text)
+            now = time.localtime()
+            deadline = time.mktime((now.tm_year, now.tm_mon, now.tm_mday, hours, minutes, 0,
+                                    0, 0, -1))
+        except (ValueError, OverflowError):
+            self.log_message(f"⚠️ เวลา deadline ไม่ถูกต้อง: {text} (ใช้รูปแบบ HH:MM)")
+            return None
+        # A time already past today means tomorrow
+        return deadline + 86400 if deadline <= time.time() else deadline
+
+    def update_queue_order(self):
+        """Apply the queue order from the combobox to the waiting jobs"""
+        self.engine.set_order(self.order_var.get())
+        self.log_message(f"⚙️ ลำดับคิวงาน: {self.engine.order}")
+        self.update_forecast()
+
+    def make_stager(self):
+        from staging import Stager
+        return Stager()
+
+    def update_staging(self):
+        """Turn read-ahead staging on or off for the jobs that start from now on"""
+        if self.stage_var.get():
+            if self.engine.stager is None:
+                self.engine.stager = self.make_stager()
+            self.engine.stager.enabled = True
+            self.log_message(f"📥 คัดลอกไฟล์บน network share ล่วงหน้าไปที่: {self.engine.stager.directory}")
+        elif self.engine.stager is not None:
+            self.engine.stager.enabled = False
+            self.log_message("📥 ปิดการคัดลอกไฟล์ล่วงหน้า")
+
+    def make_verifier(self):
+        from verify import Verifier
+        verifier = Verifier(samples=self.get_verify_samples())
+        verifier.enabled = self.verify_var.get()
+        return verifier
+
+    def get_verify_samples(self):
+        try:
+            return max(0, self.verify_samples_var.get())
+        except tk.TclError:
+            return 0
+
+    def update_verification(self):
+        """Apply the verification settings to the jobs that finish from now on"""
+        verifier = self.engine.verifier
+        verifier.enabled = self.verify_var.get()
+        verifier.samples = self.get_verify_samples()
+        if verifier.enabled:
+            samples = f", ถอดรหัสตัวอย่าง {verifier.samples} ช่วง" if verifier.samples else ""
+            self.log_message(f"🔍 ตรวจสอบไฟล์ผลลัพธ์หลังแปลงเสร็จ{samples}")
         else:
-            messagebox.showerror("Error", "การแปลงไฟล์ล้มเหลว")
+            self.log_message("🔍 ปิดการตรวจสอบไฟล์ผลลัพธ์")
 
-    def conversion_error(self, error_msg):
-        """Called when conversion encounters an error"""
-        self.progress.stop()
-        self.convert_btn.configure(state="normal", text="Convert Video")
-        self.stop_btn.configure(state="disabled")
-        self.log_message(f"❌ เกิดข้อผิดพลาด: {error_msg}")
-        messagebox.showerror("Error", f"เกิดข้อผิดพลาด: {error_msg}")
+    def update_worker_count(self):
+        """Apply the worker count from the spinbox to the queue"""
+        try:
+            count = self.workers_var.get()
+        except tk.TclError:
+            return
+        self.engine.set_max_workers(count)
+        self.log_message(f"⚙️ จำนวน worker: {self.engine.max_workers}")
+
+    def job_changed(self, job):
+        """Called from the engine thread when a job changes state"""
+        self.update_progress_display(job)
+        # State changes are never coalesced away, run them in order on the Tk thread
+        self.ui.post(self.update_buttons)
+        if job.finished:
+            self.ui.post(self.conversion_finished, job)
+
+    def conversion_finished(self, job):
+        """Called on the Tk thread when a job is finished"""
+
+        if job.status == FAILED and job.error:
+            self.conversion_error(job, job.error)
+
+        if not self.engine.active and not self.queue_idle_reported:
+            # Report once when the whole queue has drained
+            self.queue_idle_reported = True
+            counts = self.engine.counts()
+            if counts[FAILED]:
+                messagebox.showerror(
+                    "Error", f"การแปลงไฟล์ล้มเหลว {counts[FAILED]} ไฟล์ "
+                             f"(สำเร็จ {counts[DONE]} ไฟล์)")
+            elif counts[DONE]:
+                messagebox.showinfo(
+                    "Success", f"แปลงไฟล์เสร็จแล้ว! ({counts[DONE]} ไฟล์)")
+
+    def conversion_error(self, job, error_msg):
+        """Called when a job encounters an error"""
+        self.log_message(f"[#{job.id}] ❌ เกิดข้อผิดพลาด: {error_msg}")
+
+    def update_buttons(self):
+        """Enable cancel/stop buttons only when there is something to stop"""
+        selected = [self.engine.get(int(iid)) for iid in self.queue_tree.selection()]
+        can_cancel = any(job and not job.finished for job in selected)
+        self.cancel_btn.configure(state="normal" if can_cancel else "disabled")
+        self.stop_btn.configure(
+            state="normal" if self.engine.active else "disabled")
+
+    def cancel_selected_jobs(self):
+        """Cancel the jobs selected in the queue list, leave the rest running"""
+        for iid in self.queue_tree.selection():
+            if self.engine.cancel(int(iid)):
+                self.log_message(f"[#{iid}] 🛑 ยกเลิกงาน...")
+        self.update_buttons()
+
+    def clear_finished_jobs(self):
+        """Remove finished jobs from the queue list"""
+        for job in self.engine.jobs:
+            if job.finished and self.queue_tree.exists(str(job.id)):
+                self.queue_tree.delete(str(job.id))
+        self.engine.clear_finished()
+        self.update_progress_display()
 
     def stop_conversion(self):
-        """Stop the current conversion process"""
-        if self.current_process and self.current_process.poll() is None:
+        """Stop every queued and running conversion"""
+        if self.engine.active:
             try:
-                self.log_message("🛑 หยุดการแปลงไฟล์...")
-                self.current_process.terminate()
-                # Wait a bit for graceful termination
-                try:
-                    self.current_process.wait(timeout=3)
-                except subprocess.TimeoutExpired:
-                    # Force kill if it doesn't terminate gracefully
-                    self.current_process.kill()
-                    self.current_process.wait()
-                self.log_message("✅ หยุดการแปลงไฟล์แล้ว")
-
-                # Reset UI
-                self.progress.stop()
-                self.convert_btn.configure(
-                    state="normal", text="Convert Video")
-                self.stop_btn.configure(state="disabled")
-
+                self.log_message("🛑 หยุดการแปลงไฟล์ทั้งหมด...")
+                self.engine.cancel_all()
+                # Signal every helper this app started (probes, chunks) at once
+                threading.Thread(target=process_registry.stop_all, daemon=True).start()
             except Exception as e:
                 self.log_message(f"⚠️ ข้อผิดพลาดในการหยุดกระบวนการ: {e}")
-        else:
-            # No process running, just reset UI
-            self.progress.stop()
-            self.convert_btn.configure(state="normal", text="Convert Video")
-            self.stop_btn.configure(state="disabled")
+        self.update_buttons()
 
     def kill_all_ffmpeg_processes(self):
-        """Kill all ffmpeg processes that might be locking files"""
+        """Kill the ffmpeg/ffprobe processes started by this app (never other programs' ffmpeg)"""
         try:
-            import psutil
-            killed_count = 0
-
-            for proc in psutil.process_iter(['pid', 'name']):
-                try:
-                    if 'ffmpeg' in proc.info['name'].lower():
-                        proc.kill()
-                        killed_count += 1
-                        self.log_message(
-                            f"🔫 ฆ่ากระบวนการ ffmpeg PID: {proc.info['pid']}")
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    pass
-
+            killed_count = process_registry.kill_all()
             if killed_count > 0:
                 self.log_message(
-                    f"✅ ฆ่ากระบวนการ ffmpeg จำนวน {killed_count} กระบวนการ")
+                    f"✅ ฆ่ากระบวนการ ffmpeg ของโปรแกรมนี้จำนวน {killed_count} กระบวนการ")
             else:
                 self.log_message("ℹ️ ไม่พบกระบวนการ ffmpeg ที่ทำงานอยู่")
-
-        except ImportError:
-            # Fallback to taskkill if psutil not available
-            try:
-                subprocess.run(["taskkill", "/f", "/im", "ffmpeg.exe"],
-                               capture_output=True, check=False)
-                self.log_message("🔫 ใช้ taskkill ฆ่ากระบวนการ ffmpeg")
-            except Exception as e:
-                self.log_message(f"⚠️ ไม่สามารถฆ่ากระบวนการ ffmpeg ได้: {e}")
         except Exception as e:
             self.log_message(f"⚠️ ข้อผิดพลาดในการฆ่ากระบวนการ: {e}")
 
     def release_all_locks(self):
         """Release all file locks and handles"""
         try:
-            # First kill any remaining ffmpeg processes
+            # First kill any remaining ffmpeg processes (they are reaped, so their handles are closed)
             self.kill_all_ffmpeg_processes()
 
             # Clear file selections
@@ -664,35 +861,65 @@ class VideoConverterGUI:
             if hasattr(self, '_file_cache'):
                 delattr(self, '_file_cache')
 
-            # Wait a moment for system to release locks
-            import time
-            time.sleep(0.5)
-
             self.log_message("🔓 ปล่อยการล็อกไฟล์ทั้งหมด")
         except Exception as e:
             self.log_message(f"⚠️ ข้อผิดพลาดในการปล่อยล็อก: {e}")
 
     def on_closing(self):
         """Handle window closing event"""
-        if self.current_process and self.current_process.poll() is None:
+        if self.engine.active:
             # Ask user if they want to stop the conversion
             result = messagebox.askyesno(
                 "Conversion in Progress",
-                "การแปลงไฟล์กำลังดำเนินการอยู่\nคุณต้องการหยุดและปิดโปรแกรมหรือไม่?"
+                "การแปลงไฟล์กำลังดำเนินการอยู่\nคุณต้องการหยุดและปิดโปรแกรมหรือไม่?\n"
+                "(งานที่ยังไม่เสร็จจะเข้าคิวใหม่เมื่อเปิดโปรแกรมครั้งหน้า)"
             )
             if result:
-                self.stop_conversion()
+                # Leave the unfinished jobs pending/running in the journal: the next start requeues them
+                self.engine.journal = None
+                self.engine.cancel_all()
+                process_registry.stop_all()
                 self.release_all_locks()
+                self.engine.stop()
+                self.ui.stop()
                 self.root.destroy()
         else:
             # Always release locks when closing
             self.release_all_locks()
+            self.engine.stop()
+            self.ui.stop()
             self.root.destroy()
 
 
+def report_startup(root):
+    """Record when the first window is drawn (only when run by bench_startup.py)"""
+    path = os.environ.get(STARTUP_REPORT_ENV)
+    if not path:
+        return
+
+    def write():
+        root.update_idletasks()
+        with open(path, "a", encoding='utf-8') as f:
+            f.write(f"first_window {time.time()}\n")
+
+    root.after_idle(write)
+
+
 def main():
     root = tk.Tk()
     app = VideoConverterGUI(root)
+    report_startup(root)
+    # After the first window is drawn: the journal is not needed to show it
+    root.after_idle(app.recover_jobs)
+
+    # Files passed on the command line ("Open with", drag onto the exe) are queued right away
+    def enqueue_arguments():
+        for filename in sys.argv[1:]:
+            path = os.path.normpath(filename)
+            app.enqueue_job(path, app.suggest_output_path(path))
+
+    if len(sys.argv) > 1:
+        root.after_idle(enqueue_arguments)
     root.mainloop()
 
 
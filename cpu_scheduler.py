@@ -0,0 +1,204 @@
+"""
+Core-aware placement of concurrent CPU encodes
+
+With its default thread count every libx264 starts about 1.5 threads per
+core, so N concurrent jobs oversubscribe the machine N times over and lose
+throughput to context switches and cache thrashing. CoreScheduler splits
+the usable cores into one block per running CPU encode: the job gets a
+matching `-threads` / `-x264-params threads=` and its ffmpeg is pinned to
+its block. Blocks follow the CPU topology, so hyper-threads of one
+physical core stay in the same block.
+
+When a job starts or finishes the blocks are recomputed and every running
+ffmpeg is pinned again. A segmented encode is one job: its chunks share
+its block and its threads, and each chunk is pinned as it starts. A
+running ffmpeg keeps the thread count it was started with; only its
+affinity follows the load.
+
+Optionally each ffmpeg also gets a nice value and the lowest best-effort
+I/O priority, so conversions yield to interactive work.
+
+psutil is used when installed (imported lazily); otherwise affinity and
+nice fall back to os.sched_setaffinity / os.setpriority where the OS has
+them, and ionice is skipped.
+"""
+import os
+import threading
+
+from metrics import process_ids
+
+
+def usable_cores():
+    """CPU numbers this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _read_topology(cpu, name):
+    try:
+        with open(f"/sys/devices/system/cpu/cpu{cpu}/topology/{name}", encoding='ascii') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return -1
+
+
+def topology_order(cores):
+    """Cores sorted by package and physical core, so SMT siblings are next to each other"""
+    return sorted(cores, key=lambda cpu: (_read_topology(cpu, "physical_package_id"),
+                                          _read_topology(cpu, "core_id"), cpu))
+
+
+def split_cores(cores, count):
+    """`count` contiguous, nearly equal blocks; blocks share single cores if count > cores"""
+    if count <= 0:
+        return []
+    if count >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(count)]
+    size, extra = divmod(len(cores), count)
+    blocks, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        blocks.append(cores[start:end])
+        start = end
+    return blocks
+
+
+def format_cores(cores):
+    """[0, 1, 2, 5] -> "0-2,5" """
+    ranges = []
+    for cpu in sorted(cores):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def set_affinity(pid, cores):
+    """Pin a process to `cores`; False if the OS or the process did not allow it"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            psutil.Process(pid).cpu_affinity(list(cores))
+            return True
+        except Exception:
+            return False  # exited, not permitted, or no affinity support (macOS)
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(pid, cores)
+            return True
+        except OSError:
+            pass
+    return False
+
+
+def lower_priority(pid, nice):
+    """nice value (below-normal class on Windows) and the lowest best-effort I/O priority"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            if os.name == "nt":
+                process.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            else:
+                process.nice(nice)
+            if hasattr(process, "ionice"):
+                if os.name == "nt":
+                    process.ionice(psutil.IOPRIO_LOW)
+                else:
+                    process.ionice(psutil.IOPRIO_CLASS_BE, 7)
+        except Exception:
+            pass
+        return
+    if hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, nice)
+        except OSError:
+            pass
+
+
+class CoreScheduler:
+    """
+    Splits the cores between running CPU encodes.
+
+    `partition=False` leaves thread counts and affinity to ffmpeg (the
+    naive behaviour, kept for benchmarks). `nice` is applied to every
+    ffmpeg passed to apply_priority(), CPU or GPU encode.
+    """
+
+    def __init__(self, cores=None, partition=True, nice=None):
+        self.cores = topology_order(cores if cores is not None else usable_cores())
+        self.partition = partition
+        self.nice = nice
+        self.assignments = {}   # job id -> cores of its block
+        self._jobs = []         # running CPU encodes, in start order
+        self._lock = threading.Lock()
+
+    def reserve(self, job, expected=1):
+        """
+        Register a CPU encode that is about to start and return its thread
+        count (0 = ffmpeg default). `expected` is how many CPU encodes are
+        likely to run together, so the first of a batch does not take
+        every core.
+        """
+        with self._lock:
+            if job not in self._jobs:
+                self._jobs.append(job)
+            if not self.partition:
+                return 0
+            count = max(len(self._jobs), expected)
+            return max(1, len(self.cores) // count)
+
+    def share(self, expected=1):
+        """Threads a CPU encode starting now would get, without registering it"""
+        with self._lock:
+            if not self.partition:
+                return len(self.cores)
+            return max(1, len(self.cores) // max(len(self._jobs) + 1, expected))
+
+    def release(self, job):
+        """The job finished: give its cores to the others"""
+        with self._lock:
+            if job not in self._jobs:
+                return
+            self._jobs.remove(job)
+            self.assignments.pop(job.id, None)
+        self.rebalance()
+
+    def rebalance(self):
+        """Recompute the blocks and pin every running ffmpeg to its block"""
+        if not self.partition:
+            return
+        with self._lock:
+            jobs = list(self._jobs)
+            blocks = split_cores(self.cores, len(jobs))
+            for job, cores in zip(jobs, blocks):
+                self.assignments[job.id] = cores
+        for job, cores in zip(jobs, blocks):
+            for pid in process_ids(job.process):
+                set_affinity(pid, cores)
+
+    def place(self, job, pid):
+        """
+        Pin a process the job started after rebalance() (a chunk of a
+        segmented encode) to the job's block, with the job's priority
+        """
+        with self._lock:
+            cores = self.assignments.get(job.id) if self.partition else None
+        if cores:
+            set_affinity(pid, cores)
+        if self.nice is not None:
+            lower_priority(pid, self.nice)
+
+    def apply_priority(self, job):
+        """Lower the priority of the job's ffmpeg processes if `nice` is set"""
+        if self.nice is not None:
+            for pid in process_ids(job.process):
+                lower_priority(pid, self.nice)
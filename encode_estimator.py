@@ -0,0 +1,163 @@
+"""
+Encode time prediction for queue ordering and the completion forecast
+
+A queued job is probed before it runs and its work is counted in a unit
+an encoder gets through at a steady rate:
+
+- video encodes: output pixels (width x height x frames, summed over the
+  renditions of a ladder),
+- stream copies (remux, audio-only, audio copy): input bytes.
+
+The rate (work per second of encode time) is learned per encoder, preset
+and mode from the jobs finished on this machine. The metrics log
+(job_metrics.jsonl) is read on first use and each finished job updates
+the rates, weighted towards the latest jobs. Without any history the
+calibration profile's pixel rate is used, and without one a default.
+
+Safe to use from several threads.
+"""
+import json
+import os
+import threading
+
+import calibration
+import ios_profile
+import metrics
+import renditions
+
+
+COPY = "copy"
+HISTORY_BYTES = 1 << 20  # tail of the metrics log read on first use
+SMOOTHING = 0.3          # weight of the latest job in a learned rate
+MIN_ENCODE_TIME = 0.5    # shorter encodes measure startup, not throughput
+MIN_PREDICTION = 1.0     # probe, spawn and moov rewrite of even the smallest job
+
+# Work per second when nothing was measured: pixels/s (1080p frames per
+# second), bytes/s for stream copies
+DEFAULT_RATES = {
+    "libx264": 1920 * 1080 * 40,
+    "h264_nvenc": 1920 * 1080 * 300,
+    "hevc_nvenc": 1920 * 1080 * 200,
+    COPY: 100e6,
+}
+DEFAULT_RATE = 1920 * 1080 * 20
+
+
+def frame_pixels(plan, names=None):
+    """Output pixels per frame of a job, summed over its renditions; 0 if the size is unknown"""
+    if plan is None or not plan.width or not plan.height:
+        return 0
+    if not names:
+        return plan.width * plan.height
+    total = 0
+    for name in renditions.pick_renditions(names, plan.height):
+        width, height = renditions.rendition_size(name, plan)
+        total += (width or height * 16 // 9) * height
+    return total
+
+
+def job_work(vcodec, pixels, frame_rate, duration, input_bytes):
+    """Work of one encode, in pixels or (for stream copies) input bytes"""
+    if vcodec == COPY:
+        return float(input_bytes or 0)
+    return float(pixels) * (frame_rate or ios_profile.DEFAULT_FRAME_RATE) * (duration or 0)
+
+
+def rate_keys(vcodec, preset, mode):
+    """Keys a rate is learned under, most specific first"""
+    return [(vcodec, preset or "", mode), (vcodec, preset or ""), (vcodec,)]
+
+
+def default_preset(vcodec):
+    """Preset the iOS settings use when none is picked"""
+    settings = ios_profile.video_settings(vcodec)
+    return settings[settings.index("-preset") + 1] if "-preset" in settings else None
+
+
+def remaining_time(job):
+    """Seconds a running job still needs: from its speed, else from its estimate"""
+    if job.speed > 0 and job.total_duration > 0:
+        return max(0.0, job.total_duration - job.current_time) / job.speed
+    if job.estimate:
+        return job.estimate * (1 - job.percent / 100)
+    return 0.0
+
+
+class EncodeEstimator:
+    """Learned encode rates of this machine"""
+
+    def __init__(self, history_path=None, profile=None):
+        self.history_path = history_path
+        self._profile = profile
+        self._rates = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Fold the tail of the metrics log into the rates (lock held)"""
+        self._loaded = True
+        path = self.history_path or metrics.metrics_log_path()
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                start = max(0, f.tell() - HISTORY_BYTES)
+                f.seek(start)
+                lines = f.read().splitlines()
+        except OSError:
+            start, lines = 0, []
+        if self._profile is None:
+            self._profile = calibration.load_profile() or {}
+        # Started mid-file: the first line is cut
+        for line in lines[1:] if start else lines:
+            try:
+                self._observe(json.loads(line))
+            except (ValueError, TypeError, KeyError, ZeroDivisionError):
+                continue  # from an older version
+
+    def _observe(self, record):
+        if record.get("status") != "done" or record.get("encode_time", 0) < MIN_ENCODE_TIME:
+            return
+        vcodec = record.get("encoder")
+        work = job_work(vcodec, record.get("frame_pixels", 0), record.get("frame_rate", 0),
+                        record.get("media_duration", 0), record.get("input_bytes", 0))
+        if not vcodec or work <= 0:
+            return
+        rate = work / record["encode_time"]
+        for key in rate_keys(vcodec, record.get("preset"), record.get("mode")):
+            old = self._rates.get(key)
+            self._rates[key] = rate if old is None else old + SMOOTHING * (rate - old)
+
+    def observe(self, record):
+        """Learn from a finished job's metrics record (metrics.JobMetrics.finish())"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._observe(record)
+
+    def rate(self, vcodec, preset=None, mode=None, chunks=1):
+        """Work per second expected from `vcodec` in `mode`"""
+        keys = rate_keys(vcodec, preset, mode)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if keys[0] in self._rates:
+                return self._rates[keys[0]]
+            rate = next((self._rates[key] for key in keys[1:] if key in self._rates), None)
+            profile = self._profile
+        if rate is None and vcodec != COPY:
+            preset = preset or default_preset(vcodec)
+            measured = [result["pixel_rate"] for result in profile.get("results", [])
+                        if result["encoder"] == vcodec and result["preset"] == preset]
+            rate = min(measured) if measured else None
+        rate = rate or DEFAULT_RATES.get(vcodec, DEFAULT_RATE)
+        # Not measured chunked: the chunks run side by side
+        return rate * max(1, chunks) if mode == "segmented" else rate
+
+    def predict(self, job, plan, vcodec, mode=None, input_bytes=0):
+        """Predicted encode seconds of a job, None if its size is unknown"""
+        work = job_work(vcodec, frame_pixels(plan, job.renditions),
+                        plan.frame_rate if plan is not None else 0,
+                        plan.duration if plan is not None else job.total_duration, input_bytes)
+        if work <= 0:
+            return None
+        return max(MIN_PREDICTION, work / self.rate(vcodec, job.preset, mode, job.pieces or job.chunks))
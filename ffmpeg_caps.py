@@ -0,0 +1,172 @@
+"""
+ffmpeg capability probe with a persistent on-disk cache
+
+Running `ffmpeg -encoders` before every conversion costs a process spawn per
+job. The probe records encoders, decoders, hwaccels and filters once per
+ffmpeg binary and caches the result, keyed on the binary's path, size and
+mtime so a new ffmpeg build is picked up automatically. A probe that fails
+(a broken binary, an exe locked by a virus scanner) is never cached: the
+next call probes again.
+"""
+import json
+import os
+import shutil
+import threading
+
+import process_registry
+from app_paths import app_data_dir
+
+
+CACHE_FILE = "ffmpeg_capabilities.json"
+CACHE_VERSION = 2  # 1 could hold the empty lists of a failed probe
+# ffmpeg to run instead of the one in PATH (a specific build, or a stub in tests)
+FFMPEG_ENV = "CONVERT2IOS_FFMPEG"
+
+_lock = threading.Lock()
+_memory_cache = {}
+
+
+class CapabilityError(Exception):
+    """ffmpeg could not list its capabilities"""
+
+
+def ffmpeg_binary():
+    """ffmpeg command name or path used in every command line"""
+    return os.environ.get(FFMPEG_ENV) or "ffmpeg"
+
+
+def find_ffmpeg():
+    """Full path of the ffmpeg binary ($CONVERT2IOS_FFMPEG or PATH), or None"""
+    return shutil.which(ffmpeg_binary())
+
+
+def binary_key(ffmpeg_path):
+    """Identity of an ffmpeg binary: resolved path, size and mtime"""
+    real_path = os.path.realpath(ffmpeg_path)
+    stat = os.stat(real_path)
+    return {"path": real_path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _run(ffmpeg_path, option):
+    try:
+        result = process_registry.run(
+            [ffmpeg_path, "-hide_banner", option],
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            errors='replace'
+        )
+    except OSError as e:
+        raise CapabilityError(f"ffmpeg {option}: {e}")
+    if result.returncode != 0 or not result.stdout.strip():
+        raise CapabilityError(f"ffmpeg {option} exit code {result.returncode}: "
+                              f"{result.stderr.strip()[-200:]}")
+    return result.stdout
+
+
+def _parse_codec_list(output):
+    """Names from `-encoders`/`-decoders` output (after the ------ line)"""
+    names = []
+    started = False
+    for line in output.splitlines():
+        if not started:
+            started = line.strip().startswith("------")
+            continue
+        parts = line.split()
+        if len(parts) >= 2:
+            names.append(parts[1])
+    return names
+
+
+def _parse_hwaccels(output):
+    return [line.strip() for line in output.splitlines()[1:] if line.strip()]
+
+
+def _parse_filters(output):
+    """Names from `-filters` output, lines look like ` TSC name  A->A  desc`"""
+    names = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and "->" in parts[2]:
+            names.append(parts[1])
+    return names
+
+
+def probe(ffmpeg_path):
+    """Run ffmpeg and collect its capabilities (uncached); CapabilityError if ffmpeg fails"""
+    return {
+        "encoders": _parse_codec_list(_run(ffmpeg_path, "-encoders")),
+        "decoders": _parse_codec_list(_run(ffmpeg_path, "-decoders")),
+        "hwaccels": _parse_hwaccels(_run(ffmpeg_path, "-hwaccels")),
+        "filters": _parse_filters(_run(ffmpeg_path, "-filters")),
+    }
+
+
+def _cache_path():
+    return app_data_dir() / CACHE_FILE
+
+
+def _load_disk_cache():
+    try:
+        with open(_cache_path(), encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") == CACHE_VERSION:
+            return data
+    except (OSError, ValueError):
+        pass
+    return {"version": CACHE_VERSION, "binaries": {}}
+
+
+def _save_disk_cache(data):
+    """Write the cache atomically so parallel processes never see half a file"""
+    path = _cache_path()
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def get_capabilities(ffmpeg_path=None, refresh=False):
+    """
+    Capabilities of `ffmpeg_path` (default: ffmpeg in PATH).
+
+    Served from memory, then from the disk cache, and only probed when the
+    binary is new or has changed. Returns None if ffmpeg cannot be found or
+    the probe failed (not cached, retried on the next call).
+    """
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    if not ffmpeg_path:
+        return None
+
+    key = binary_key(ffmpeg_path)
+    with _lock:
+        cached = _memory_cache.get(key["path"])
+        if cached and cached["key"] == key and not refresh:
+            return cached
+
+        disk = _load_disk_cache()
+        cached = disk["binaries"].get(key["path"])
+        if not cached or cached["key"] != key or refresh:
+            try:
+                cached = dict(probe(ffmpeg_path), key=key)
+            except CapabilityError:
+                return None
+            disk["binaries"][key["path"]] = cached
+            try:
+                _save_disk_cache(disk)
+            except OSError:
+                pass  # Cache is an optimisation only
+
+        _memory_cache[key["path"]] = cached
+        return cached
+
+
+def has_encoder(name, ffmpeg_path=None):
+    caps = get_capabilities(ffmpeg_path)
+    return bool(caps) and name in caps["encoders"]
+
+
+def has_nvenc(ffmpeg_path=None):
+    """True if ffmpeg was built with NVENC (H.264 or HEVC)"""
+    caps = get_capabilities(ffmpeg_path)
+    return bool(caps) and ("h264_nvenc" in caps["encoders"] or "hevc_nvenc" in caps["encoders"])
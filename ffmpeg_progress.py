@@ -0,0 +1,172 @@
+"""
+Incremental parser for ffmpeg's machine-readable `-progress` output
+
+With `-progress pipe:1 -nostats` ffmpeg writes blocks of key=value lines
+to stdout, each ending with `progress=continue` (or `progress=end`),
+instead of the human-readable `frame= ... speed=` stats line on stderr.
+The parser works on raw chunks read from the pipe rather than line by
+line: only the newest complete block of a chunk is located (str.rfind)
+and its fields are sliced out lazily, only when they are read. Blocks
+that are already stale when the chunk arrives are never parsed, so the
+cost per ffmpeg update drops as the encode gets faster.
+"""
+
+# Global options that switch ffmpeg to structured progress output
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+# Read size for the progress pipe; one read usually holds many blocks
+CHUNK_SIZE = 65536
+
+_BLOCK_END = "\nprogress="
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _to_float(value):
+    try:
+        return float(value.rstrip("x"))
+    except (AttributeError, ValueError):
+        return 0.0
+
+
+class ProgressEvent:
+    """
+    One completed `-progress` block.
+
+    Fields are sliced out of the block text on first access, so events
+    that are only partly used (or skipped) cost almost nothing.
+    """
+    __slots__ = ("_block",)
+
+    def __init__(self, block):
+        # Block text starting with a newline, without the final newline
+        self._block = block
+
+    def get(self, key):
+        """Raw string value of `key`, or None"""
+        block = self._block
+        marker = f"\n{key}="
+        pos = block.find(marker)
+        if pos < 0:
+            return None
+        pos += len(marker)
+        end = block.find("\n", pos)
+        return (block[pos:end] if end >= 0 else block[pos:]).strip()
+
+    @property
+    def frame(self):
+        return _to_int(self.get("frame"))
+
+    @property
+    def fps(self):
+        return _to_float(self.get("fps"))
+
+    @property
+    def out_time_us(self):
+        # out_time_ms is also in microseconds (historic ffmpeg naming)
+        return max(0, _to_int(self.get("out_time_us") or self.get("out_time_ms")))
+
+    @property
+    def out_time(self):
+        """Output position in seconds"""
+        return self.out_time_us / 1000000
+
+    @property
+    def speed(self):
+        """Encode speed as a realtime multiple (`1.5x` -> 1.5)"""
+        return _to_float(self.get("speed"))
+
+    @property
+    def total_size(self):
+        """Bytes written to the output so far"""
+        return _to_int(self.get("total_size"))
+
+    @property
+    def finished(self):
+        """True for the last block (`progress=end`)"""
+        return self.get("progress") == "end"
+
+    def __repr__(self):
+        return (f"ProgressEvent(frame={self.frame}, fps={self.fps}, out_time_us={self.out_time_us}, "
+                f"speed={self.speed}, total_size={self.total_size}, finished={self.finished})")
+
+
+class ProgressParser:
+    """
+    Feed raw text from the `-progress` pipe in chunks of any size.
+
+    `feed(data)` returns a ProgressEvent for the newest block completed by
+    this chunk, or None if no block was completed.
+    """
+
+    def __init__(self):
+        # Always keep a leading newline so every key can be found as "\nkey="
+        self._buffer = "\n"
+
+    def feed(self, data):
+        buffer = self._buffer + data
+        end = buffer.rfind(_BLOCK_END)
+        eol = buffer.find("\n", end + 1) if end >= 0 else -1
+        if end >= 0 and eol < 0:
+            # Newest block is still incomplete, use the one before it
+            end = buffer.rfind(_BLOCK_END, 0, end)
+            eol = buffer.find("\n", end + 1) if end >= 0 else -1
+        if eol < 0:
+            self._buffer = buffer
+            return None
+
+        # The block starts right after the previous block's progress line
+        previous = buffer.rfind(_BLOCK_END, 0, end)
+        start = buffer.find("\n", previous + 1) if previous >= 0 else 0
+        event = ProgressEvent(buffer[start:eol])
+        self._buffer = buffer[eol:]
+        return event
+
+
+def read_progress(stream, on_event):
+    """
+    Read a binary `-progress` pipe until EOF.
+
+    Only the latest event of each chunk is delivered: earlier ones are
+    already stale by the time the chunk arrives.
+    """
+    parser = ProgressParser()
+    read = getattr(stream, "read1", stream.read)
+    while True:
+        chunk = read(CHUNK_SIZE)
+        if not chunk:
+            break
+        event = parser.feed(chunk.decode("ascii", "replace"))
+        if event is not None:
+            on_event(event)
+
+
+async def read_progress_async(stream, on_event):
+    """read_progress() for an asyncio StreamReader"""
+    parser = ProgressParser()
+    while True:
+        chunk = await stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        event = parser.feed(chunk.decode("ascii", "replace"))
+        if event is not None:
+            on_event(event)
+
+
+def parse_duration_line(line):
+    """Seconds from a stripped `Duration: HH:MM:SS.ss, start: ...` line, else None"""
+    if not line.startswith("Duration:"):
+        return None
+    value = line[9:].split(",", 1)[0].strip()
+    parts = value.split(":")
+    if len(parts) != 3:
+        return None
+    try:
+        return float(parts[0]) * 3600 + float(parts[1]) * 60 + float(parts[2])
+    except ValueError:
+        return None
@@ -0,0 +1,343 @@
+"""
+Watch folders for new recordings and report each one once it is complete
+
+`convert.py watch` converts the videos dropped into a folder. A file that
+appears is not ready at once: a recorder or a copy is still writing it.
+FolderWatcher calls `on_ready(path, relative_path)` when it is complete:
+
+- with inotify (Linux, local folders), a file is complete CLOSE_DEBOUNCE
+  seconds after its writer closed it (IN_CLOSE_WRITE) or after it was
+  renamed into the folder (IN_MOVED_TO), unless it was written again;
+  files found without having seen them written (already there at start,
+  missed events) are complete once their size and mtime stayed the same
+  for `settle` seconds. Nothing runs while no file is being written.
+- otherwise (Windows, macOS, network shares, whose remote writes inotify
+  does not see, or when inotify cannot be set up), the folders are listed
+  every `poll_interval` seconds and a file is complete once its size and
+  mtime stayed the same for `settle` seconds.
+
+Subfolders are watched too. Hidden files and folders (names starting with
+a dot: partial copies, the engine's work folders) and the `exclude`
+folders (the output folder, when it is inside a watched one) are ignored.
+A file is reported again only if it changed after it was reported.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import time
+
+from staging import is_remote
+
+
+CLOSE_DEBOUNCE = 0.2   # seconds after close-write without new writes
+SETTLE_SECONDS = 1.0   # unchanged size/mtime for files not seen closed
+POLL_INTERVAL = 0.5    # folder listing interval without inotify
+CHECK_INTERVAL = 0.1   # readiness checks while files are pending
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+READ_SIZE = 64 * 1024
+
+
+class Inotify:
+    """Minimal non-blocking inotify instance through libc (Linux only)"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_events(self):
+        """[(wd, mask, name)] of the events queued so far"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def inotify_available(directories):
+    """True if inotify can see the writes to every directory"""
+    return sys.platform.startswith("linux") and not any(is_remote(path) for path in directories)
+
+
+class Pending:
+    """A file that is being written or waits to settle"""
+
+    def __init__(self, base, size, mtime, closed=False, writing=False):
+        self.base = base
+        self.size = size
+        self.mtime = mtime
+        self.since = time.monotonic()  # last change seen
+        self.closed = closed           # writer closed it (or it was renamed in)
+        self.writing = writing         # written since, no close seen yet
+
+
+class FolderWatcher:
+    """
+    Reports complete video files in `directories` (recursively) to
+    `on_ready(path, relative_path)` on the running event loop.
+    """
+
+    def __init__(self, directories, on_ready, extensions, exclude=(), settle=SETTLE_SECONDS,
+                 poll_interval=POLL_INTERVAL, use_inotify=True, log=print):
+        self.directories = [os.path.abspath(path) for path in directories]
+        self.on_ready = on_ready
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.exclude = [os.path.abspath(path) for path in exclude]
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.log = log
+        self.mode = None
+        self._inotify = None
+        self._watches = {}    # wd -> (directory, base directory)
+        self._pending = {}    # path -> Pending
+        self._reported = {}   # path -> (size, mtime) when it was reported
+        self._timer = None
+        self._loop = None
+        self._stopped = None
+
+    # Life cycle
+
+    async def run(self):
+        """Watch until close() is called"""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = self._loop.create_future()
+        if self.use_inotify and inotify_available(self.directories):
+            self.mode = "inotify"
+            try:
+                self._inotify = Inotify()
+                for base in self.directories:
+                    self._watch_tree(base, base)
+                self._loop.add_reader(self._inotify.fd, self._on_inotify)
+            except (OSError, AttributeError) as e:
+                # No inotify in libc, too many watches (fs.inotify.max_user_watches)...
+                self.log(f"⚠️ ใช้ inotify ไม่ได้ ({e}) → ตรวจโฟลเดอร์แบบ polling")
+                self._close_inotify()
+                self._pending.clear()
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self.mode = None
+        if self.mode is None:
+            self.mode = "polling"
+            poller = self._loop.create_task(self._poll())
+            self._stopped.add_done_callback(lambda _: poller.cancel())
+        self.log(f"👀 ตรวจหาไฟล์ใหม่ด้วย {self.mode}")
+        try:
+            await self._stopped
+        finally:
+            self._close_inotify()
+            if self._timer is not None:
+                self._timer.cancel()
+
+    def close(self):
+        if self._stopped is not None and not self._stopped.done():
+            self._stopped.set_result(None)
+
+    def _close_inotify(self):
+        if self._inotify is not None:
+            if self._inotify.fd >= 0:
+                self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+            self._watches.clear()
+
+    # Files
+
+    def _wanted(self, path):
+        name = os.path.basename(path)
+        return not name.startswith(".") and name.lower().endswith(self.extensions)
+
+    def _excluded(self, directory):
+        return any(directory == path or directory.startswith(path + os.sep) for path in self.exclude)
+
+    def _list(self, directory):
+        """Wanted files under `directory`, skipping hidden and excluded folders (blocking)"""
+        found = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(name for name in dirs if not name.startswith(".")
+                             and not self._excluded(os.path.join(root, name)))
+            found += [os.path.join(root, name) for name in sorted(files)
+                      if self._wanted(name)]
+        return found
+
+    def _seen(self, path, base, closed=False, writing=False):
+        """A wanted file was found or written: (re)start waiting for it to be complete"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._pending.pop(path, None)
+            return
+        if self._reported.get(path) == (stat.st_size, stat.st_mtime_ns) and not writing:
+            return  # Nothing new since it was reported
+        pending = self._pending.get(path)
+        if pending is None:
+            self._pending[path] = Pending(base, stat.st_size, stat.st_mtime_ns, closed, writing)
+        else:
+            pending.size, pending.mtime = stat.st_size, stat.st_mtime_ns
+            pending.since = time.monotonic()
+            pending.closed = closed
+            pending.writing = writing
+        self._schedule_check()
+
+    def _forget(self, path):
+        self._pending.pop(path, None)
+        self._reported.pop(path, None)
+
+    def _schedule_check(self):
+        if self._timer is None and self._pending and self.mode == "inotify":
+            self._timer = self._loop.call_later(CHECK_INTERVAL, self._check)
+
+    def _check(self):
+        """Report the pending files that are complete (inotify mode)"""
+        self._timer = None
+        now = time.monotonic()
+        for path, pending in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (pending.size, pending.mtime):
+                # Written without an event we saw yet: wait for its close or to settle
+                pending.size, pending.mtime = stat.st_size, stat.st_mtime_ns
+                pending.since = now
+                continue
+            quiet = now - pending.since
+            if (pending.closed and quiet >= CLOSE_DEBOUNCE) or (
+                    not pending.writing and quiet >= self.settle):
+                self._report(path, pending)
+        self._schedule_check()
+
+    def _report(self, path, pending):
+        del self._pending[path]
+        if pending.size == 0:
+            return  # Created but never written
+        self._reported[path] = (pending.size, pending.mtime)
+        self.on_ready(path, os.path.relpath(path, pending.base))
+
+    # inotify
+
+    def _watch_tree(self, directory, base):
+        """Watch a folder and its subfolders; files already in them wait to settle"""
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(name for name in dirs if not name.startswith(".")
+                             and not self._excluded(os.path.join(root, name)))
+            self._watches[self._inotify.add_watch(root)] = (root, base)
+            for name in files:
+                if self._wanted(name):
+                    self._seen(os.path.join(root, name), base)
+
+    def _on_inotify(self):
+        try:
+            events = self._inotify.read_events()
+        except OSError as e:
+            self.log(f"⚠️ อ่าน inotify ไม่ได้: {e}")
+            return
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: look at everything again
+                for base in self.directories:
+                    for path in self._list(base):
+                        self._seen(path, base)
+                continue
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            directory, base = watch
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self._watches.pop(wd, None)
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith(".") \
+                        and not self._excluded(path):
+                    try:
+                        self._watch_tree(path, base)
+                    except OSError as e:
+                        self.log(f"⚠️ ติดตามโฟลเดอร์ {path} ไม่ได้: {e}")
+                continue
+            if not self._wanted(name):
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._forget(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._seen(path, base, closed=True)
+            elif mask & (IN_CREATE | IN_MODIFY):
+                self._seen(path, base, writing=True)
+
+    # Polling
+
+    def _scan(self):
+        """{path: (size, mtime, base)} of every wanted file (blocking)"""
+        found = {}
+        for base in self.directories:
+            for path in self._list(base):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (stat.st_size, stat.st_mtime_ns, base)
+        return found
+
+    async def _poll(self):
+        while True:
+            # Listing a share can block: not on the loop thread
+            found = await self._loop.run_in_executor(None, self._scan)
+            now = time.monotonic()
+            for path in list(self._pending):
+                if path not in found:
+                    del self._pending[path]
+            for path in list(self._reported):
+                if path not in found:
+                    del self._reported[path]
+            for path, (size, mtime, base) in found.items():
+                if self._reported.get(path) == (size, mtime):
+                    continue
+                pending = self._pending.get(path)
+                if pending is None or (pending.size, pending.mtime) != (size, mtime):
+                    self._pending[path] = Pending(base, size, mtime)
+                elif now - pending.since >= self.settle:
+                    self._report(path, pending)
+            await asyncio.sleep(self.poll_interval)
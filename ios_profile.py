@@ -0,0 +1,176 @@
+"""
+iOS compatible ffmpeg settings and command builder
+
+Single place for the encoder settings used by every front-end, and for the
+limits a source stream must meet to be stream-copied instead of re-encoded.
+"""
+from ffmpeg_caps import ffmpeg_binary
+from ffmpeg_progress import PROGRESS_ARGS
+
+
+# NVENC settings - more flexible
+NVENC_VIDEO_SETTINGS = [
+    "-preset", "p4",      # NVENC preset
+    "-profile:v", "main",  # NVENC supports main better than baseline
+    "-level:v", "4.0",    # Higher level for NVENC
+    "-rc", "cbr",         # Constant bitrate for NVENC
+    "-b:v", "3M",         # Bitrate for NVENC
+    "-maxrate", "3M",
+    "-bufsize", "6M",
+]
+
+# CPU libx264 settings - maximum compatibility
+X264_VIDEO_SETTINGS = [
+    "-preset", "medium",  # CPU preset
+    "-profile:v", "baseline",  # Maximum iOS compatibility
+    "-level", "3.1",      # Lower level for older devices
+    "-b:v", "2M",         # Lower bitrate for CPU
+    "-maxrate", "2M",
+    "-bufsize", "4M",
+]
+
+# Common video settings
+COMMON_VIDEO_SETTINGS = [
+    "-pix_fmt", "yuv420p",  # Required by all iOS devices
+    "-g", "60",           # GOP length
+    "-keyint_min", "30",  # Minimum keyframe interval
+    "-sc_threshold", "0",  # Disable scene change detection
+]
+
+# Audio settings
+AUDIO_SETTINGS = [
+    "-c:a", "aac",        # iOS native audio codec
+    "-b:a", "128k",       # Conservative audio bitrate
+    "-ar", "44100",       # iOS standard sample rate
+    "-ac", "2",           # Stereo audio
+]
+
+# Source streams inside these limits are copied as-is (no re-encode). A copy
+# must play wherever an encode would, so the video stays within the most the
+# encoders produce: Main profile at level 4.0 (NVENC_VIDEO_SETTINGS)
+COPY_VIDEO_CODECS = {"h264": "h264", "h265": "hevc"}   # requested codec -> source codec
+COPY_H264_PROFILES = ("Constrained Baseline", "Baseline", "Main")
+COPY_HEVC_PROFILES = ("Main",)
+COPY_MAX_H264_LEVEL = 40    # ffprobe reports level 4.0 as 40
+COPY_MAX_HEVC_LEVEL = 120   # ffprobe reports level 4.0 as 120 (level * 30)
+COPY_PIX_FMTS = ("yuv420p", "yuvj420p")
+COPY_AUDIO_CODECS = ("aac",)
+COPY_AAC_PROFILES = ("LC", "HE-AAC")
+COPY_SAMPLE_RATES = (44100, 48000)
+COPY_MAX_CHANNELS = 2
+
+
+# Presets from fastest to slowest (best quality), used by calibration
+ENCODER_PRESETS = {
+    "libx264": ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow"],
+    "h264_nvenc": ["p1", "p2", "p3", "p4", "p5", "p6", "p7"],
+    "hevc_nvenc": ["p1", "p2", "p3", "p4", "p5", "p6", "p7"],
+}
+
+
+# Layouts of the MP4/MOV index (moov atom). faststart writes the file, then
+# rewrites all of it to move the moov to the front. fragmented (fMP4, as in
+# HLS) writes an empty moov first and one fragment per keyframe. reserve
+# leaves room for the moov at the start and fills it in at the end. All
+# three have the index before the media, so iOS can start playing at once.
+MOOV_FASTSTART = "faststart"
+MOOV_FRAGMENTED = "fragmented"
+MOOV_RESERVE = "reserve"
+MOOV_MODES = (MOOV_FASTSTART, MOOV_FRAGMENTED, MOOV_RESERVE)
+
+# Worst-case sample table bytes: stsz 4, ctts 8, stts 8, stss 4, stsc 12 and
+# co64 8 if every video frame were its own chunk; the same without ctts/stss
+# per AAC frame (1024 samples at up to 48 kHz)
+MOOV_BYTES_PER_VIDEO_FRAME = 44
+MOOV_BYTES_PER_AUDIO_FRAME = 32
+AAC_FRAMES_PER_SECOND = 48000 / 1024
+MOOV_BASE_SIZE = 64 * 1024
+DEFAULT_FRAME_RATE = 60  # when the source frame rate is unknown
+
+
+def video_settings(vcodec, preset=None, threads=0):
+    """
+    Encoder settings for the chosen video encoder, optionally with another
+    preset, and for libx264 a fixed thread count (0 = one per core)
+    """
+    settings = list(NVENC_VIDEO_SETTINGS if "nvenc" in vcodec else X264_VIDEO_SETTINGS)
+    if preset:
+        settings[settings.index("-preset") + 1] = preset
+    if threads and vcodec == "libx264":
+        settings += ["-threads", str(threads), "-x264-params", f"threads={threads}"]
+    return settings + COMMON_VIDEO_SETTINGS
+
+
+def moov_reserve_size(duration, frame_rate=0.0):
+    """Bytes to reserve for the moov atom of a `duration` second output (upper bound)"""
+    per_second = ((frame_rate or DEFAULT_FRAME_RATE) * MOOV_BYTES_PER_VIDEO_FRAME
+                  + AAC_FRAMES_PER_SECOND * MOOV_BYTES_PER_AUDIO_FRAME)
+    return int(MOOV_BASE_SIZE + duration * per_second)
+
+
+def moov_settings(moov_mode=MOOV_FASTSTART, duration=0.0, frame_rate=0.0):
+    """Where the MP4/MOV index goes; reserve needs the duration, else faststart is used"""
+    if moov_mode == MOOV_FRAGMENTED:
+        return ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+    if moov_mode == MOOV_RESERVE and duration > 0:
+        return ["-moov_size", str(moov_reserve_size(duration, frame_rate))]
+    return ["-movflags", "+faststart"]
+
+
+def container_settings(output_file, output_format, moov_mode=MOOV_FASTSTART, duration=0.0,
+                       frame_rate=0.0):
+    """Container and compatibility settings"""
+    return moov_settings(moov_mode, duration, frame_rate) + [
+        "-f", output_format,  # Use selected output format
+        "-avoid_negative_ts", "make_zero",  # Fix timestamp issues
+        "-max_muxing_queue_size", "1024",   # Handle complex streams
+        "-y",                 # Overwrite output file
+        output_file
+    ]
+
+
+def build_command(input_file, output_file, vcodec, output_format="mp4", plan=None, progress=True,
+                  preset=None, moov_mode=MOOV_FASTSTART, duration=0.0, frame_rate=0.0, threads=0):
+    """
+    Full ffmpeg command for an iOS compatible output.
+
+    Without a plan every stream is re-encoded (ffmpeg picks the streams).
+    With a ConversionPlan the chosen streams are mapped explicitly and each
+    one is either copied or re-encoded as the plan decided. `preset`
+    replaces the encoder's default preset. `moov_mode` is one of MOOV_MODES;
+    reserve sizes the moov from `duration`/`frame_rate` (default: the plan's).
+    `threads` limits libx264 to that many threads (see cpu_scheduler).
+    """
+    command = [ffmpeg_binary(), "-hide_banner"]
+    if progress:
+        command += PROGRESS_ARGS  # key=value progress on stdout, no stats lines
+    command += [
+        "-fflags", "+genpts+discardcorrupt",  # Handle corrupted/problematic streams
+        "-i", input_file,
+    ]
+
+    if plan is not None:
+        command += plan.map_args()
+
+    # Video
+    if plan is not None and plan.video_index is None:
+        command += ["-vn"]
+    elif plan is not None and plan.copy_video:
+        command += ["-c:v", "copy"]
+        if plan.video_codec == "hevc":
+            command += ["-tag:v", "hvc1"]  # iOS only plays HEVC tagged as hvc1
+    else:
+        command += ["-c:v", vcodec] + video_settings(vcodec, preset, threads)
+
+    # Audio
+    if plan is not None and plan.audio_index is None:
+        command += ["-an"]
+    elif plan is not None and plan.copy_audio:
+        # ADTS (.ts) AAC needs its headers rewritten for MP4/MOV
+        command += ["-c:a", "copy", "-bsf:a", "aac_adtstoasc"]
+    else:
+        command += AUDIO_SETTINGS
+
+    if plan is not None:
+        duration, frame_rate = duration or plan.duration, frame_rate or plan.frame_rate
+    return command + container_settings(output_file, output_format, moov_mode, duration, frame_rate)
@@ -0,0 +1,310 @@
+"""
+Crash-safe journal of conversion jobs (SQLite)
+
+Every job submitted to an engine that has a journal gets a row with its
+parameters, output path, state, attempt count and last error. Each state
+change is written as it happens, and appended to a transitions table. The
+database runs in WAL mode with synchronous=NORMAL: a commit costs no fsync,
+readers never block the writer, and a crash loses at most the last
+transitions, never the database.
+
+After a crash, reboot or closed window, recover() sorts the rows left
+behind by processes that are gone:
+
+- pending jobs are queued again,
+- running jobs were interrupted: an output that ffprobe reads with the
+  expected duration was finished before the crash and is kept (the job
+  becomes done); a partial output and the hidden work directories next to
+  it are deleted and the job is queued again,
+- finished jobs are kept until the user clears them.
+
+Rows belong to the process that wrote them (its pid), so a second
+instance never takes over jobs that are still running elsewhere.
+"""
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from app_paths import app_data_dir
+from job_queue import ConversionJob, PENDING, RUNNING, DONE, FAILED, CANCELLED
+
+
+JOURNAL_FILE = "jobs.sqlite3"
+SCHEMA_VERSION = 1
+
+# An interrupted output within this many seconds of the input's duration is complete
+DURATION_TOLERANCE = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_file TEXT NOT NULL,
+    output_file TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    duration REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    owner INTEGER,
+    submitted_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transitions (
+    job_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, state);
+CREATE INDEX IF NOT EXISTS jobs_output ON jobs (output_file);
+CREATE INDEX IF NOT EXISTS transitions_job ON transitions (job_id, at);
+"""
+
+# ConversionJob keyword arguments stored with each job
+JOB_PARAMS = ("use_gpu", "codec", "output_format", "smart_copy", "chunks", "target_speed",
+              "moov_mode", "renditions", "hls", "priority", "deadline")
+
+
+def journal_path():
+    return app_data_dir() / JOURNAL_FILE
+
+
+def job_params(job):
+    return json.dumps({name: getattr(job, name) for name in JOB_PARAMS})
+
+
+def process_alive(pid, since=None):
+    """
+    True if the process `pid` is running (assumed gone if it cannot be told).
+    With psutil, a process started after `since` is a reused pid, not the owner.
+    """
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            return since is None or process.create_time() <= since
+        except psutil.NoSuchProcess:
+            return False
+        except Exception:
+            return True  # exists, not ours to inspect
+    if os.name == "nt":
+        return False  # os.kill(pid, 0) would terminate it on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+def output_complete(output_file, duration):
+    """True if ffprobe reads `output_file` and it is as long as the input"""
+    if duration <= 0 or not os.path.isfile(output_file):
+        return False
+    # Imported on first use: recovery is the only reader of outputs here
+    from stream_planner import ProbeError, plan_from_probe, probe_media
+    try:
+        plan = plan_from_probe(probe_media(output_file))
+    except (ProbeError, OSError, ValueError):
+        return False
+    return abs(plan.duration - duration) <= DURATION_TOLERANCE
+
+
+def remove_partial_output(output_file, names=None, hls=False, work_dirs=True):
+    """
+    Delete what an interrupted job wrote: its outputs and, with `work_dirs`,
+    the hidden work directories of chunked and resumable encodes next to them
+    """
+    # Imported on first use, like in the engine
+    import renditions
+    paths = renditions.output_files(output_file, names, hls) if names else [output_file]
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if not work_dirs:
+        return
+    directory = os.path.dirname(os.path.abspath(output_file))
+    for work_dir in glob.glob(os.path.join(glob.escape(directory), ".convert2ios_*")):
+        if os.path.isdir(work_dir):
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class JobJournal:
+    """The journal database; one connection shared by the threads of this process"""
+
+    def __init__(self, path=None):
+        self.path = str(path or journal_path())
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")  # another instance writing
+        with self._lock:
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._db.executescript(SCHEMA + f"PRAGMA user_version={SCHEMA_VERSION};")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _write(self, statements):
+        """Run [(sql, parameters)] in one transaction; the journal never fails a conversion"""
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                for sql, parameters in statements:
+                    self._db.execute(sql, parameters)
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+
+    # Writes
+
+    def add(self, job):
+        """Record a newly submitted job; sets job.journal_id"""
+        return self.add_many([job])
+
+    def add_many(self, jobs):
+        """Record many jobs in one transaction (their first transition comes with update())"""
+        now = time.time()
+        jobs = [job for job in jobs if job.journal_id is None]
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                for job in jobs:
+                    job.journal_id = self._db.execute(
+                        "INSERT INTO jobs (input_file, output_file, params, state, owner, "
+                        "submitted_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (job.input_file, job.output_file, job_params(job), job.status, os.getpid(),
+                         job.submitted_at, now)).lastrowid
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                for job in jobs:
+                    job.journal_id = None
+        return jobs
+
+    def update(self, job):
+        """Write the job's current state; a start counts as one more attempt"""
+        if job.journal_id is None:
+            return
+        if job.status == RUNNING:
+            job.attempts += 1
+        now = time.time()
+        self._write([
+            ("UPDATE jobs SET state = ?, attempts = attempts + ?, duration = ?, error = ?, "
+             "owner = ?, updated_at = ? WHERE id = ?",
+             (job.status, 1 if job.status == RUNNING else 0, job.total_duration, job.error,
+              os.getpid(), now, job.journal_id)),
+            ("INSERT INTO transitions (job_id, state, at) VALUES (?, ?, ?)",
+             (job.journal_id, job.status, now)),
+        ])
+
+    def remove_finished(self):
+        """Forget finished jobs of this process and of processes that are gone"""
+        finished = (DONE, FAILED, CANCELLED)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, owner, updated_at FROM jobs WHERE state IN (?, ?, ?)", finished).fetchall()
+        ids = [(row["id"],) for row in rows if not self._owned_elsewhere(row)]
+        if ids:
+            with self._lock:
+                try:
+                    self._db.execute("BEGIN IMMEDIATE")
+                    self._db.executemany("DELETE FROM transitions WHERE job_id = ?", ids)
+                    self._db.executemany("DELETE FROM jobs WHERE id = ?", ids)
+                    self._db.execute("COMMIT")
+                except sqlite3.Error:
+                    if self._db.in_transaction:
+                        self._db.execute("ROLLBACK")
+        return len(ids)
+
+    @staticmethod
+    def _owned_elsewhere(row):
+        """The row belongs to another instance that is still running"""
+        return row["owner"] != os.getpid() and process_alive(row["owner"], row["updated_at"])
+
+    # Reads
+
+    def rows(self, states=None, limit=None):
+        """Job rows (sqlite3.Row), oldest first, optionally only in `states`"""
+        sql, parameters = "SELECT * FROM jobs", []
+        if states:
+            sql += f" WHERE state IN ({', '.join('?' * len(states))})"
+            parameters += list(states)
+        sql += " ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        with self._lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def transitions(self, journal_id):
+        """[(state, time)] of one job"""
+        with self._lock:
+            return [tuple(row) for row in self._db.execute(
+                "SELECT state, at FROM transitions WHERE job_id = ? ORDER BY at", (journal_id,))]
+
+    def job_from_row(self, row):
+        """A ConversionJob with the row's parameters, state and journal id"""
+        params = json.loads(row["params"])
+        job = ConversionJob(row["input_file"], row["output_file"],
+                            **{name: params[name] for name in JOB_PARAMS if name in params})
+        job.journal_id = row["id"]
+        job.status = row["state"]
+        job.attempts = row["attempts"]
+        job.error = row["error"]
+        job.total_duration = row["duration"]
+        job.submitted_at = row["submitted_at"]
+        return job
+
+    # Recovery
+
+    def recover(self, log=print):
+        """
+        Take over the jobs of processes that are gone. Returns (jobs to queue
+        again, finished jobs) as ConversionJob objects, oldest first. Blocking:
+        probes interrupted outputs.
+        """
+        queued, finished = [], []
+        rows, busy_dirs = [], set()
+        for row in self.rows():
+            if not process_alive(row["owner"], row["updated_at"]):
+                rows.append(row)
+            elif row["state"] == RUNNING:
+                # Running here or in another instance: leave its work directories alone
+                busy_dirs.add(os.path.dirname(os.path.abspath(row["output_file"])))
+        for row in rows:
+            job = self.job_from_row(row)
+            if job.status == RUNNING:
+                if output_complete(job.output_file, job.total_duration) and not job.renditions:
+                    log(f"♻️ พบไฟล์ที่แปลงเสร็จก่อนโปรแกรมปิด: {job.output_file}")
+                    job.status = DONE
+                else:
+                    log(f"♻️ งานค้าง (ครั้งที่ {job.attempts}) → ลบไฟล์ที่ยังไม่เสร็จและเข้าคิวใหม่: "
+                        f"{job.name}")
+                    remove_partial_output(job.output_file, job.renditions, job.hls, work_dirs=(
+                        os.path.dirname(os.path.abspath(job.output_file)) not in busy_dirs))
+                    job.status = PENDING
+                self.update(job)
+            elif job.status == PENDING:
+                self.update(job)  # now owned by this process
+            (queued if job.status == PENDING else finished).append(job)
+        return queued, finished
@@ -0,0 +1,78 @@
+"""
+Full per-job logs, gzip-compressed on disk
+
+The GUI and the command line only show the important ffmpeg lines. Every
+line ffmpeg writes to stderr during a job (from every process of the job:
+a retry on the CPU, a continuation, a remux) and the engine's own messages
+are streamed to logs/<time>-<pid>-<job id>-<input name>.log.gz in the app data
+directory, so the whole story is there when a conversion fails. The oldest
+logs are deleted once there are more than MAX_LOG_FILES.
+"""
+import gzip
+import os
+import re
+import threading
+import time
+
+from app_paths import app_data_dir
+
+
+LOG_DIR = "logs"
+MAX_LOG_FILES = 500
+COMPRESS_LEVEL = 6  # most of the gain of 9 at a fraction of the CPU
+
+
+def log_dir():
+    path = app_data_dir() / LOG_DIR
+    path.mkdir(exist_ok=True)
+    return path
+
+
+def prune(directory, keep=MAX_LOG_FILES):
+    """Delete the oldest job logs beyond `keep`"""
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".log.gz"))
+    except OSError:
+        return
+    # Names start with the time, so sorting by name sorts by age
+    for name in names[:max(0, len(names) - keep)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+class JobLog:
+    """Compressed log of one job; write() is safe from any thread and never raises"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._file = gzip.open(self.path, "wt", encoding='utf-8', compresslevel=COMPRESS_LEVEL)
+
+    @classmethod
+    def open_for(cls, job, directory=None):
+        """New log for a job, named after its start time, id and input"""
+        directory = directory or log_dir()
+        stem = re.sub(r"[^\w.-]+", "_", os.path.splitext(job.name)[0])[:60]
+        # Job ids restart with each process: the pid keeps two instances apart
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{job.id}-{stem}.log.gz"
+        return cls(os.path.join(directory, name))
+
+    def write(self, line):
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.write(line + "\n")
+            except (OSError, ValueError):
+                pass  # Logs must never fail a conversion
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
@@ -0,0 +1,116 @@
+"""
+Conversion jobs and their states
+The queue that runs them is conversion_engine.ConversionEngine
+"""
+import itertools
+import os
+import time
+
+from ios_profile import MOOV_FASTSTART
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# Order in which pending jobs start
+ORDER_FIFO = "fifo"           # as submitted
+ORDER_SHORTEST = "shortest"   # shortest predicted encode first
+ORDER_DEADLINE = "deadline"   # earliest deadline first, then shortest
+ORDER_PRIORITY = "priority"   # highest priority first, then shortest
+QUEUE_ORDERS = (ORDER_FIFO, ORDER_SHORTEST, ORDER_DEADLINE, ORDER_PRIORITY)
+
+# `chunks` value that lets the engine pick the split per input (conversion_engine.chunk_count())
+CHUNKS_AUTO = 0
+
+_job_ids = itertools.count(1)
+
+
+def order_key(job, order=ORDER_FIFO):
+    """Sort key of a pending job; jobs not estimated yet go after the estimated ones"""
+    estimate = job.estimate if job.estimate is not None else float("inf")
+    if order == ORDER_SHORTEST:
+        return (estimate, job.id)
+    if order == ORDER_DEADLINE:
+        return (job.deadline if job.deadline is not None else float("inf"), estimate, job.id)
+    if order == ORDER_PRIORITY:
+        return (-job.priority, estimate, job.id)
+    return (job.id,)
+
+
+def default_worker_count():
+    """Reasonable default concurrency: half the cores, at least one"""
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class ConversionJob:
+    """One input -> output conversion and its live progress"""
+
+    def __init__(self, input_file, output_file, use_gpu=True, codec="h264", output_format="mp4",
+                 smart_copy=True, chunks=1, target_speed=None, moov_mode=MOOV_FASTSTART,
+                 renditions=None, hls=False, priority=0, deadline=None):
+        self.id = next(_job_ids)
+        self.input_file = input_file
+        self.output_file = output_file
+        self.use_gpu = use_gpu
+        self.codec = codec
+        self.output_format = output_format
+        self.smart_copy = smart_copy
+        self.chunks = chunks              # video pieces per file, CHUNKS_AUTO = picked per input
+        self.target_speed = target_speed  # pick a calibrated preset at least this fast
+        self.preset = None                # None = the iOS profile default
+        self.pieces = None                # pieces this run splits the video into (from chunks)
+        self.moov_mode = moov_mode        # ios_profile.MOOV_MODES
+        self.renditions = renditions      # renditions.RENDITIONS names: one decode, several outputs
+        self.hls = hls                    # renditions as HLS, output_file is the master playlist
+        self.priority = priority          # higher starts first with ORDER_PRIORITY
+        self.deadline = deadline          # time.time() it should be done by, for ORDER_DEADLINE
+        self.estimate = None              # predicted encode seconds (encode_estimator)
+        self.staged_input = None          # local copy ffmpeg reads instead (staging.Stager)
+        self.staged_output = None         # local file ffmpeg writes, moved to output_file after
+
+        self.status = PENDING
+        self.process = None
+        self.cancel_requested = False
+        self.error = None
+        self.submitted_at = time.time()
+        self.metrics = None  # metrics.JobMetrics while the job runs
+        self.log = None      # job_logs.JobLog: the job's full log, while it runs
+        self.journal_id = None  # row in job_journal.JobJournal, if the engine keeps one
+        self.attempts = 0       # starts so far, restored from the journal
+
+        # Progress tracking
+        self.total_duration = 0
+        self.current_time = 0
+        self.speed = 0
+
+    @property
+    def name(self):
+        return os.path.basename(self.input_file)
+
+    @property
+    def source_file(self):
+        """What ffmpeg reads: the staged copy of the input, if any"""
+        return self.staged_input or self.input_file
+
+    @property
+    def target_file(self):
+        """What ffmpeg writes: the staged output, if any"""
+        return self.staged_output or self.output_file
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def percent(self):
+        """Progress of this job in percent (0-100)"""
+        if self.status == DONE:
+            return 100.0
+        if self.total_duration > 0:
+            return min(100.0, (self.current_time / self.total_duration) * 100)
+        return 0.0
@@ -1,10 +1,18 @@
 """
-Standalone script to kill all ffmpeg processes and release file locks
+Standalone script to kill ffmpeg processes and release file locks
 Run this if files remain locked after closing the GUI
+
+By default only the processes recorded in the app's pidfiles are killed
+(ffmpeg/ffprobe started by convert2ios). Use --all to kill every ffmpeg
+process on the machine.
 """
+import os
+import signal
 import subprocess
 import sys
 
+import process_registry
+
 def kill_ffmpeg_processes():
     """Kill all ffmpeg processes using Windows taskkill"""
     try:
@@ -77,14 +85,69 @@ def kill_with_psutil():
         print("🔄 ลองใช้ taskkill แทน...")
         kill_ffmpeg_processes()
 
+def _is_same_process(entry):
+    """True if the PID still runs the recorded ffmpeg (not a reused PID)"""
+    try:
+        import psutil
+    except ImportError:
+        return True  # Cannot check, trust the pidfile
+    try:
+        proc = psutil.Process(entry["pid"])
+        name = proc.name().lower()
+        return (entry["command"].lower().split(".")[0] in name
+                and abs(proc.create_time() - entry["started"]) < 5)
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        return False
+
+
+def _kill_group(pid):
+    """Kill a tracked helper and anything in its process group"""
+    if sys.platform == "win32":
+        subprocess.run(["taskkill", "/f", "/t", "/pid", str(pid)],
+                       capture_output=True, check=False)
+    else:
+        os.killpg(pid, signal.SIGKILL)
+
+
+def kill_tracked_processes():
+    """Kill only the processes recorded in convert2ios pidfiles"""
+    print("🔍 อ่านรายการกระบวนการจาก pidfile ของโปรแกรม...")
+    killed_count = 0
+    for path, owner, entries in process_registry.read_pidfiles():
+        for entry in entries:
+            if not _is_same_process(entry):
+                continue
+            try:
+                _kill_group(entry["pid"])
+                killed_count += 1
+                print(f"🔫 ฆ่ากระบวนการ {entry['command']} PID: {entry['pid']} (ของโปรแกรม PID {owner})")
+            except (ProcessLookupError, PermissionError, OSError):
+                pass
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    if killed_count > 0:
+        print(f"✅ ฆ่ากระบวนการ ffmpeg จำนวน {killed_count} กระบวนการ")
+    else:
+        print("ℹ️ ไม่พบกระบวนการ ffmpeg ของโปรแกรมที่ทำงานอยู่")
+
+
 def main():
     print("🚀 FFmpeg Process Killer")
     print("=" * 40)
-    print("สคริปต์นี้จะฆ่ากระบวนการ ffmpeg ทั้งหมดเพื่อปลดล็อกไฟล์")
-    print("=" * 40)
-    
-    # Try psutil first (more reliable), fallback to taskkill
-    kill_with_psutil()
+    if "--all" in sys.argv:
+        print("สคริปต์นี้จะฆ่ากระบวนการ ffmpeg ทั้งหมดในเครื่องเพื่อปลดล็อกไฟล์")
+        print("=" * 40)
+
+        # Try psutil first (more reliable), fallback to taskkill
+        kill_with_psutil()
+    else:
+        print("สคริปต์นี้จะฆ่ากระบวนการ ffmpeg ที่โปรแกรมนี้เปิดไว้เพื่อปลดล็อกไฟล์")
+        print("(ใช้ --all เพื่อฆ่า ffmpeg ทั้งหมดในเครื่อง)")
+        print("=" * 40)
+        kill_tracked_processes()
     
     print("\n🔓 การปลดล็อกไฟล์เสร็จสิ้น")
     print("💡 ตอนนี้คุณสามารถเปลี่ยนชื่อไฟล์ได้แล้ว")
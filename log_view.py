@@ -0,0 +1,181 @@
+"""
+Bounded log display for the Tk status text area
+
+The status area used to keep every line ever logged in its Text widget, so
+a long batch made every insert and redraw slower and the memory grew
+without limit. Now:
+
+- LogStore keeps the last `max_lines` lines in a ring buffer. Older lines
+  are compressed (zlib) a page at a time into an anonymous temporary file,
+  so the whole session can still be read back.
+- LogView shows at most the ring's tail in the Text widget and follows new
+  lines while the view is at the bottom. Scrolling to the top loads the
+  previous page from the store; while the user reads older lines new ones
+  are not inserted, they are caught up when the view is back at the bottom.
+
+The size is the `max_lines` argument, CONVERT2IOS_LOG_LINES, or
+DEFAULT_LINES. The full ffmpeg output of each job is not here, it is in
+the job's compressed log file (job_logs.py).
+"""
+import os
+import tempfile
+import tkinter as tk
+import zlib
+from collections import deque
+
+
+DEFAULT_LINES = 1000
+LINES_ENV = "CONVERT2IOS_LOG_LINES"
+PAGE_LINES = 200    # lines loaded per scroll to the top, and per compressed page
+MIN_LINES = PAGE_LINES
+
+
+def configured_lines():
+    """Ring size from the environment, DEFAULT_LINES if unset or invalid"""
+    try:
+        return max(MIN_LINES, int(os.environ.get(LINES_ENV, DEFAULT_LINES)))
+    except ValueError:
+        return DEFAULT_LINES
+
+
+class LogStore:
+    """
+    Every line of the session by index: the last `max_lines` in memory,
+    older ones in compressed pages on disk
+    """
+
+    def __init__(self, max_lines=None):
+        self.max_lines = max(MIN_LINES, max_lines or configured_lines())
+        self.total = 0           # lines appended so far
+        self._ring = deque()
+        self._spill = []         # evicted lines not yet in a page
+        self._pages = []         # (file offset, length) of PAGE_LINES lines each
+        self._file = None
+
+    @property
+    def first_in_memory(self):
+        return self.total - len(self._ring)
+
+    def extend(self, lines):
+        self._ring.extend(lines)
+        self.total += len(lines)
+        while len(self._ring) > self.max_lines:
+            self._spill.append(self._ring.popleft())
+            if len(self._spill) == PAGE_LINES:
+                self._write_page(self._spill)
+                self._spill = []
+
+    def _write_page(self, lines):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix="convert2ios_log_")
+        data = zlib.compress("\n".join(lines).encode('utf-8'))
+        self._file.seek(0, os.SEEK_END)
+        self._pages.append((self._file.tell(), len(data)))
+        self._file.write(data)
+
+    def _read_page(self, number):
+        offset, length = self._pages[number]
+        self._file.seek(offset)
+        return zlib.decompress(self._file.read(length)).decode('utf-8').split("\n")
+
+    def lines(self, start, end):
+        """Lines start..end-1 of the session"""
+        start, end = max(0, start), min(end, self.total)
+        result = []
+        index = start
+        while index < end:
+            if index >= self.first_in_memory:
+                offset = index - self.first_in_memory
+                result.extend(self._ring[i] for i in range(offset, offset + end - index))
+                break
+            paged = len(self._pages) * PAGE_LINES
+            if index >= paged:
+                result.extend(self._spill[index - paged:end - paged])
+            else:
+                page_start = index // PAGE_LINES * PAGE_LINES
+                page = self._read_page(index // PAGE_LINES)
+                result.extend(page[index - page_start:end - page_start])
+            index = start + len(result)
+        return result
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class LogView:
+    """A Text widget showing the tail of a LogStore, paging back on scroll-up (Tk thread only)"""
+
+    def __init__(self, text, scrollbar=None, max_lines=None):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.store = LogStore(max_lines)
+        self.shown_start = 0     # session index of the first line in the widget
+        self.shown_end = 0       # one past the last
+        self._after_id = None
+        text.configure(yscrollcommand=self._on_scroll)
+        if scrollbar is not None:
+            scrollbar.configure(command=text.yview)
+
+    def _at_bottom(self):
+        return self.text.yview()[1] >= 1.0
+
+    def append(self, lines):
+        # One store line per widget line
+        lines = [part for line in lines for part in str(line).split("\n")]
+        following = self._at_bottom()
+        self.store.extend(lines)
+        if following and self.shown_end == self.store.total - len(lines):
+            self.text.insert(tk.END, "\n".join(lines) + "\n")
+            self.shown_end = self.store.total
+            self._trim_top()
+            self.text.see(tk.END)
+        # Otherwise the user is reading older lines: caught up at the bottom
+
+    def _trim_top(self):
+        excess = (self.shown_end - self.shown_start) - self.store.max_lines
+        if excess > 0:
+            self.text.delete("1.0", f"{excess + 1}.0")
+            self.shown_start += excess
+
+    def _on_scroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+        # Load or catch up after Tk is done scrolling, not from inside its callback
+        if self._after_id is None and (
+                (float(first) <= 0.0 and self.shown_start > 0)
+                or (float(last) >= 1.0 and self.shown_end < self.store.total)):
+            self._after_id = self.text.after_idle(self._page)
+
+    def _page(self):
+        self._after_id = None
+        first, last = self.text.yview()
+        if first <= 0.0 and self.shown_start > 0:
+            self._load_older()
+        elif last >= 1.0 and self.shown_end < self.store.total:
+            self._catch_up()
+
+    def _load_older(self):
+        count = min(PAGE_LINES, self.shown_start)
+        older = self.store.lines(self.shown_start - count, self.shown_start)
+        self.text.insert("1.0", "\n".join(older) + "\n")
+        self.shown_start -= count
+        # Keep the line the user was looking at in place
+        self.text.yview(f"{count + 1}.0")
+        # Bounded while reading back too: drop the newest lines, caught up at the bottom
+        excess = (self.shown_end - self.shown_start) - 2 * self.store.max_lines
+        if excess > 0:
+            self.shown_end -= excess
+            self.text.delete(f"{self.shown_end - self.shown_start + 1}.0", "end-1c")
+
+    def _catch_up(self):
+        if self.store.total - self.shown_end > self.store.max_lines:
+            # Too far behind: show the tail again
+            self.text.delete("1.0", tk.END)
+            self.shown_start = self.shown_end = max(0, self.store.total - self.store.max_lines)
+        missing = self.store.lines(self.shown_end, self.store.total)
+        self.text.insert(tk.END, "\n".join(missing) + "\n")
+        self.shown_end = self.store.total
+        self._trim_top()
+        self.text.see(tk.END)
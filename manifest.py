@@ -0,0 +1,208 @@
+"""
+Incremental batch manifest kept in the output root
+
+For every converted file it records the input's identity (size, mtime and
+a fast partial content hash), a hash of the ffmpeg arguments that produced
+the output, the ffprobe result and the output's size, mtime and checksum. A ladder or
+HLS output is more than one file: the size and mtime of every other file it
+wrote (renditions, media playlists, init and segments) are recorded too,
+and a missing or changed one makes the whole output out of date.
+
+A re-run skips a file when its input (size, mtime and partial hash),
+arguments and output are unchanged, and copies an existing output instead
+of encoding again when the same content (size and partial hash, whatever
+the mtime) shows up under another name. Any change to the codec, format,
+bitrate or other settings changes the argument hash and invalidates the
+entry.
+"""
+import hashlib
+import json
+import os
+import threading
+
+
+MANIFEST_FILE = ".convert2ios_manifest.json"
+MANIFEST_VERSION = 1
+
+# Partial hash: the first, middle and last block of the file plus its size
+SAMPLE_SIZE = 1 << 20
+CHECKSUM_BLOCK = 1 << 20
+
+# Placeholders so the argument hash does not depend on file names
+INPUT_PLACEHOLDER = "{input}"
+OUTPUT_PLACEHOLDER = "{output}"
+
+
+def partial_hash(path, size=None):
+    """blake2b of the size and three 1 MiB samples; reads at most 3 MiB"""
+    size = os.path.getsize(path) if size is None else size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        if size <= 3 * SAMPLE_SIZE:
+            digest.update(f.read())
+        else:
+            for offset in (0, (size - SAMPLE_SIZE) // 2, size - SAMPLE_SIZE):
+                f.seek(offset)
+                digest.update(f.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def file_checksum(path):
+    """blake2b of the whole file"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def arguments_hash(arguments):
+    """Stable hash of an ffmpeg argument list"""
+    return hashlib.sha256("\0".join(arguments).encode("utf-8")).hexdigest()
+
+
+def content_id(identity):
+    """Key for identical inputs regardless of name and mtime"""
+    return f"{identity['size']}:{identity['partial_hash']}"
+
+
+class Manifest:
+    """Manifest of one output root, safe to use from several worker threads"""
+
+    def __init__(self, output_root):
+        self.output_root = os.path.abspath(output_root)
+        self.path = os.path.join(self.output_root, MANIFEST_FILE)
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                return data["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _save(self):
+        """Write atomically so a crash mid-batch never leaves half a manifest"""
+        os.makedirs(self.output_root, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _key(self, output_file):
+        return os.path.relpath(os.path.abspath(output_file), self.output_root).replace(os.sep, "/")
+
+    def output_path(self, entry):
+        return os.path.join(self.output_root, *entry["key"].split("/"))
+
+    def identify(self, input_file):
+        """
+        Identity of an input: size, mtime and partial hash.
+
+        The hash is reused from the manifest when size and mtime are
+        unchanged, so re-runs do not read the inputs again.
+        """
+        stat = os.stat(input_file)
+        path = os.path.abspath(input_file)
+        with self._lock:
+            for entry in self.entries.values():
+                known = entry["input"]
+                if (known["path"] == path and known["size"] == stat.st_size
+                        and known["mtime_ns"] == stat.st_mtime_ns):
+                    return dict(known)
+        return {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                "partial_hash": partial_hash(input_file, stat.st_size)}
+
+    def output_intact(self, entry):
+        """True if the recorded output and every other file it wrote still exist unmodified"""
+        files = [(entry["key"], entry["output"])] + sorted(entry.get("files", {}).items())
+        for key, recorded in files:
+            try:
+                stat = os.stat(os.path.join(self.output_root, *key.split("/")))
+            except OSError:
+                return False
+            if stat.st_size != recorded["size"] or stat.st_mtime_ns != recorded["mtime_ns"]:
+                return False
+        return True
+
+    def known_probe(self, identity):
+        """ffprobe result stored for the same content, or None"""
+        cid = content_id(identity)
+        with self._lock:
+            for entry in self.entries.values():
+                if content_id(entry["input"]) == cid and entry.get("probe"):
+                    return entry["probe"]
+        return None
+
+    def is_up_to_date(self, output_file, identity, args_hash):
+        """
+        True if output_file was made from this exact input with these arguments.
+
+        The partial hash does not see edits between its samples, so an
+        input whose mtime changed counts as changed.
+        """
+        with self._lock:
+            entry = self.entries.get(self._key(output_file))
+        return (entry is not None
+                and entry["args_hash"] == args_hash
+                and content_id(entry["input"]) == content_id(identity)
+                and entry["input"]["mtime_ns"] == identity["mtime_ns"]
+                and self.output_intact(entry))
+
+    def find_output(self, identity, args_hash, exclude=None):
+        """
+        Entry of an intact output made from the same content and arguments, or
+        None. The entry of `exclude` (the job's own, out of date output) is not
+        a candidate.
+        """
+        cid = content_id(identity)
+        excluded = self._key(exclude) if exclude is not None else None
+        with self._lock:
+            candidates = [entry for entry in self.entries.values()
+                          if entry["args_hash"] == args_hash and content_id(entry["input"]) == cid
+                          and entry["key"] != excluded]
+        for entry in candidates:
+            if self.output_intact(entry):
+                return entry
+        return None
+
+    def record(self, output_file, identity, args_hash, probe=None, checksum=None, files=()):
+        """
+        Store a finished output and save the manifest. `files` are the other
+        files of a ladder or HLS output (renditions.output_files()).
+        """
+        stat = os.stat(output_file)
+        key = self._key(output_file)
+        others = {}
+        for path in files:
+            if self._key(path) != key:
+                other = os.stat(path)
+                others[self._key(path)] = {"size": other.st_size, "mtime_ns": other.st_mtime_ns}
+        entry = {
+            "key": key,
+            "input": identity,
+            "args_hash": args_hash,
+            "probe": probe,
+            "output": {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "checksum": checksum or file_checksum(output_file),
+            },
+        }
+        if others:
+            entry["files"] = others
+        with self._lock:
+            self.entries[key] = entry
+            self._save()
+        return entry
+
+    def forget(self, output_file):
+        """Drop the entry of an output that is about to be rewritten"""
+        with self._lock:
+            if self.entries.pop(self._key(output_file), None) is not None:
+                self._save()
@@ -0,0 +1,332 @@
+"""
+Per-job resource metrics
+
+Every conversion records queue wait, probe time, encode wall time, average
+and peak fps/speed, ffmpeg CPU user/sys time, peak RSS, input/output bytes
+and the encoder used, with the frame size, preset and predicted encode
+time the queue's estimator learns from (encode_estimator). Records are
+appended to a JSONL log in the app data directory. If a node-exporter
+textfile directory is configured, totals are also written there in the
+Prometheus text format. They are summed from the JSONL log, not from this
+process's jobs, so the GUI, batch and watch processes sharing one log all
+write the same totals to the one textfile.
+
+CPU and memory are sampled with psutil. psutil is imported lazily, and
+those fields are null when it is not installed.
+"""
+import json
+import os
+import threading
+import time
+
+from app_paths import app_data_dir
+
+
+METRICS_LOG = "job_metrics.jsonl"
+TEXTFILE_NAME = "convert2ios.prom"
+TEXTFILE_DIR_ENV = "CONVERT2IOS_TEXTFILE_DIR"
+SAMPLE_INTERVAL = 0.25
+
+_lock = threading.Lock()
+_totals = {}
+_summed = {"path": None, "offset": 0}  # how much of which log _totals holds
+_config = {"log_path": None, "textfile_dir": None}
+
+
+def process_ids(process):
+    """PIDs behind a job's process: a Popen, or a SegmentedEncoder with helpers"""
+    if process is None:
+        return []
+    if hasattr(process, "pids"):
+        return process.pids()
+    pid = getattr(process, "pid", None)
+    return [pid] if pid else []
+
+
+class ResourceMonitor:
+    """Samples CPU times and RSS of the processes returned by `get_process()`"""
+
+    def __init__(self, get_process, interval=SAMPLE_INTERVAL):
+        self.get_process = get_process
+        self.interval = interval
+        self.cpu_user = None
+        self.cpu_system = None
+        self.peak_rss = None
+        self._cpu = {}
+        self._handles = {}
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            import psutil
+            self._psutil = psutil
+        except ImportError:
+            self._psutil = None
+
+    def start(self):
+        if self._psutil is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._cpu:
+            self.cpu_user = round(sum(user for user, _ in self._cpu.values()), 3)
+            self.cpu_system = round(sum(system for _, system in self._cpu.values()), 3)
+
+    def _handle(self, pid):
+        handle = self._handles.get(pid)
+        if handle is None:
+            handle = self._handles[pid] = self._psutil.Process(pid)
+        return handle
+
+    def _run(self):
+        while True:
+            self.sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def sample(self):
+        rss = 0
+        for pid in process_ids(self.get_process()):
+            try:
+                handle = self._handle(pid)
+                times = handle.cpu_times()
+                rss += handle.memory_info().rss
+                # Keep the last reading per process, helpers come and go
+                self._cpu[pid] = (times.user, times.system)
+            except Exception:
+                continue
+        if rss:
+            self.peak_rss = max(self.peak_rss or 0, rss)
+
+
+class JobMetrics:
+    """Collects the metrics of one ConversionJob while it runs"""
+
+    def __init__(self, job):
+        self.job = job
+        self.started = time.time()
+        self.probe_time = 0.0
+        self.encoder = None
+        self.mode = None
+        self.outputs = None  # files written, when there is more than output_file
+        # What the encode time is predicted from (encode_estimator)
+        self.preset = None
+        self.frame_pixels = 0
+        self.frame_rate = 0.0
+        self.predicted_time = None
+        self._encode_started = None
+        self._encode_finished = None
+        self._monitor = None
+        self._fps_sum = self._fps_count = self.fps_peak = 0.0
+        self._speed_sum = self._speed_count = self.speed_peak = 0.0
+
+    def probe_finished(self):
+        self.probe_time = time.time() - self.started
+
+    def encode_started(self, get_process):
+        # A retry or a continuation of the same job keeps the first start
+        if self._encode_started is not None:
+            return
+        self._encode_started = time.time()
+        self._monitor = ResourceMonitor(get_process).start()
+
+    def encode_finished(self):
+        """The encode is over; what follows (moving a staged output) is not encode time"""
+        self._encode_finished = time.time()
+
+    def add_progress(self, fps, speed):
+        if fps > 0:
+            self._fps_sum += fps
+            self._fps_count += 1
+            self.fps_peak = max(self.fps_peak, fps)
+        if speed > 0:
+            self._speed_sum += speed
+            self._speed_count += 1
+            self.speed_peak = max(self.speed_peak, speed)
+
+    def finish(self, status):
+        """Stop sampling and return the record as a dict"""
+        import platform  # Not needed until the first job finishes
+        now = time.time()
+        if self._monitor is not None:
+            self._monitor.stop()
+        job = self.job
+        submitted = getattr(job, "submitted_at", self.started)
+        output_bytes = 0
+        for path in self.outputs or [job.output_file]:
+            try:
+                output_bytes += os.path.getsize(path)
+            except OSError:
+                pass
+        try:
+            input_bytes = os.path.getsize(job.input_file)
+        except OSError:
+            input_bytes = 0
+        return {
+            "timestamp": round(now, 3),
+            "host": platform.node(),
+            "job_id": job.id,
+            "input": job.input_file,
+            "output": job.output_file,
+            "status": status,
+            "encoder": self.encoder,
+            "mode": self.mode,
+            "codec": job.codec,
+            "format": job.output_format,
+            "chunks": job.pieces or job.chunks,
+            "preset": self.preset,
+            "frame_pixels": self.frame_pixels,
+            "frame_rate": round(self.frame_rate, 3),
+            "queue_wait": round(max(0.0, self.started - submitted), 3),
+            "probe_time": round(self.probe_time, 3),
+            "encode_time": (round((self._encode_finished or now) - self._encode_started, 3)
+                            if self._encode_started else 0.0),
+            "media_duration": round(job.total_duration, 3),
+            "predicted_time": round(self.predicted_time, 3) if self.predicted_time else None,
+            "fps_avg": round(self._fps_sum / self._fps_count, 2) if self._fps_count else 0.0,
+            "fps_peak": round(self.fps_peak, 2),
+            "speed_avg": round(self._speed_sum / self._speed_count, 3) if self._speed_count else 0.0,
+            "speed_peak": round(self.speed_peak, 3),
+            "cpu_user": self._monitor.cpu_user if self._monitor else None,
+            "cpu_system": self._monitor.cpu_system if self._monitor else None,
+            "peak_rss": self._monitor.peak_rss if self._monitor else None,
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+        }
+
+
+def configure(log_path=None, textfile_directory=None):
+    """Override where records go (default: app data dir, textfile from the environment)"""
+    _config["log_path"] = log_path
+    _config["textfile_dir"] = textfile_directory
+
+
+def metrics_log_path():
+    return _config["log_path"] or app_data_dir() / METRICS_LOG
+
+
+def textfile_dir():
+    """node-exporter textfile collector directory, or None if not configured"""
+    return _config["textfile_dir"] or os.environ.get(TEXTFILE_DIR_ENV) or None
+
+
+def record_job(entry, log_path=None, textfile_directory=None):
+    """Append a finished job to the JSONL log and refresh the Prometheus textfile"""
+    log_path = log_path or metrics_log_path()
+    textfile_directory = textfile_directory or textfile_dir()
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with _lock:
+        try:
+            # One write per record keeps lines whole with several writers
+            with open(log_path, "a", encoding='utf-8') as f:
+                f.write(line)
+            logged = True
+        except OSError:
+            logged = False  # Metrics must never fail a conversion
+        if textfile_directory:
+            if logged:
+                _sum_log(log_path)
+            else:
+                _add_to_totals(entry)
+            try:
+                write_textfile(textfile_directory)
+            except OSError:
+                pass
+
+
+def _sum_log(log_path):
+    """Add the records appended to the log since the last call (by any process) to the totals"""
+    log_path = str(log_path)
+    if _summed["path"] != log_path:
+        _totals.clear()
+        _summed.update(path=log_path, offset=0)
+    try:
+        with open(log_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < _summed["offset"]:
+                # The log was rotated or truncated: start over, as a counter reset
+                _totals.clear()
+                _summed["offset"] = 0
+            f.seek(_summed["offset"])
+            data = f.read()
+    except OSError:
+        return
+    # A line still being written by another process is read next time
+    end = data.rfind(b"\n") + 1
+    _summed["offset"] += end
+    for line in data[:end].splitlines():
+        try:
+            _add_to_totals(json.loads(line))
+        except (ValueError, KeyError, TypeError):
+            pass  # not a record
+
+
+def _add(name, labels, value):
+    if value is None:
+        return  # not measured (no psutil)
+    key = (name, tuple(sorted(labels.items())))
+    _totals[key] = _totals.get(key, 0) + value
+
+
+def _add_to_totals(entry):
+    encoder = entry.get("encoder") or "none"
+    labels = {"encoder": encoder}
+    _add("convert2ios_jobs_total", dict(labels, status=entry["status"]), 1)
+    _add("convert2ios_encode_seconds_total", labels, entry["encode_time"])
+    _add("convert2ios_probe_seconds_total", labels, entry["probe_time"])
+    _add("convert2ios_queue_wait_seconds_total", labels, entry["queue_wait"])
+    _add("convert2ios_media_seconds_total", labels, entry["media_duration"])
+    _add("convert2ios_cpu_seconds_total", dict(labels, mode="user"), entry["cpu_user"])
+    _add("convert2ios_cpu_seconds_total", dict(labels, mode="system"), entry["cpu_system"])
+    _add("convert2ios_bytes_total", dict(labels, direction="in"), entry["input_bytes"])
+    _add("convert2ios_bytes_total", dict(labels, direction="out"), entry["output_bytes"])
+    # Gauges: last finished job
+    _totals[("convert2ios_last_job_timestamp_seconds", ())] = entry["timestamp"]
+    _totals[("convert2ios_last_job_speed", (("encoder", encoder),))] = entry["speed_avg"]
+    _totals[("convert2ios_last_job_fps", (("encoder", encoder),))] = entry["fps_avg"]
+    if entry.get("peak_rss") is not None:
+        _totals[("convert2ios_last_job_peak_rss_bytes", (("encoder", encoder),))] = entry["peak_rss"]
+
+
+METRIC_HELP = {
+    "convert2ios_jobs_total": ("counter", "Finished conversion jobs"),
+    "convert2ios_encode_seconds_total": ("counter", "Wall time spent encoding"),
+    "convert2ios_probe_seconds_total": ("counter", "Wall time spent in the ffprobe preflight"),
+    "convert2ios_queue_wait_seconds_total": ("counter", "Time jobs waited for a worker"),
+    "convert2ios_media_seconds_total": ("counter", "Duration of the converted media"),
+    "convert2ios_cpu_seconds_total": ("counter", "CPU time of the ffmpeg processes"),
+    "convert2ios_bytes_total": ("counter", "Bytes read from inputs and written to outputs"),
+    "convert2ios_last_job_timestamp_seconds": ("gauge", "Unix time the last job finished"),
+    "convert2ios_last_job_speed": ("gauge", "Average realtime multiple of the last job"),
+    "convert2ios_last_job_fps": ("gauge", "Average encoded fps of the last job"),
+    "convert2ios_last_job_peak_rss_bytes": ("gauge", "Peak RSS of the last job's ffmpeg processes"),
+}
+
+
+def format_textfile():
+    """Current totals in the Prometheus text exposition format"""
+    lines = []
+    for name, (kind, help_text) in METRIC_HELP.items():
+        samples = sorted((labels, value) for (key, labels), value in _totals.items() if key == name)
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(directory):
+    """Write atomically: node-exporter must never read half a file"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, TEXTFILE_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        f.write(format_textfile())
+    os.replace(tmp_path, path)
@@ -0,0 +1,285 @@
+"""
+Resume a failed NVENC encode on the CPU from its last keyframe
+
+A long NVENC encode that fails partway (driver reset, GPU lost, a frame
+the encoder rejects) used to be started again from zero on libx264.
+Instead, a resumable encode writes NVENC's output as fragmented MP4 (one
+fragment per keyframe) into a hidden work directory, so everything written
+before a failure stays readable. When it succeeds the part is renamed to
+the output. Only jobs that asked for the fragmented layout resume: for
+them this costs nothing. Any other layout would need the part remuxed
+after every successful encode, a full extra write of every long output
+to protect the rare failure, so those encode straight into their layout
+and restart from zero.
+
+When it fails:
+
+1. the part is cut before its last complete fragment, the fragment
+   boundaries and times come from the moof/tfdt boxes,
+2. libx264 encodes the video from that point of the input to the end,
+   with NVENC's Main profile and Level 4.0 and its SPS/PPS repeated at
+   every keyframe, into MP4 with the NVENC part's timescale,
+3. the audio is encoded once in a single pass, as for chunked encodes,
+4. the NVENC and libx264 parts are joined with the concat demuxer
+   (-c copy) and the audio is muxed in. The two encoders' parameter sets
+   differ, and an `avc1` track has only those of its one sample
+   description, so the joined track is written as `avc3`: its parameter
+   sets are read in-band, where libx264 repeats its own,
+5. a few seconds across the seam are decoded to check the join.
+
+Only H.264 resumes (the CPU fallback is libx264); an HEVC encode that
+fails is started again on the CPU. Short inputs restart from zero too.
+"""
+import os
+import shutil
+import struct
+import tempfile
+
+import ios_profile
+from ffmpeg_caps import ffmpeg_binary
+from ffmpeg_progress import PROGRESS_ARGS
+from segmented import audio_command, join_command, write_concat_list
+from verify import decode_sample
+
+
+# Inputs shorter than this (seconds) restart from zero if NVENC fails
+RESUME_MIN_DURATION = 300
+SEAM_CHECK_SECONDS = 1.0  # decoded on each side of the seam
+
+
+def resumable(job, plan, vcodec):
+    """
+    A long single-output H.264 NVENC encode into the fragmented layout
+    (chunked encodes go through SegmentedEncoder)
+    """
+    return (vcodec == "h264_nvenc" and job.moov_mode == ios_profile.MOOV_FRAGMENTED
+            and not job.renditions and plan is not None and plan.video_index is not None
+            and plan.duration >= RESUME_MIN_DURATION)
+
+
+# Fragmented MP4 boxes
+
+def _boxes(f, start, end):
+    """(type, offset, header size, size) of the boxes between `start` and `end`"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset  # runs to the end of the file
+        if size < header:
+            return
+        yield kind, offset, header, size
+        offset += size
+
+
+def _find(f, start, end, kind):
+    """(body start, end) of the first `kind` box between `start` and `end`, or None"""
+    for found, offset, header, size in _boxes(f, start, end):
+        if found == kind:
+            return offset + header, offset + size
+    return None
+
+
+def _full_box_field(f, body, fields):
+    """Read a field of a versioned box; `fields` maps version -> (offset, struct format)"""
+    f.seek(body)
+    offset, fmt = fields[1 if f.read(1)[0] == 1 else 0]
+    f.seek(body + offset)
+    return struct.unpack(fmt, f.read(struct.calcsize(fmt)))[0]
+
+
+def _video_track(f, start, end):
+    """(track id, timescale) of the first video track of a moov, or None"""
+    for kind, offset, header, size in _boxes(f, start, end):
+        if kind != b"trak":
+            continue
+        tkhd = _find(f, offset + header, offset + size, b"tkhd")
+        mdia = _find(f, offset + header, offset + size, b"mdia")
+        if tkhd is None or mdia is None:
+            continue
+        hdlr, mdhd = _find(f, *mdia, b"hdlr"), _find(f, *mdia, b"mdhd")
+        if hdlr is None or mdhd is None:
+            continue
+        f.seek(hdlr[0] + 8)
+        if f.read(4) != b"vide":
+            continue
+        track_id = _full_box_field(f, tkhd[0], {0: (12, ">I"), 1: (20, ">I")})
+        timescale = _full_box_field(f, mdhd[0], {0: (12, ">I"), 1: (20, ">I")})
+        return track_id, timescale
+    return None
+
+
+def _track_fragment(f, start, end, track_id):
+    """{box type: (body start, end)} of the boxes in the traf of `track_id` in one moof, or None"""
+    for kind, offset, header, size in _boxes(f, start, end):
+        if kind != b"traf":
+            continue
+        boxes = {found: (box + box_header, box + box_size) for found, box, box_header, box_size
+                 in _boxes(f, offset + header, offset + size)}
+        if b"tfhd" in boxes:
+            f.seek(boxes[b"tfhd"][0] + 4)
+            if struct.unpack(">I", f.read(4))[0] == track_id:
+                return boxes
+    return None
+
+
+def _decode_time(f, traf):
+    """baseMediaDecodeTime of a traf, or None"""
+    if b"tfdt" not in traf:
+        return None
+    return _full_box_field(f, traf[b"tfdt"][0], {0: (4, ">I"), 1: (4, ">Q")})
+
+
+def _first_sample_stretch(f, traf):
+    """
+    Ticks the first sample of a traf lasts longer than the second one.
+
+    A fragmented MP4 starts every track at 0. When ffmpeg moved the video
+    later to make room for an earlier start (the AAC encoder's priming
+    samples, B-frame delay), the first video sample is stretched by that
+    much and every later sample is that much later than in the input.
+    """
+    if b"trun" not in traf:
+        return 0
+    f.seek(traf[b"trun"][0])
+    flags, count = struct.unpack(">II", f.read(8))
+    if not flags & 0x100 or count < 2:
+        return 0  # No per-sample durations: all the same
+    # data_offset and first_sample_flags, then duration/size/flags/composition offset per sample
+    f.seek(4 * bool(flags & 0x001) + 4 * bool(flags & 0x004), os.SEEK_CUR)
+    stride = 4 * sum(1 for bit in (0x100, 0x200, 0x400, 0x800) if flags & bit)
+    first = struct.unpack(">I", f.read(4))[0]
+    f.seek(stride - 4, os.SEEK_CUR)
+    second = struct.unpack(">I", f.read(4))[0]
+    return max(0, first - second)
+
+
+def complete_fragments(path):
+    """
+    (video timescale, [(moof offset, video decode time)], first sample
+    stretch) of the fragments whose moof and mdat were both written
+    completely; the stretch (see _first_sample_stretch()) is the first one's
+    """
+    file_size = os.path.getsize(path)
+    track, fragments, moof, stretch = None, [], None, 0
+    with open(path, "rb") as f:
+        for kind, offset, header, size in _boxes(f, 0, file_size):
+            if offset + size > file_size:
+                break  # cut off by the failure
+            if kind == b"moov":
+                track = _video_track(f, offset + header, offset + size)
+            elif kind == b"moof" and track is not None:
+                traf = _track_fragment(f, offset + header, offset + size, track[0])
+                moof = (offset, traf)
+            elif kind == b"mdat" and moof is not None:
+                traf = moof[1]
+                decode_time = _decode_time(f, traf) if traf is not None else None
+                if decode_time is not None:
+                    if not fragments:
+                        stretch = _first_sample_stretch(f, traf)
+                    fragments.append((moof[0], decode_time))
+                moof = None
+    return (track[1] if track else 0), fragments, stretch
+
+
+def resume_point(path):
+    """
+    Cut a partial fragmented MP4 before its last complete fragment and
+    return (start, end, timescale, shift); None if nothing usable was
+    written. `start` and `end` bound the video that is kept, in seconds of
+    the part's timeline, which runs `shift` seconds behind the input after
+    the first frame. The last complete fragment is dropped too: its decode
+    time is where the kept video ends, without adding up sample durations.
+    """
+    try:
+        timescale, fragments, stretch = complete_fragments(path)
+    except (OSError, struct.error, IndexError):
+        return None
+    if len(fragments) < 2 or not timescale:
+        return None
+    cut, end_time = fragments[-1]
+    os.truncate(path, cut)
+    return fragments[0][1] / timescale, end_time / timescale, timescale, stretch / timescale
+
+
+class ResumableEncode:
+    """Work files and ffmpeg commands of one resumable encode"""
+
+    def __init__(self, job, plan):
+        self.job = job
+        self.plan = plan
+        output_dir = os.path.dirname(os.path.abspath(job.target_file))
+        self.work_dir = tempfile.mkdtemp(prefix=".convert2ios_", dir=output_dir)
+        self.gpu_part = os.path.join(self.work_dir, f"gpu.{job.output_format}")
+        self.cpu_part = os.path.join(self.work_dir, "cpu.mp4")
+        self.audio_part = os.path.join(self.work_dir, "audio.mka")
+        self.kept = None    # (start, end) of the NVENC part after a failure
+        self.timescale = 0  # of the NVENC part's video track
+        self.shift = 0.0    # how much later than the input its frames are
+
+    @property
+    def done_seconds(self):
+        """Seconds of video the NVENC part still holds"""
+        return self.kept[1] - self.kept[0] if self.kept else 0.0
+
+    def finish(self):
+        """The NVENC part succeeded: it is the output (blocking)"""
+        os.replace(self.gpu_part, self.job.target_file)
+
+    def cut(self):
+        """Keep the complete fragments of a failed NVENC part; False if there is nothing to resume"""
+        point = resume_point(self.gpu_part) if os.path.exists(self.gpu_part) else None
+        if point is None:
+            return False
+        self.kept, self.timescale, self.shift = point[:2], point[2], point[3]
+        return True
+
+    def continuation_command(self, threads=0):
+        """libx264 for the rest of the video, with NVENC's profile/level and in-band SPS/PPS"""
+        settings = ios_profile.video_settings("libx264", self.job.preset, threads)
+        settings[settings.index("-profile:v") + 1] = "main"
+        settings[settings.index("-level") + 1] = "4.0"
+        # Input seeking with a re-encode is frame exact: start on the first frame not kept
+        start = self.plan.video_start - self.plan.start_time + self.done_seconds - self.shift
+        return [ffmpeg_binary(), "-hide_banner", "-v", "error"] + PROGRESS_ARGS + [
+            "-fflags", "+genpts+discardcorrupt",
+            "-ss", f"{start:.6f}",
+            "-i", self.job.source_file,
+            "-map", f"0:{self.plan.video_index}",
+            "-c:v", "libx264",
+        ] + settings + [
+            "-bsf:v", "dump_extra=freq=keyframe",
+            "-tag:v", "avc3",
+            "-an",
+            "-video_track_timescale", str(self.timescale),
+            "-f", "mp4",
+            "-y", self.cpu_part,
+        ]
+
+    def audio_command(self):
+        return audio_command(self.job.source_file, self.plan,
+                             self.job.smart_copy and self.plan.copy_audio, self.audio_part)
+
+    def join_command(self):
+        """NVENC part up to the cut, then the libx264 part, plus the audio"""
+        list_file = os.path.join(self.work_dir, "concat.txt")
+        start, end = self.kept
+        write_concat_list(list_file, [(self.gpu_part, start, end), (self.cpu_part, None, None)])
+        has_audio = self.plan.audio_index is not None
+        return join_command(list_file, self.audio_part if has_audio else None, self.plan,
+                            "libx264", self.job.target_file, self.job.output_format,
+                            self.job.moov_mode, video_tag="avc3")
+
+    def check_seam(self):
+        """None if the joined output decodes across the seam, otherwise the errors (blocking)"""
+        seam = self.kept[1] - self.kept[0]
+        start = max(0.0, seam - SEAM_CHECK_SECONDS)
+        return decode_sample(self.job.target_file, start, seam + SEAM_CHECK_SECONDS - start)
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
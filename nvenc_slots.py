@@ -0,0 +1,88 @@
+"""
+NVENC encode sessions as a countable resource
+
+Consumer NVIDIA cards accept only a few NVENC sessions at once (3 on older
+GeForce drivers, 5 or 8 on newer ones). One more session fails to open and
+ffmpeg exits with an error. The conversion engine takes slots from
+NvencSlots before it starts an NVENC encode: one per encoder the ffmpeg
+opens (a chunk, a rendition). A job that finds no free slot is encoded
+with libx264 instead of failing. Slots are returned when the encode ends,
+and the next job that starts takes them, so queued work goes back to NVENC
+by itself.
+
+The count is the `sessions` argument, CONVERT2IOS_NVENC_SESSIONS, or
+DEFAULT_SESSIONS. If ffmpeg still cannot open a session (another program
+holds some), the count is lowered to what was in use at that moment; at 0
+the next jobs are encoded with libx264. Whatever held the sessions may let
+them go, so every RESTORE_AFTER seconds without another refusal the count
+goes back up by one, until it reaches the configured one again.
+
+Used on the engine's loop thread only, so there is no locking.
+"""
+import os
+import time
+
+
+DEFAULT_SESSIONS = 3
+SESSIONS_ENV = "CONVERT2IOS_NVENC_SESSIONS"
+RESTORE_AFTER = 300  # seconds after a refused session before one more is tried
+# ffmpeg stderr when the driver refused a new encode session
+SESSION_ERRORS = ("openencodesessionex failed",)
+
+
+def configured_sessions():
+    """Session count from the environment, DEFAULT_SESSIONS if unset or invalid"""
+    try:
+        return max(0, int(os.environ.get(SESSIONS_ENV, DEFAULT_SESSIONS)))
+    except ValueError:
+        return DEFAULT_SESSIONS
+
+
+def is_session_error(lines):
+    """True if ffmpeg's stderr says an NVENC session could not be opened"""
+    return any(error in line.lower() for line in lines for error in SESSION_ERRORS)
+
+
+class NvencSlots:
+    """Free/used NVENC sessions of this machine"""
+
+    def __init__(self, sessions=None, clock=time.monotonic):
+        self.configured = configured_sessions() if sessions is None else max(0, sessions)
+        self.total = self.configured
+        self.in_use = 0
+        self._clock = clock
+        self._lowered_at = None
+
+    @property
+    def free(self):
+        self._restore()
+        return max(0, self.total - self.in_use)
+
+    def _restore(self):
+        """One session more once RESTORE_AFTER has passed since the count was last changed"""
+        if self._lowered_at is None or self._clock() - self._lowered_at < RESTORE_AFTER:
+            return
+        self.total += 1
+        self._lowered_at = None if self.total >= self.configured else self._clock()
+
+    def acquire(self, count=1, partial=False):
+        """
+        Take `count` slots and return how many were taken: `count` or 0, or
+        with `partial` as many as are free (a chunked encode runs fewer
+        chunks at a time).
+        """
+        granted = min(count, self.free) if partial else (count if count <= self.free else 0)
+        self.in_use += granted
+        return granted
+
+    def release(self, count):
+        self.in_use = max(0, self.in_use - count)
+
+    def limit_reached(self, count):
+        """
+        ffmpeg could not open one of `count` sessions just taken: the real
+        limit is at most what else was in use (0 if nothing else was: no
+        NVENC session can be opened at all)
+        """
+        self.total = max(0, min(self.total, self.in_use - count))
+        self._lowered_at = self._clock()
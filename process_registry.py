@@ -0,0 +1,257 @@
+"""
+Registry of the ffmpeg/ffprobe processes started by this app
+
+Every helper process (conversions, segment/encode/join helpers, ffprobe,
+calibration runs) is started through spawn() or run(). Each one gets its own
+process group and is recorded here, together with a small pidfile in the
+app data directory, so that stop, close and "release locks" can signal
+exactly these processes at once instead of sweeping every ffmpeg on the
+machine. kill_ffmpeg.py reads the pidfiles to clean up after a crash.
+
+The conversion engine starts ffmpeg as asyncio subprocesses with
+spawn_async(); those are registered as AsyncProcess handles, which behave
+like a Popen for everything here.
+"""
+import atexit
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from app_paths import app_data_dir
+
+
+PID_DIR = "pids"
+STOP_TIMEOUT = 0.5
+
+_lock = threading.Lock()
+_processes = {}   # pid -> Popen
+
+
+def _group_kwargs():
+    """Start each helper as the leader of a new process group"""
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def pidfile_dir():
+    path = app_data_dir() / PID_DIR
+    path.mkdir(exist_ok=True)
+    return path
+
+
+def _pidfile():
+    return pidfile_dir() / f"{os.getpid()}.json"
+
+
+def _save_pidfile():
+    """Persist the live PIDs of this app instance (called with _lock held)"""
+    entries = {str(pid): {"pid": pid, "command": os.path.basename(process.args[0]),
+                          "started": getattr(process, "started", 0)}
+               for pid, process in _processes.items()}
+    path = _pidfile()
+    try:
+        if not entries:
+            if path.exists():
+                path.unlink()
+            return
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "w", encoding='utf-8') as f:
+            json.dump({"owner": os.getpid(), "processes": entries}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # The in-memory registry still works
+
+
+def _prune():
+    """Forget processes that have exited (called with _lock held)"""
+    finished = [pid for pid, process in _processes.items() if process.poll() is not None]
+    for pid in finished:
+        del _processes[pid]
+    return bool(finished)
+
+
+def _cleanup_at_exit():
+    """Remove this instance's pidfile on a clean exit once all helpers are gone"""
+    with _lock:
+        if _processes:
+            _prune()
+            _save_pidfile()
+
+
+atexit.register(_cleanup_at_exit)
+
+
+def _register(process):
+    process.started = time.time()
+    with _lock:
+        _prune()
+        _processes[process.pid] = process
+        _save_pidfile()
+    return process
+
+
+def spawn(command, **kwargs):
+    """subprocess.Popen() that registers the process"""
+    return _register(subprocess.Popen(command, **_group_kwargs(), **kwargs))
+
+
+class AsyncProcess:
+    """
+    Popen-like handle of an asyncio subprocess.
+
+    The event loop awaits `aio.wait()` and reads `stdout`/`stderr`; other
+    threads (registry, stop buttons, metrics) use pid, poll(), terminate(),
+    kill() and wait() as on a Popen. The loop sets the return code when the
+    child exits, so wait() from another thread only polls it.
+    """
+
+    def __init__(self, process, args):
+        self.aio = process
+        self.pid = process.pid
+        self.args = args
+        self.stdout = process.stdout
+        self.stderr = process.stderr
+
+    @property
+    def returncode(self):
+        return self.aio.returncode
+
+    def poll(self):
+        return self.aio.returncode
+
+    def terminate(self):
+        try:
+            self.aio.terminate()
+        except ProcessLookupError:
+            pass
+
+    def kill(self):
+        try:
+            self.aio.kill()
+        except ProcessLookupError:
+            pass
+
+    def wait(self, timeout=None):
+        """Block until the loop has seen the exit; never call this on the loop thread"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.aio.returncode is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(0.01)
+        return self.aio.returncode
+
+
+async def spawn_async(command, **kwargs):
+    """asyncio.create_subprocess_exec() that registers the process, returns an AsyncProcess"""
+    import asyncio  # Only the conversion engine's loop needs it
+    process = await asyncio.create_subprocess_exec(*command, **_group_kwargs(), **kwargs)
+    return _register(AsyncProcess(process, command))
+
+
+def run(command, **kwargs):
+    """subprocess.run() for short helpers (ffprobe etc.), tracked while they run"""
+    if kwargs.pop("capture_output", False):
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    text = kwargs.pop("text", False)
+    encoding = kwargs.pop("encoding", None)
+    errors = kwargs.pop("errors", None)
+    if text or encoding or errors:
+        kwargs.update(text=True, encoding=encoding or 'utf-8', errors=errors or 'strict')
+    process = spawn(command, **kwargs)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        release(process)
+    return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+
+
+def release(process):
+    """Drop a finished process from the registry"""
+    with _lock:
+        if _processes.pop(process.pid, None) is not None:
+            _save_pidfile()
+
+
+def tracked():
+    """Processes started by this app that are still running"""
+    with _lock:
+        if _prune():
+            _save_pidfile()
+        return list(_processes.values())
+
+
+def _signal(process, force):
+    """Signal the whole process group of one helper, never blocks"""
+    if process.returncode is not None:
+        return  # Already reaped, the PID may belong to someone else now
+    try:
+        if sys.platform == "win32":
+            if force:
+                process.kill()
+            else:
+                process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+def stop_all(timeout=STOP_TIMEOUT):
+    """
+    Terminate every tracked process group at once, kill the ones still
+    alive after `timeout` seconds. Returns the number of processes stopped.
+    """
+    processes = tracked()
+    for process in processes:
+        _signal(process, force=False)
+
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            pass
+
+    survivors = [process for process in processes if process.poll() is None]
+    for process in survivors:
+        _signal(process, force=True)
+    for process in survivors:
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+    tracked()  # prune and refresh the pidfile
+    return len(processes)
+
+
+def kill_all():
+    """Kill every tracked process group immediately (used to release file locks)"""
+    processes = tracked()
+    for process in processes:
+        _signal(process, force=True)
+    for process in processes:
+        try:
+            process.wait(timeout=STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            pass
+    tracked()
+    return len(processes)
+
+
+def read_pidfiles():
+    """(pidfile path, owner pid, process entries) of every app instance that left a pidfile"""
+    result = []
+    for path in sorted(pidfile_dir().glob("*.json")):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            result.append((path, data["owner"], list(data["processes"].values())))
+        except (OSError, ValueError, KeyError):
+            continue
+    return result
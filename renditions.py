@@ -0,0 +1,265 @@
+"""
+Multi-rendition output: one decode, several encodes (a bitrate ladder)
+
+Instead of running one job per size (1080p, 720p, 480p...), which decodes
+the source once per size, a single ffmpeg decodes it once and a
+split/scale filter graph feeds one encoder per rendition. Every rendition
+shares the same frames and GOP settings, so their keyframes line up.
+
+Outputs are either separate files (the largest keeps the output name, the
+others get a _720p style suffix) or an HLS VOD stream with fMP4 segments:
+one media playlist per rendition next to a master playlist, which iOS
+Safari and AVPlayer play natively.
+"""
+import glob
+import math
+import os
+
+from ffmpeg_caps import ffmpeg_binary
+from ffmpeg_progress import PROGRESS_ARGS
+from ios_profile import AUDIO_SETTINGS, MOOV_FASTSTART, container_settings, video_settings
+
+
+# name -> (height, bitrate, bufsize, libx264 profile, lowest level). NVENC keeps its
+# Main profile. The level is raised when the frame rate needs it (rendition_level()).
+RENDITIONS = {
+    "1080p": (1080, "5M", "10M", "main", "4.0"),
+    "720p": (720, "3M", "6M", "main", "3.1"),
+    "480p": (480, "1500k", "3M", "baseline", "3.1"),
+    "360p": (360, "800k", "1600k", "baseline", "3.0"),
+}
+DEFAULT_LADDER = ("1080p", "720p", "480p")
+
+HLS_MASTER_PLAYLIST = "master.m3u8"
+HLS_SEGMENT_SECONDS = 6
+AUDIO_BANDWIDTH = 128000  # AUDIO_SETTINGS bitrate
+# CODECS attribute prefixes (profile_idc + constraint flags) for the master playlist
+AVC_CODEC_TAGS = {"baseline": "avc1.42e0", "main": "avc1.4d40", "high": "avc1.6400"}
+HEVC_CODEC_TAG = "hvc1.1.6.L{level}.90"  # Main, level * 30
+AAC_CODEC_TAG = "mp4a.40.2"
+
+# H.264 levels (Table A-1): (level, max macroblocks per second, max frame size in macroblocks)
+H264_LEVELS = [
+    ("3.0", 40500, 1620), ("3.1", 108000, 3600), ("3.2", 216000, 5120), ("4.0", 245760, 8192),
+    ("4.1", 245760, 8192), ("4.2", 522240, 8704), ("5.0", 589824, 22080), ("5.1", 983040, 36864),
+    ("5.2", 2073600, 36864),
+]
+# HEVC levels (Table A.8): (level, max luma samples per second, max luma picture size)
+HEVC_LEVELS = [
+    ("3.0", 16588800, 552960), ("3.1", 33177600, 983040), ("4.0", 66846720, 2228224),
+    ("4.1", 133693440, 2228224), ("5.0", 267386880, 8912896), ("5.1", 534773760, 8912896),
+    ("5.2", 1069547520, 8912896),
+]
+LADDER_FRAME_RATE = 30.0  # assumed when the source's frame rate is unknown
+
+
+def parse_ladder(text):
+    """Rendition names from "1080p,720p" (or a list), checked against RENDITIONS"""
+    names = text.replace(",", " ").split() if isinstance(text, str) else list(text)
+    unknown = [name for name in names if name not in RENDITIONS]
+    if unknown:
+        raise ValueError(f"ไม่รู้จัก rendition: {', '.join(unknown)} "
+                         f"(ใช้ได้: {', '.join(RENDITIONS)})")
+    return list(dict.fromkeys(names))
+
+
+def pick_renditions(names, source_height=0):
+    """Requested renditions from largest to smallest, without upscaling the source"""
+    ordered = sorted(names, key=lambda name: RENDITIONS[name][0], reverse=True)
+    if not source_height:
+        return ordered
+    fitting = [name for name in ordered if RENDITIONS[name][0] <= source_height]
+    return fitting or ordered[-1:]
+
+
+def rendition_size(name, plan=None):
+    """(width, height) of a rendition; width None if the source size is unknown"""
+    height = RENDITIONS[name][0]
+    if plan is None or not plan.width or not plan.height:
+        return None, height
+    # Keep the aspect ratio, rounded to the even width H.264 needs
+    return max(2, round(plan.width * height / plan.height / 2) * 2), height
+
+
+def _bits(rate):
+    """Bits per second from an ffmpeg rate such as "5M" or "1500k" """
+    multiplier = {"k": 1000, "M": 1000000}.get(rate[-1], 1)
+    return int(float(rate.rstrip("kM")) * multiplier)
+
+
+def hls_output_path(output_file):
+    """Master playlist for an output file name: movie.mp4 -> movie/master.m3u8"""
+    if output_file.endswith(".m3u8"):
+        return output_file
+    return os.path.join(os.path.splitext(output_file)[0], HLS_MASTER_PLAYLIST)
+
+
+def output_paths(output_file, names, hls=False):
+    """[(name, path)]: media playlists for HLS, otherwise one file per rendition"""
+    if hls:
+        directory = os.path.dirname(output_file)
+        return [(name, os.path.join(directory, f"{name}.m3u8")) for name in names]
+    stem, ext = os.path.splitext(output_file)
+    return [(name, output_file if i == 0 else f"{stem}_{name}{ext}")
+            for i, name in enumerate(names)]
+
+
+def output_files(output_file, names, hls=False):
+    """Every file a ladder wrote: outputs, plus the master playlist, init and segments for HLS"""
+    files = [path for _, path in output_paths(output_file, names, hls)]
+    if hls:
+        directory = os.path.dirname(output_file)
+        for name in names:
+            files += sorted(glob.glob(os.path.join(glob.escape(directory), f"{name}_*")))
+        files.append(output_file)
+    return [path for path in files if os.path.exists(path)]
+
+
+def rendition_threads(names, threads):
+    """Split a libx264 thread budget between renditions by pixel count (0 = ffmpeg default)"""
+    if not threads:
+        return [0] * len(names)
+    weights = [RENDITIONS[name][0] ** 2 for name in names]
+    return [max(1, round(threads * weight / sum(weights))) for weight in weights]
+
+
+def rendition_level(vcodec, name, plan=None):
+    """
+    Lowest level (not below the rendition's own for H.264) whose frame size
+    and rate limits fit the rendition at the source frame rate: 1080p60 needs
+    H.264 level 4.2, where 1080p30 fits 4.0.
+    """
+    width, height = rendition_size(name, plan)
+    width = width or round(height * 16 / 9 / 2) * 2
+    frame_rate = plan.frame_rate if plan is not None and plan.frame_rate else LADDER_FRAME_RATE
+    if "hevc" in vcodec:
+        levels, lowest, size = HEVC_LEVELS, HEVC_LEVELS[0][0], width * height
+    else:
+        levels, lowest = H264_LEVELS, RENDITIONS[name][4]
+        size = math.ceil(width / 16) * math.ceil(height / 16)
+    for level, max_rate, max_size in levels:
+        if float(level) >= float(lowest) and size <= max_size and size * frame_rate <= max_rate:
+            return level
+    return levels[-1][0]
+
+
+def rendition_video_settings(vcodec, name, preset=None, threads=0, plan=None):
+    """
+    video_settings() with the rendition's bitrate and level (see
+    rendition_level()), and its profile for libx264
+    """
+    _, bitrate, bufsize, profile, _ = RENDITIONS[name]
+    settings = video_settings(vcodec, preset, threads)
+    level_option = "-level:v" if "-level:v" in settings else "-level"
+    values = {"-b:v": bitrate, "-maxrate": bitrate, "-bufsize": bufsize,
+              level_option: rendition_level(vcodec, name, plan)}
+    if vcodec == "libx264":
+        values["-profile:v"] = profile
+    for option, value in values.items():
+        settings[settings.index(option) + 1] = value
+    if vcodec == "hevc_nvenc":
+        settings += ["-tag:v", "hvc1"]  # iOS only plays HEVC tagged as hvc1
+    return settings
+
+
+def filter_graph(names, plan=None):
+    """split the decoded video once, then scale one branch per rendition"""
+    source = f"[0:{plan.video_index}]" if plan is not None and plan.video_index is not None else "[0:v:0]"
+    branches = "".join(f"[s{i}]" for i in range(len(names)))
+    graph = [f"{source}split={len(names)}{branches}"]
+    for i, name in enumerate(names):
+        width, height = rendition_size(name, plan)
+        graph.append(f"[s{i}]scale={width or -2}:{height}[v{i}]")
+    return ";".join(graph)
+
+
+def hls_settings(name, playlist):
+    """HLS VOD muxer with fMP4 segments for one rendition"""
+    directory = os.path.dirname(playlist)
+    return [
+        "-f", "hls",
+        "-hls_segment_type", "fmp4",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_fmp4_init_filename", f"{name}_init.mp4",
+        "-hls_segment_filename", os.path.join(directory, f"{name}_%05d.m4s"),
+        "-y", playlist,
+    ]
+
+
+def build_command(input_file, output_file, vcodec, names, output_format="mp4", plan=None,
+                  hls=False, progress=True, preset=None, copy_audio=False,
+                  moov_mode=MOOV_FASTSTART, duration=0.0, frame_rate=0.0, threads=0):
+    """
+    ffmpeg command that decodes `input_file` once and writes every rendition
+    in `names` (largest first, see pick_renditions()). For HLS `output_file`
+    is the master playlist; it is written by write_master_playlist() once
+    ffmpeg has finished. A libx264 `threads` budget is shared by the encoders.
+    """
+    command = [ffmpeg_binary(), "-hide_banner"]
+    if progress:
+        command += PROGRESS_ARGS
+    command += [
+        "-fflags", "+genpts+discardcorrupt",
+        "-i", input_file,
+        "-filter_complex", filter_graph(names, plan),
+    ]
+
+    if plan is not None and plan.audio_index is None:
+        audio_map, audio = [], ["-an"]
+    else:
+        audio_map = ["-map", f"0:{plan.audio_index}" if plan is not None else "0:a:0?"]
+        audio = (["-c:a", "copy", "-bsf:a", "aac_adtstoasc"] if copy_audio and plan is not None
+                 else AUDIO_SETTINGS)
+
+    if plan is not None:
+        duration, frame_rate = duration or plan.duration, frame_rate or plan.frame_rate
+    encoder_threads = rendition_threads(names, threads)
+    for i, (name, path) in enumerate(output_paths(output_file, names, hls)):
+        command += ["-map", f"[v{i}]"] + audio_map
+        command += (["-c:v", vcodec]
+                    + rendition_video_settings(vcodec, name, preset, encoder_threads[i], plan)
+                    + audio)
+        if hls:
+            command += hls_settings(name, path)
+        else:
+            command += container_settings(path, output_format, moov_mode, duration, frame_rate)
+    return command
+
+
+def codecs_attribute(vcodec, name, has_audio=True, plan=None):
+    """RFC 8216 CODECS value of a rendition, e.g. "avc1.4d4028,mp4a.40.2" """
+    level = float(rendition_level(vcodec, name, plan))
+    if vcodec == "hevc_nvenc":
+        video = HEVC_CODEC_TAG.format(level=int(round(level * 30)))
+    else:
+        profile = "main" if "nvenc" in vcodec else RENDITIONS[name][3]
+        video = f"{AVC_CODEC_TAGS[profile]}{int(round(level * 10)):02x}"
+    return f"{video},{AAC_CODEC_TAG}" if has_audio else video
+
+
+def master_playlist(output_file, names, vcodec, plan=None):
+    """Text of the HLS master playlist that lists every rendition"""
+    has_audio = plan is None or plan.audio_index is not None
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for name, path in output_paths(output_file, names, hls=True):
+        bandwidth = _bits(RENDITIONS[name][1]) + (AUDIO_BANDWIDTH if has_audio else 0)
+        attributes = [f"BANDWIDTH={int(bandwidth * 1.1)}"]  # peak, with container overhead
+        width, height = rendition_size(name, plan)
+        if width:
+            attributes.append(f"RESOLUTION={width}x{height}")
+        if plan is not None and plan.frame_rate:
+            attributes.append(f"FRAME-RATE={plan.frame_rate:.3f}")
+        attributes.append(f'CODECS="{codecs_attribute(vcodec, name, has_audio, plan)}"')
+        lines.append("#EXT-X-STREAM-INF:" + ",".join(attributes))
+        lines.append(os.path.basename(path))
+    return "\n".join(lines) + "\n"
+
+
+def write_master_playlist(output_file, names, vcodec, plan=None):
+    """Write atomically: a player must never read half a playlist"""
+    tmp_path = f"{output_file}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        f.write(master_playlist(output_file, names, vcodec, plan))
+    os.replace(tmp_path, output_file)
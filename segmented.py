@@ -0,0 +1,322 @@
+"""
+Keyframe-segmented parallel encoding of a single long input
+
+One libx264 process cannot use a big machine fully, and one NVENC job only
+uses one encoder session. This mode:
+
+1. splits the video stream losslessly at keyframes into N pieces
+   (segment muxer with -c copy, so every piece starts on a keyframe),
+2. encodes the pieces concurrently with the same iOS settings as a normal
+   conversion, while the audio is encoded once in a single pass so it has
+   no priming gaps at the seams,
+3. joins the encoded pieces with the concat demuxer and muxes the audio
+   back in with -c copy, giving one MP4/MOV/M4V with the moov up front.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ios_profile
+import process_registry
+from ffmpeg_caps import ffmpeg_binary
+from ffmpeg_progress import PROGRESS_ARGS, read_progress
+
+
+def default_chunk_count():
+    return os.cpu_count() or 1
+
+
+def split_times(duration, chunks):
+    """Evenly spaced cut requests; the segment muxer moves each to the next keyframe"""
+    if chunks < 2 or duration <= 0:
+        return []
+    step = duration / chunks
+    return [round(step * i, 3) for i in range(1, chunks)]
+
+
+def audio_command(input_file, plan, copy_audio, output_file):
+    """Encode (or copy) the whole audio track once into mka, aligned to the video start"""
+    command = [ffmpeg_binary(), "-hide_banner", "-v", "error", "-fflags", "+genpts+discardcorrupt"]
+    # Audio that starts before the video is trimmed so both start together
+    lead = plan.video_start - plan.audio_start
+    if lead > 0:
+        command += ["-ss", f"{plan.video_start - plan.start_time:.6f}"]
+    command += ["-i", input_file, "-map", f"0:{plan.audio_index}", "-vn"]
+    if copy_audio:
+        command += ["-c:a", "copy", "-bsf:a", "aac_adtstoasc"]
+    else:
+        command += ios_profile.AUDIO_SETTINGS
+    return command + ["-f", "matroska", "-y", output_file]
+
+
+def write_concat_list(list_file, parts):
+    """concat demuxer list of (path, inpoint, outpoint) next to the parts; None = whole file"""
+    with open(list_file, "w", encoding='utf-8') as f:
+        for path, inpoint, outpoint in parts:
+            f.write(f"file '{os.path.basename(path)}'\n")
+            if inpoint is not None:
+                f.write(f"inpoint {inpoint:.6f}\n")
+            if outpoint is not None:
+                f.write(f"outpoint {outpoint:.6f}\n")
+
+
+def join_command(list_file, audio_file, plan, vcodec, output_file, output_format,
+                 moov_mode=ios_profile.MOOV_FASTSTART, video_tag=None):
+    """
+    Concatenate the video parts of `list_file` with -c copy and mux
+    `audio_file` (or None) in, with the `video_tag` sample entry if given
+    """
+    command = [ffmpeg_binary(), "-hide_banner", "-v", "error",
+               "-f", "concat", "-safe", "0", "-i", list_file]
+    if audio_file:
+        # Audio that starts after the video keeps its original offset
+        delay = plan.audio_start - plan.video_start
+        if delay > 0:
+            command += ["-itsoffset", f"{delay:.6f}"]
+        command += ["-i", audio_file, "-map", "0:v:0", "-map", "1:a:0"]
+    else:
+        command += ["-map", "0:v:0"]
+    command += ["-c", "copy"]
+    if "hevc" in vcodec:
+        video_tag = "hvc1"  # iOS only plays HEVC tagged as hvc1
+    if video_tag:
+        command += ["-tag:v", video_tag]
+    return command + ios_profile.container_settings(output_file, output_format, moov_mode,
+                                                    plan.duration, plan.frame_rate)
+
+
+class SegmentedEncoder:
+    """
+    Encode `input_file` in parallel chunks.
+
+    `plan` is the ConversionPlan of the input (stream indexes, duration and
+    start times). `log(message)` and `on_progress(seconds_done, speed)` are
+    called from worker threads. With `log_file` (job_logs.JobLog) the whole
+    stderr of every helper ffmpeg is written to it. `threads` caps the
+    libx264 threads of each piece, so `workers` pieces fit a share of the cores;
+    `on_spawn(process)` is called for every helper ffmpeg that starts.
+
+    The object also offers poll()/terminate()/kill()/wait() like a Popen,
+    so a job queue can cancel it the same way as a single ffmpeg process.
+    """
+
+    def __init__(self, input_file, output_file, vcodec, plan, output_format="mp4",
+                 chunks=None, workers=None, copy_audio=False, log=print, on_progress=None,
+                 preset=None, moov_mode=ios_profile.MOOV_FASTSTART, log_file=None, threads=0,
+                 on_spawn=None):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.vcodec = vcodec
+        self.plan = plan
+        self.output_format = output_format
+        self.chunks = max(1, chunks or default_chunk_count())
+        self.workers = max(1, workers or self.chunks)
+        self.copy_audio = copy_audio and plan.copy_audio
+        self.log = log
+        self.on_progress = on_progress
+        self.preset = preset
+        self.moov_mode = moov_mode
+        self.log_file = log_file
+        self.threads = threads  # libx264 threads of each piece (0 = ffmpeg default)
+        self.on_spawn = on_spawn
+
+        self.returncode = None
+        self._cancelled = False
+        self._failed = False
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._done_event = threading.Event()
+        self._piece_times = {}
+        self._piece_speeds = {}
+
+    # Popen-like interface used for cancellation
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self._cancelled = True
+        self._stop_all()
+
+    def _stop_all(self):
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def kill(self):
+        self._cancelled = True
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+
+    def pids(self):
+        """PIDs of the helper ffmpeg processes running right now"""
+        with self._lock:
+            return [process.pid for process in self._processes]
+
+    def wait(self, timeout=None):
+        if not self._done_event.wait(timeout):
+            raise subprocess.TimeoutExpired("segmented encode", timeout)
+        return self.returncode
+
+    # Encoding
+
+    def run(self):
+        """Run the whole split/encode/join pipeline, return True on success"""
+        output_dir = os.path.dirname(os.path.abspath(self.output_file))
+        work_dir = tempfile.mkdtemp(prefix=".convert2ios_", dir=output_dir)
+        try:
+            success = self._run(work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            self.returncode = 0 if success else (-1 if self._cancelled else 1)
+            self._done_event.set()
+        return success
+
+    def _run(self, work_dir):
+        has_audio = self.plan.audio_index is not None
+        # Audio does not depend on the split, start it right away on a thread of its own
+        # so all `workers` (NVENC sessions, cores) are left to the pieces
+        with ThreadPoolExecutor(max_workers=1) as audio_pool, \
+                ThreadPoolExecutor(max_workers=self.workers) as pool:
+            audio_future = audio_pool.submit(self._encode_audio, work_dir) if has_audio else None
+
+            pieces = self._split(work_dir)
+            if not pieces:
+                return False
+            self.log(f"✂️ แบ่งวิดีโอเป็น {len(pieces)} ส่วนที่ keyframe, "
+                     f"เข้ารหัสพร้อมกัน {self.workers} งาน")
+
+            futures = [pool.submit(self._encode_piece, index, piece, work_dir)
+                       for index, piece in enumerate(pieces)]
+            encoded = [future.result() for future in futures]
+            audio_ok = audio_future.result() if audio_future else True
+
+        if self._cancelled or not all(encoded) or not audio_ok:
+            return False
+        return self._join(work_dir, encoded, has_audio)
+
+    def _run_ffmpeg(self, command, progress_key=None):
+        """Run one helper ffmpeg, tracked for cancellation"""
+        if self._cancelled or self._failed:
+            return False
+        if progress_key is not None:
+            command = command[:1] + PROGRESS_ARGS + command[1:]
+        process = process_registry.spawn(
+            command,
+            stdout=subprocess.PIPE if progress_key is not None else subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        with self._lock:
+            self._processes.add(process)
+        if self.on_spawn is not None:
+            self.on_spawn(process)
+        try:
+            # Drain stderr on a thread so a chatty ffmpeg never blocks
+            errors = []
+            error_thread = threading.Thread(
+                target=lambda: errors.extend(process.stderr.read().decode('utf-8', 'replace').splitlines()))
+            error_thread.daemon = True
+            error_thread.start()
+            if progress_key is not None:
+                read_progress(process.stdout,
+                              lambda event: self._piece_progress(progress_key, event))
+            process.wait()
+            error_thread.join()
+            if self.log_file is not None:
+                for line in errors:
+                    self.log_file.write(line)
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+        if process.returncode != 0 and not (self._cancelled or self._failed):
+            for line in errors[-5:]:
+                self.log(line)
+            # One failed piece fails the file, stop the other helpers early
+            self._failed = True
+            self._stop_all()
+        return process.returncode == 0
+
+    def _piece_progress(self, key, event):
+        with self._lock:
+            self._piece_times[key] = event.out_time
+            self._piece_speeds[key] = 0.0 if event.finished else event.speed
+            done = sum(self._piece_times.values())
+            speed = sum(self._piece_speeds.values())
+        if self.on_progress:
+            self.on_progress(done, speed)
+
+    def _split(self, work_dir):
+        """Cut the video stream at keyframes into mkv pieces without re-encoding"""
+        pattern = os.path.join(work_dir, "piece%04d.mkv")
+        command = [
+            ffmpeg_binary(), "-hide_banner", "-v", "error",
+            "-fflags", "+genpts+discardcorrupt",
+            "-i", self.input_file,
+            "-map", f"0:{self.plan.video_index}",
+            "-c", "copy",
+            "-f", "segment",
+            "-segment_format", "matroska",
+            "-reset_timestamps", "1",
+        ]
+        times = split_times(self.plan.duration, self.chunks)
+        if times:
+            command += ["-segment_times", ",".join(str(t) for t in times)]
+        else:
+            command += ["-segment_time", str(max(self.plan.duration, 1) * 2)]
+        command.append(pattern)
+
+        if not self._run_ffmpeg(command):
+            self.log("❌ แบ่งไฟล์ที่ keyframe ไม่สำเร็จ")
+            return []
+        return sorted(os.path.join(work_dir, name) for name in os.listdir(work_dir)
+                      if name.startswith("piece"))
+
+    def _encode_piece(self, index, piece, work_dir):
+        """Encode one piece with the iOS video settings, returns its path"""
+        encoded = os.path.join(work_dir, f"encoded{index:04d}.mkv")
+        command = [
+            ffmpeg_binary(), "-hide_banner", "-v", "error",
+            "-i", piece,
+            "-map", "0:v:0",
+            "-c:v", self.vcodec,
+        ] + ios_profile.video_settings(self.vcodec, self.preset, self.threads) + [
+            "-an",
+            "-f", "matroska",
+            "-y", encoded,
+        ]
+        if not self._run_ffmpeg(command, progress_key=index):
+            return None
+        # The split copy is no longer needed, free the disk space early
+        os.remove(piece)
+        return encoded
+
+    def _encode_audio(self, work_dir):
+        """Encode (or copy) the whole audio track once, aligned to the video start"""
+        command = audio_command(self.input_file, self.plan, self.copy_audio,
+                                os.path.join(work_dir, "audio.mka"))
+        if not self._run_ffmpeg(command):
+            self.log("❌ เข้ารหัสเสียงไม่สำเร็จ")
+            return False
+        return True
+
+    def _join(self, work_dir, encoded, has_audio):
+        """Concatenate the encoded pieces losslessly and add the audio"""
+        list_file = os.path.join(work_dir, "concat.txt")
+        write_concat_list(list_file, [(path, None, None) for path in encoded])
+        command = join_command(list_file, os.path.join(work_dir, "audio.mka") if has_audio else None,
+                               self.plan, self.vcodec, self.output_file, self.output_format,
+                               self.moov_mode)
+        self.log("🔗 รวมไฟล์ด้วย concat demuxer (-c copy)")
+        if not self._run_ffmpeg(command):
+            self.log("❌ รวมไฟล์ไม่สำเร็จ")
+            return False
+        return True
@@ -0,0 +1,250 @@
+"""
+Read-ahead staging of inputs and outputs on a local scratch disk
+
+ffmpeg reading straight from an SMB/NFS share is often held back by the
+network, well below what the encoder could do. With a Stager, the engine
+copies the next `lookahead` waiting inputs to a local scratch directory
+in the background (one copy at a time, at the link's full speed) while
+the current jobs encode, and ffmpeg reads the local copy. The output is
+written to scratch too and moved to its final place after the encode, on
+another thread, while the next job already encodes.
+
+Only files on network file systems are staged (all files with
+`remote_only=False`). Scratch use is bounded: a copy is made only if it
+fits in `max_bytes` together with the other staged files and leaves
+FREE_RESERVE free on the disk; an output reserves as much as its input.
+A job that does not fit reads and writes its files in place. Staged
+inputs are deleted when their job ends, and each process has its own
+directory under the scratch root; directories of processes that are gone
+are deleted by the next Stager.
+
+Ladders and HLS (several outputs) are written in place.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from job_queue import PENDING
+
+
+SCRATCH_ENV = "CONVERT2IOS_SCRATCH"
+DEFAULT_LOOKAHEAD = 2
+DEFAULT_MAX_BYTES = 50 * 1024 ** 3
+FREE_RESERVE = 2 * 1024 ** 3    # never fill the scratch disk beyond this
+COPY_BUFFER = 8 * 1024 * 1024
+
+# File systems read over the network (Linux /proc/mounts types)
+REMOTE_FILE_SYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p", "afs",
+                       "ceph", "glusterfs", "fuse.rclone", "davfs")
+
+
+def scratch_root():
+    """Scratch root from the environment, or a folder in the system temp directory"""
+    return os.environ.get(SCRATCH_ENV) or os.path.join(tempfile.gettempdir(), "convert2ios-scratch")
+
+
+@lru_cache(maxsize=1)
+def _mounts():
+    """[(mount point, file system type)] longest first, empty where /proc/mounts does not exist"""
+    try:
+        with open("/proc/mounts", encoding='utf-8') as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return []
+    mounts = [(point.replace("\\040", " "), kind) for point, kind in mounts]
+    return sorted(mounts, key=lambda mount: len(mount[0]), reverse=True)
+
+
+def is_remote(path):
+    """True if `path` is on a network share (UNC path, network drive, NFS/SMB mount)"""
+    path = os.path.abspath(path)
+    if os.name == "nt":
+        if path.startswith(("\\\\", "//")):
+            return True
+        try:
+            import ctypes
+            DRIVE_REMOTE = 4
+            return ctypes.windll.kernel32.GetDriveTypeW(os.path.splitdrive(path)[0] + "\\") == DRIVE_REMOTE
+        except (AttributeError, OSError):
+            return False
+    for point, kind in _mounts():
+        if path == point or path.startswith(point.rstrip("/") + "/"):
+            return kind in REMOTE_FILE_SYSTEMS
+    return False
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Stager:
+    """
+    Staged copies of the engine's jobs. stage_ahead(), release() and the
+    reservations are called on the engine's loop thread; copies and moves
+    run on the Stager's own threads.
+    """
+
+    def __init__(self, root=None, lookahead=DEFAULT_LOOKAHEAD, max_bytes=DEFAULT_MAX_BYTES,
+                 remote_only=True):
+        self.root = root or scratch_root()
+        self.lookahead = max(0, lookahead)
+        self.max_bytes = max_bytes
+        self.remote_only = remote_only
+        self.enabled = True
+        self.directory = os.path.join(self.root, str(os.getpid()))
+        self._lock = threading.Lock()
+        self._used = 0
+        self._inputs = {}   # job id -> future of the staged input path (None: not staged)
+        self._staged = {}   # job id -> (path, reserved bytes) of each staged file
+        self._copier = ThreadPoolExecutor(1, "stage-in")
+        self._mover = ThreadPoolExecutor(1, "stage-out")
+        self.remove_stale()
+
+    def remove_stale(self):
+        """Delete the scratch directories of processes that are gone"""
+        from job_journal import process_alive  # the pid check recovery uses
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            if name.isdigit() and not process_alive(int(name)):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def close(self):
+        """Stop copying and delete everything this process staged (moves in progress finish first)"""
+        self.enabled = False
+        self._copier.shutdown(wait=False, cancel_futures=True)
+        self._mover.shutdown(wait=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Budget
+
+    def _reserve(self, size):
+        """Take `size` bytes of scratch; False if they do not fit"""
+        with self._lock:
+            if self._used + size > self.max_bytes:
+                return False
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                if shutil.disk_usage(self.directory).free - size < FREE_RESERVE:
+                    return False
+            except OSError:
+                return False
+            self._used += size
+            return True
+
+    def _release(self, key):
+        with self._lock:
+            path, size = self._staged.pop(key, (None, 0))
+            self._used -= size
+        if path is not None:
+            _remove(path)
+
+    def _wanted(self, path):
+        return self.enabled and (not self.remote_only or is_remote(path))
+
+    # Inputs
+
+    def stage_ahead(self, upcoming):
+        """Start copying the inputs of the next `lookahead` jobs to start (loop thread)"""
+        if not self.enabled:
+            return
+        for job in upcoming[:self.lookahead]:
+            if job.id not in self._inputs:
+                self._inputs[job.id] = self._copier.submit(self._copy, job)
+
+    def _copy(self, job):
+        """Copy one input to scratch; its local path, or None to read it in place (copy thread)"""
+        if job.status != PENDING or job.cancel_requested or not self._wanted(job.input_file):
+            return None
+        try:
+            size = os.path.getsize(job.input_file)
+        except OSError:
+            return None
+        if not self._reserve(size):
+            return None
+        name = os.path.basename(job.input_file)
+        path = os.path.join(self.directory, f"{job.id}-in-{name}")
+        with self._lock:
+            self._staged[("in", job.id)] = (path, size)
+        try:
+            with open(job.input_file, "rb") as source, open(path, "wb") as target:
+                while True:
+                    if job.cancel_requested or not self.enabled:
+                        raise OSError("cancelled")
+                    chunk = source.read(COPY_BUFFER)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+        except OSError:
+            self._release(("in", job.id))
+            return None
+        return path
+
+    def claim_input(self, job):
+        """
+        Future of the job's staged input path, None to read it in place. A
+        copy that has not started is dropped, one in progress is waited for.
+        """
+        future = self._inputs.pop(job.id, None)
+        if future is None or future.cancel():
+            return None
+        return future
+
+    def release(self, job):
+        """The job ended or left the queue: drop its staged input (loop thread)"""
+        future = self._inputs.pop(job.id, None)
+        if future is not None and not future.cancel():
+            # A copy in progress sees cancel_requested, or is deleted when it is done
+            future.add_done_callback(lambda _: self._release(("in", job.id)))
+        self._release(("in", job.id))
+
+    # Outputs
+
+    def output_for(self, job):
+        """Local path the job should write instead of output_file, or None (blocking)"""
+        if job.renditions or not self._wanted(job.output_file):
+            return None
+        try:
+            size = os.path.getsize(job.input_file)
+        except OSError:
+            return None
+        if not self._reserve(size):
+            return None
+        path = os.path.join(self.directory, f"{job.id}-out-{os.path.basename(job.output_file)}")
+        with self._lock:
+            self._staged[("out", job.id)] = (path, size)
+        return path
+
+    def discard_output(self, job):
+        self._release(("out", job.id))
+
+    def move_output(self, job):
+        """Move the staged output to output_file on the move thread; returns a future"""
+        return self._mover.submit(self._move, job)
+
+    def _move(self, job):
+        source = job.staged_output
+        try:
+            try:
+                os.replace(source, job.output_file)  # same file system
+            except OSError:
+                # Copied next to the output first, so output_file is never a partial file
+                directory, name = os.path.split(job.output_file)
+                part = os.path.join(directory, f".{name}.{os.getpid()}.part")
+                try:
+                    shutil.copyfile(source, part)
+                    os.replace(part, job.output_file)
+                except OSError:
+                    _remove(part)
+                    raise
+        finally:
+            # Moved or not, the staged file leaves scratch and its reservation is freed
+            self.discard_output(job)
@@ -0,0 +1,202 @@
+"""
+Preflight ffprobe step that decides, per stream, between copy and re-encode
+
+A source that is already iOS compatible (H.264 yuv420p at a supported
+profile/level with 44.1/48 kHz AAC) only needs a remux with `-c copy`,
+which takes seconds instead of a full encode. If only one stream is out of
+spec, only that stream is re-encoded.
+"""
+import json
+import os
+import shutil
+import ios_profile
+import process_registry
+
+
+# ffprobe to run instead of the one in PATH
+FFPROBE_ENV = "CONVERT2IOS_FFPROBE"
+
+
+class ProbeError(Exception):
+    """ffprobe could not read the input"""
+
+
+def find_ffprobe():
+    """Full path of the ffprobe binary ($CONVERT2IOS_FFPROBE or PATH), or None"""
+    return shutil.which(os.environ.get(FFPROBE_ENV) or "ffprobe")
+
+
+def probe_media(input_file, ffprobe_path=None):
+    """ffprobe streams and format of a file as a dict"""
+    ffprobe_path = ffprobe_path or find_ffprobe()
+    if not ffprobe_path:
+        raise ProbeError("ไม่พบ ffprobe ในระบบ")
+
+    result = process_registry.run(
+        [ffprobe_path, "-v", "error", "-show_streams", "-show_format",
+         "-of", "json", input_file],
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"ffprobe exit code {result.returncode}")
+    try:
+        return json.loads(result.stdout)
+    except ValueError as e:
+        raise ProbeError(f"ffprobe output ไม่ถูกต้อง: {e}")
+
+
+def _to_int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_rate(value):
+    """Frame rate from ffprobe's "30000/1001" form, 0.0 if unknown"""
+    try:
+        num, _, den = str(value).partition("/")
+        return float(num) / float(den or 1)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _pick_stream(streams, codec_type, size):
+    """Same choice as ffmpeg's default mapping: the 'largest' stream of a type"""
+    candidates = [s for s in streams if s.get("codec_type") == codec_type
+                  and not s.get("disposition", {}).get("attached_pic")]
+    if not candidates:
+        return None
+    return max(candidates, key=size)
+
+
+def check_video(stream, codec="h264"):
+    """None if the video stream can be copied, otherwise the reason it can't"""
+    source_codec = stream.get("codec_name")
+    wanted = ios_profile.COPY_VIDEO_CODECS.get(codec)
+    if source_codec != wanted:
+        return f"codec {source_codec} (ต้องการ {wanted})"
+
+    pix_fmt = stream.get("pix_fmt")
+    if pix_fmt not in ios_profile.COPY_PIX_FMTS:
+        return f"pix_fmt {pix_fmt}"
+
+    profile = stream.get("profile")
+    level = _to_int(stream.get("level"), default=-1)
+    if source_codec == "h264":
+        profiles, max_level = ios_profile.COPY_H264_PROFILES, ios_profile.COPY_MAX_H264_LEVEL
+    else:
+        profiles, max_level = ios_profile.COPY_HEVC_PROFILES, ios_profile.COPY_MAX_HEVC_LEVEL
+    if profile not in profiles:
+        return f"profile {profile}"
+    if level < 0 or level > max_level:
+        return f"level {stream.get('level')}"
+
+    field_order = stream.get("field_order", "progressive")
+    if field_order not in ("progressive", "unknown"):
+        return f"interlaced ({field_order})"
+
+    return None
+
+
+def check_audio(stream):
+    """None if the audio stream can be copied, otherwise the reason it can't"""
+    source_codec = stream.get("codec_name")
+    if source_codec not in ios_profile.COPY_AUDIO_CODECS:
+        return f"codec {source_codec}"
+
+    profile = stream.get("profile")
+    if profile not in ios_profile.COPY_AAC_PROFILES:
+        return f"profile {profile}"
+
+    sample_rate = _to_int(stream.get("sample_rate"))
+    if sample_rate not in ios_profile.COPY_SAMPLE_RATES:
+        return f"sample rate {sample_rate}"
+
+    channels = _to_int(stream.get("channels"))
+    if not 0 < channels <= ios_profile.COPY_MAX_CHANNELS:
+        return f"{channels} channels"
+
+    return None
+
+
+class ConversionPlan:
+    """Which input streams to use and whether each is copied or re-encoded"""
+
+    def __init__(self, video=None, audio=None, duration=0.0, codec="h264", start_time=0.0):
+        self.video_index = video.get("index") if video else None
+        self.video_codec = video.get("codec_name") if video else None
+        self.width = _to_int(video.get("width")) if video else 0
+        self.height = _to_int(video.get("height")) if video else 0
+        self.frame_rate = (parse_rate(video.get("avg_frame_rate"))
+                           or parse_rate(video.get("r_frame_rate"))) if video else 0.0
+        self.video_start = _to_float(video.get("start_time")) if video else 0.0
+        self.video_reason = check_video(video, codec) if video else None
+        self.copy_video = video is not None and self.video_reason is None
+
+        self.audio_index = audio.get("index") if audio else None
+        self.audio_start = _to_float(audio.get("start_time")) if audio else 0.0
+        self.audio_reason = check_audio(audio) if audio else None
+        self.copy_audio = audio is not None and self.audio_reason is None
+
+        self.duration = duration
+        self.start_time = start_time
+
+    @property
+    def needs_encoder(self):
+        """True if the video stream has to be re-encoded"""
+        return self.video_index is not None and not self.copy_video
+
+    @property
+    def mode(self):
+        """remux, video-copy, audio-copy or transcode"""
+        if (self.copy_video or self.video_index is None) and (self.copy_audio or self.audio_index is None):
+            return "remux"
+        if self.copy_video:
+            return "video-copy"
+        if self.copy_audio:
+            return "audio-copy"
+        return "transcode"
+
+    def map_args(self):
+        """Explicit -map options for the chosen streams"""
+        args = []
+        if self.video_index is not None:
+            args += ["-map", f"0:{self.video_index}"]
+        if self.audio_index is not None:
+            args += ["-map", f"0:{self.audio_index}"]
+        return args
+
+    def describe(self):
+        """One-line summary for the log"""
+        video = ("copy" if self.copy_video else f"encode ({self.video_reason})") \
+            if self.video_index is not None else "none"
+        audio = ("copy" if self.copy_audio else f"encode ({self.audio_reason})") \
+            if self.audio_index is not None else "none"
+        return f"{self.mode}: video {video}, audio {audio}"
+
+
+def plan_from_probe(info, codec="h264"):
+    """Build a ConversionPlan from probe_media() output"""
+    streams = info.get("streams", [])
+    video = _pick_stream(streams, "video",
+                         lambda s: _to_int(s.get("width")) * _to_int(s.get("height")))
+    audio = _pick_stream(streams, "audio", lambda s: _to_int(s.get("channels")))
+    fmt = info.get("format", {})
+    return ConversionPlan(video, audio, _to_float(fmt.get("duration")), codec,
+                          _to_float(fmt.get("start_time")))
+
+
+def plan_conversion(input_file, codec="h264", ffprobe_path=None):
+    """Probe `input_file` and decide per stream between copy and re-encode"""
+    return plan_from_probe(probe_media(input_file, ffprobe_path), codec)
@@ -0,0 +1,73 @@
+"""
+Stand-in for ffmpeg in the unit tests: encodes nothing
+
+It writes a few -progress blocks, waits STUB_SECONDS (STUB_X264_SECONDS
+for libx264, a CPU encode is slower) and writes a small output file.
+
+An NVENC encode holds one of STUB_NVENC_SESSIONS session files in
+STUB_NVENC_DIR while it runs, like a GPU that accepts that many sessions.
+With none free it fails the way ffmpeg does when the driver refuses one.
+Every encode appends "<vcodec> encoded|refused" to STUB_LOG.
+"""
+import os
+import sys
+import time
+
+
+def option(args, name, default=None):
+    return args[args.index(name) + 1] if name in args else default
+
+
+def open_session():
+    """Path of the session file taken, or None if every session is in use"""
+    directory = os.environ["STUB_NVENC_DIR"]
+    for i in range(int(os.environ.get("STUB_NVENC_SESSIONS", "0"))):
+        path = os.path.join(directory, f"session{i}")
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            continue
+    return None
+
+
+def log(line):
+    path = os.environ.get("STUB_LOG")
+    if path:
+        with open(path, "a", encoding='utf-8') as f:
+            f.write(line + "\n")
+
+
+def main(args):
+    vcodec = option(args, "-c:v", "")
+    session = None
+    if "nvenc" in vcodec:
+        session = open_session()
+        if session is None:
+            log(f"{vcodec} refused")
+            sys.stderr.write(f"[{vcodec} @ 0x55d0] OpenEncodeSessionEx failed: out of memory (10)\n"
+                             f"[{vcodec} @ 0x55d0] No capable devices found\n")
+            return 1
+    try:
+        seconds = float(os.environ.get("STUB_X264_SECONDS" if vcodec == "libx264" else "STUB_SECONDS",
+                                       "0.1"))
+        steps = 4
+        for step in range(1, steps + 1):
+            time.sleep(seconds / steps)
+            if "pipe:1" in args:
+                sys.stdout.write(f"frame={step * 30}\nout_time_us={step * 500000}\nspeed=2.0x\n"
+                                 f"progress={'end' if step == steps else 'continue'}\n")
+                sys.stdout.flush()
+        output = option(args, "-y")
+        if output:
+            with open(output, "wb") as f:
+                f.write(b"\0" * 1024)
+        log(f"{vcodec} encoded")
+        return 0
+    finally:
+        if session is not None:
+            os.remove(session)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,118 @@
+"""
+Unit tests of the core partitioning of concurrent CPU encodes
+(cpu_scheduler.py): thread counts, blocks and pinning as jobs come and go
+
+Run:  python -m unittest test_cpu_scheduler
+"""
+import types
+import unittest
+from unittest import mock
+
+from cpu_scheduler import CoreScheduler, format_cores, split_cores
+
+
+def job(job_id, *pids):
+    process = types.SimpleNamespace(pids=lambda: list(pids)) if pids else None
+    return types.SimpleNamespace(id=job_id, process=process)
+
+
+class SplitCoresTest(unittest.TestCase):
+
+    def test_nearly_equal_blocks(self):
+        self.assertEqual(split_cores(list(range(10)), 3), [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]])
+        self.assertEqual(split_cores(list(range(4)), 1), [[0, 1, 2, 3]])
+        self.assertEqual(split_cores(list(range(4)), 0), [])
+
+    def test_more_jobs_than_cores(self):
+        self.assertEqual(split_cores([0, 1], 3), [[0], [1], [0]])
+
+    def test_format_cores(self):
+        self.assertEqual(format_cores([5, 0, 1, 2, 7, 8]), "0-2,5,7-8")
+        self.assertEqual(format_cores([3]), "3")
+
+
+class CoreSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pinned = {}
+        self.lowered = {}
+        for target, replacement in (
+                ("cpu_scheduler.set_affinity", lambda pid, cores: self.pinned.__setitem__(pid, list(cores))),
+                ("cpu_scheduler.lower_priority", lambda pid, nice: self.lowered.__setitem__(pid, nice)),
+                ("cpu_scheduler.topology_order", sorted)):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_reserve_splits_the_threads(self):
+        scheduler = CoreScheduler(cores=list(range(16)))
+        first, second, third = job(1), job(2), job(3)
+        self.assertEqual(scheduler.reserve(first), 16)
+        self.assertEqual(scheduler.reserve(second), 8)
+        self.assertEqual(scheduler.reserve(third), 5)
+        # Reserving again does not count the job twice
+        self.assertEqual(scheduler.reserve(third), 5)
+
+    def test_expected_encodes_leave_room(self):
+        scheduler = CoreScheduler(cores=list(range(16)))
+        # The first of a batch of 4 does not take every core
+        self.assertEqual(scheduler.reserve(job(1), expected=4), 4)
+        self.assertEqual(scheduler.reserve(job(2), expected=1), 8)
+
+    def test_at_least_one_thread(self):
+        scheduler = CoreScheduler(cores=[0, 1])
+        for job_id in range(3):
+            threads = scheduler.reserve(job(job_id))
+        self.assertEqual(threads, 1)
+
+    def test_share_does_not_register(self):
+        scheduler = CoreScheduler(cores=list(range(16)))
+        self.assertEqual(scheduler.share(), 16)
+        self.assertEqual(scheduler.share(expected=4), 4)
+        scheduler.reserve(job(1))
+        self.assertEqual(scheduler.share(), 8)
+        self.assertEqual(scheduler.share(), 8)
+        self.assertEqual(scheduler.reserve(job(2)), 8)
+
+    def test_rebalance_pins_every_process(self):
+        scheduler = CoreScheduler(cores=list(range(8)))
+        first, second = job(1, 101, 102), job(2, 201)
+        scheduler.reserve(first)
+        scheduler.reserve(second)
+        scheduler.rebalance()
+        self.assertEqual(scheduler.assignments, {1: [0, 1, 2, 3], 2: [4, 5, 6, 7]})
+        self.assertEqual(self.pinned, {101: [0, 1, 2, 3], 102: [0, 1, 2, 3], 201: [4, 5, 6, 7]})
+        # The first one finishes: the second gets every core
+        scheduler.release(first)
+        self.assertEqual(scheduler.assignments, {2: list(range(8))})
+        self.assertEqual(self.pinned[201], list(range(8)))
+        scheduler.release(first)
+        self.assertEqual(scheduler.share(), 4)
+
+    def test_place_a_chunk(self):
+        scheduler = CoreScheduler(cores=list(range(8)), nice=10)
+        segmented, other = job(1), job(2)
+        scheduler.reserve(segmented)
+        scheduler.reserve(other)
+        scheduler.rebalance()
+        scheduler.place(segmented, 301)
+        self.assertEqual(self.pinned[301], [0, 1, 2, 3])
+        self.assertEqual(self.lowered, {301: 10})
+        # Not reserved: only the priority
+        scheduler.place(job(3), 302)
+        self.assertNotIn(302, self.pinned)
+        self.assertEqual(self.lowered[302], 10)
+
+    def test_naive_mode(self):
+        scheduler = CoreScheduler(cores=list(range(8)), partition=False)
+        first = job(1, 101)
+        self.assertEqual(scheduler.reserve(first), 0)
+        self.assertEqual(scheduler.share(), 8)
+        scheduler.rebalance()
+        scheduler.place(first, 102)
+        self.assertEqual((scheduler.assignments, self.pinned, self.lowered), ({}, {}, {}))
+        scheduler.release(first)
+
+
+if __name__ == "__main__":
+    unittest.main()
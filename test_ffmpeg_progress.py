@@ -0,0 +1,132 @@
+"""
+Unit tests of the `-progress` parser (ffmpeg_progress.py)
+
+Run:  python -m unittest test_ffmpeg_progress
+"""
+import asyncio
+import io
+import re
+import unittest
+
+from ffmpeg_progress import ProgressParser, parse_duration_line, read_progress, read_progress_async
+
+
+def block(frame, out_time_us, speed="2.5x", progress="continue", size=None):
+    """One block as ffmpeg 6 writes it with -progress pipe:1"""
+    return (f"frame={frame}\nfps=59.94\nstream_0_0_q=28.0\nbitrate=1500.2kbits/s\n"
+            f"total_size={size if size is not None else frame * 1000}\n"
+            f"out_time_us={out_time_us}\nout_time_ms={out_time_us}\n"
+            f"out_time=00:00:{out_time_us / 1e6:09.6f}\ndup_frames=0\ndrop_frames=0\n"
+            f"speed={speed}\nprogress={progress}\n")
+
+
+STREAM = (block(30, 500000) + block(60, 1000000, "2.4x") + block(90, 1500000, "2.6x")
+          + block(120, 2000000, "2.5x", "end"))
+
+
+class ProgressParserTest(unittest.TestCase):
+
+    def test_single_block(self):
+        event = ProgressParser().feed(block(30, 500000))
+        self.assertEqual(event.frame, 30)
+        self.assertEqual(event.fps, 59.94)
+        self.assertEqual(event.out_time_us, 500000)
+        self.assertEqual(event.out_time, 0.5)
+        self.assertEqual(event.speed, 2.5)
+        self.assertEqual(event.total_size, 30000)
+        self.assertFalse(event.finished)
+
+    def test_newest_block_of_a_chunk(self):
+        event = ProgressParser().feed(STREAM)
+        self.assertEqual(event.frame, 120)
+        self.assertTrue(event.finished)
+
+    def test_split_at_every_position(self):
+        # Every block is reported exactly once, when its progress line ends
+        ends = [match.end() for match in re.finditer(r"progress=\w+\n", STREAM)]
+        for cut in range(1, len(STREAM)):
+            parser = ProgressParser()
+            first = parser.feed(STREAM[:cut])
+            second = parser.feed(STREAM[cut:])
+            complete = sum(1 for end in ends if end <= cut)
+            if complete:
+                self.assertEqual(first.frame, 30 * complete, cut)
+            else:
+                self.assertIsNone(first, cut)
+            self.assertEqual(second.frame, 120, cut)
+
+    def test_byte_by_byte(self):
+        parser = ProgressParser()
+        events = [event for event in map(parser.feed, STREAM) if event is not None]
+        self.assertEqual([event.frame for event in events], [30, 60, 90, 120])
+        self.assertEqual([event.speed for event in events], [2.5, 2.4, 2.6, 2.5])
+        self.assertEqual([event.finished for event in events], [False, False, False, True])
+
+    def test_progress_line_without_newline_is_not_complete(self):
+        parser = ProgressParser()
+        data = block(30, 500000) + block(60, 1000000)[:-1]
+        self.assertEqual(parser.feed(data).frame, 30)
+        self.assertEqual(parser.feed("\n").frame, 60)
+
+    def test_fields_of_one_block_only(self):
+        # A key missing from the newest block is not taken from an older one
+        parser = ProgressParser()
+        parser.feed(block(30, 500000))
+        event = parser.feed("frame=31\nprogress=continue\n")
+        self.assertEqual(event.frame, 31)
+        self.assertIsNone(event.get("speed"))
+        self.assertEqual(event.speed, 0.0)
+
+    def test_unknown_values(self):
+        event = ProgressParser().feed("frame=0\nfps=0.00\ntotal_size=N/A\nout_time_us=-9223372036854775807\n"
+                                      "speed=N/A\nprogress=continue\n")
+        self.assertEqual(event.total_size, 0)
+        self.assertEqual(event.out_time_us, 0)
+        self.assertEqual(event.speed, 0.0)
+
+    def test_out_time_ms_fallback(self):
+        # Older ffmpeg builds only write out_time_ms (in microseconds too)
+        event = ProgressParser().feed("out_time_ms=1500000\nprogress=continue\n")
+        self.assertEqual(event.out_time, 1.5)
+
+    def test_windows_line_endings(self):
+        event = ProgressParser().feed(block(30, 500000).replace("\n", "\r\n"))
+        self.assertEqual(event.frame, 30)
+        self.assertEqual(event.speed, 2.5)
+
+    def test_read_progress(self):
+        events = []
+        read_progress(io.BufferedReader(io.BytesIO(STREAM.encode("ascii"))), events.append)
+        self.assertTrue(events)
+        self.assertEqual(events[-1].frame, 120)
+        self.assertTrue(events[-1].finished)
+
+    def test_read_progress_async(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            events = []
+            task = asyncio.ensure_future(read_progress_async(reader, events.append))
+            for i in range(0, len(STREAM), 97):
+                reader.feed_data(STREAM[i:i + 97].encode("ascii"))
+                await asyncio.sleep(0)
+            reader.feed_eof()
+            await task
+            return events
+
+        events = asyncio.run(run())
+        self.assertEqual([event.frame for event in events], [30, 60, 90, 120])
+
+
+class DurationLineTest(unittest.TestCase):
+
+    def test_duration(self):
+        self.assertEqual(parse_duration_line("Duration: 01:02:03.50, start: 1.400000, bitrate: 5000 kb/s"),
+                         3723.5)
+
+    def test_not_a_duration(self):
+        self.assertIsNone(parse_duration_line("Duration: N/A, start: 0.000000, bitrate: N/A"))
+        self.assertIsNone(parse_duration_line("Stream #0:0: Video: h264"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+"""
+Unit tests of the watch-folder readiness checks (folder_watch.py): a file
+is reported once, when its writer is done with it, in polling and inotify
+mode, on files written by the test as a recorder would
+
+Run:  python -m unittest test_folder_watch
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import folder_watch
+from folder_watch import FolderWatcher
+
+
+SETTLE = 0.3
+POLL = 0.05
+
+
+class WatchTest:
+    """Scenarios run against a FolderWatcher of the subclass's mode"""
+
+    use_inotify = False
+    settle = SETTLE
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="convert2ios_test_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.watched = os.path.join(self.directory, "in")
+        self.output = os.path.join(self.watched, "converted")
+        os.makedirs(self.output)
+        self.reported = []  # relative paths, in report order
+
+    def path(self, relative):
+        return os.path.join(self.watched, *relative.split("/"))
+
+    def write(self, relative, data=b"\0" * 1024, mode="wb"):
+        path = self.path(relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode) as f:
+            f.write(data)
+        return path
+
+    def watch(self, scenario):
+        """Run `scenario(watcher)` (a coroutine function) while the watcher runs"""
+        async def main():
+            watcher = FolderWatcher(
+                [self.watched], lambda path, relative: self.reported.append(relative.replace(os.sep, "/")),
+                (".mp4", ".ts"), exclude=[self.output], settle=self.settle, poll_interval=POLL,
+                use_inotify=self.use_inotify, log=lambda message: None)
+            task = asyncio.ensure_future(watcher.run())
+            await asyncio.sleep(0.05)
+            try:
+                await scenario(watcher)
+            finally:
+                watcher.close()
+                await task
+            return watcher
+        return asyncio.run(main())
+
+    def test_existing_file_is_reported_once(self):
+        self.write("old.ts")
+
+        async def scenario(watcher):
+            await asyncio.sleep(SETTLE * 3)
+
+        self.watch(scenario)
+        self.assertEqual(self.reported, ["old.ts"])
+
+    def test_growing_file_waits(self):
+        async def scenario(watcher):
+            # A recorder appending more often than the settle time
+            for _ in range(8):
+                self.write("rec.ts", b"\0" * 4096, mode="ab")
+                await asyncio.sleep(SETTLE / 3)
+            self.assertEqual(self.reported, [])
+            await asyncio.sleep(SETTLE * 3)
+
+        self.watch(scenario)
+        self.assertEqual(self.reported, ["rec.ts"])
+
+    def test_ignored_files(self):
+        async def scenario(watcher):
+            self.write(".partial.mp4")
+            self.write("notes.txt")
+            self.write("converted/out.mp4")
+            self.write(".hidden/clip.mp4")
+            self.write("empty.mp4", b"")
+            self.write("sub/clip.MP4")
+            await asyncio.sleep(SETTLE * 3)
+
+        self.watch(scenario)
+        self.assertEqual(self.reported, ["sub/clip.MP4"])
+
+    def test_changed_file_is_reported_again(self):
+        async def scenario(watcher):
+            self.write("clip.mp4")
+            await asyncio.sleep(SETTLE * 3)
+            self.write("clip.mp4", b"\1" * 2048)
+            await asyncio.sleep(SETTLE * 3)
+
+        self.watch(scenario)
+        self.assertEqual(self.reported, ["clip.mp4", "clip.mp4"])
+
+
+class PollingTest(WatchTest, unittest.TestCase):
+
+    def test_mode(self):
+        async def scenario(watcher):
+            self.assertEqual(watcher.mode, "polling")
+
+        self.watch(scenario)
+
+    def test_deleted_before_settling(self):
+        async def scenario(watcher):
+            path = self.write("gone.ts")
+            await asyncio.sleep(SETTLE / 3)
+            os.remove(path)
+            await asyncio.sleep(SETTLE * 3)
+
+        self.watch(scenario)
+        self.assertEqual(self.reported, [])
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+class InotifyTest(WatchTest, unittest.TestCase):
+
+    use_inotify = True
+
+    def test_mode(self):
+        async def scenario(watcher):
+            self.assertEqual(watcher.mode, "inotify")
+
+        self.watch(scenario)
+
+    def test_closed_file_is_reported_after_the_debounce(self):
+        self.settle = 10.0  # only the close can make it ready in time
+
+        async def scenario(watcher):
+            # A folder made while watching is watched too
+            os.mkdir(self.path("new"))
+            await asyncio.sleep(0.05)
+            self.write("new/clip.mp4")
+            await asyncio.sleep(folder_watch.CLOSE_DEBOUNCE * 4)
+
+        self.watch(scenario)
+        self.assertEqual(self.reported, ["new/clip.mp4"])
+
+    def test_open_file_is_not_reported(self):
+        self.settle = 0.1
+
+        async def scenario(watcher):
+            with open(self.path("live.ts"), "wb") as f:
+                for _ in range(5):
+                    f.write(b"\0" * 4096)
+                    f.flush()
+                    await asyncio.sleep(0.15)
+                # Written, not closed: no settle time applies
+                await asyncio.sleep(0.5)
+                self.assertEqual(self.reported, [])
+            await asyncio.sleep(folder_watch.CLOSE_DEBOUNCE * 4)
+
+        self.watch(scenario)
+        self.assertEqual(self.reported, ["live.ts"])
+
+    def test_renamed_in(self):
+        self.settle = 10.0
+        staging = self.write(".copying.mp4")
+
+        async def scenario(watcher):
+            os.rename(staging, self.path("copied.mp4"))
+            await asyncio.sleep(folder_watch.CLOSE_DEBOUNCE * 4)
+
+        self.watch(scenario)
+        self.assertEqual(self.reported, ["copied.mp4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+Unit tests of the job journal's recovery after a crash (job_journal.py),
+on journal rows left behind by a process that is gone
+
+Run:  python -m unittest test_job_journal
+"""
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import job_journal
+from job_journal import JobJournal, process_alive
+from job_queue import ConversionJob, PENDING, RUNNING, DONE, FAILED
+from stream_planner import ProbeError
+
+
+DEAD_PID = 999999991   # the instance that crashed
+OTHER_PID = 999999992  # another instance, still running
+DURATION = 600.0
+
+
+def connect(path):
+    """A second connection to the journal, as the crashed instance had (autocommit)"""
+    return contextlib.closing(sqlite3.connect(path, isolation_level=None))
+
+
+def alive(pid, since=None):
+    return pid in (os.getpid(), OTHER_PID)
+
+
+class RecoverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="convert2ios_test_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.journal = JobJournal(os.path.join(self.directory, job_journal.JOURNAL_FILE))
+        self.addCleanup(self.journal.close)
+        self.outputs = os.path.join(self.directory, "out")
+        os.mkdir(self.outputs)
+        self.probed = {}  # output -> duration ffprobe reads; anything else is unreadable
+        for target, replacement in (("job_journal.process_alive", alive),
+                                    ("stream_planner.probe_media", self.probe)):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def probe(self, path, ffprobe_path=None):
+        if path not in self.probed:
+            raise ProbeError("moov atom not found")
+        return {"streams": [{"index": 0, "codec_type": "video", "codec_name": "h264",
+                             "width": 1920, "height": 1080}],
+                "format": {"duration": str(self.probed[path]), "start_time": "0.000000"}}
+
+    def row(self, name, state, owner=DEAD_PID, attempts=1, params=None):
+        """Insert a job row as the crashed instance left it; returns its output path"""
+        output = os.path.join(self.outputs, f"{name}.mp4")
+        with connect(self.journal.path) as db:
+            db.execute("INSERT INTO jobs (input_file, output_file, params, state, attempts, duration, "
+                       "owner, submitted_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (os.path.join(self.directory, f"{name}.ts"), output,
+                        json.dumps(params or {"codec": "h264", "chunks": 1}), state, attempts,
+                        DURATION if state != PENDING else 0, owner, time.time(), time.time()))
+        return output
+
+    def write(self, path, data=b"\0" * 1024):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def recover(self):
+        logged = []
+        queued, finished = self.journal.recover(log=logged.append)
+        return queued, finished, logged
+
+    def test_crash_recovery(self):
+        pending = self.row("pending", PENDING, attempts=0)
+        partial = self.row("partial", RUNNING, attempts=2)
+        complete = self.row("complete", RUNNING)
+        done = self.row("done", DONE)
+        failed = self.row("failed", FAILED)
+        self.write(partial)
+        self.write(complete)
+        self.probed[complete] = DURATION - 0.5
+        work_dir = os.path.join(self.outputs, ".convert2ios_abc")
+        os.mkdir(work_dir)
+        self.write(os.path.join(work_dir, "gpu.mp4"))
+
+        queued, finished, logged = self.recover()
+
+        self.assertEqual([job.output_file for job in queued], [pending, partial])
+        self.assertEqual([job.output_file for job in finished], [complete, done, failed])
+        self.assertEqual([job.status for job in queued], [PENDING, PENDING])
+        self.assertEqual([job.status for job in finished], [DONE, DONE, FAILED])
+        self.assertEqual(queued[1].attempts, 2)
+        # The interrupted output and the work directories next to it are gone, the complete one kept
+        self.assertFalse(os.path.exists(partial))
+        self.assertFalse(os.path.exists(work_dir))
+        self.assertTrue(os.path.exists(complete))
+        self.assertEqual(len(logged), 2)
+        # The rows taken over now belong to this process
+        rows = {row["output_file"]: row for row in self.journal.rows()}
+        for path, state in ((pending, PENDING), (partial, PENDING), (complete, DONE)):
+            self.assertEqual((rows[path]["state"], rows[path]["owner"]), (state, os.getpid()))
+            self.assertEqual(self.journal.transitions(rows[path]["id"])[-1][0], state)
+        self.assertEqual(rows[done]["owner"], DEAD_PID)
+
+    def test_short_output_is_not_complete(self):
+        output = self.row("short", RUNNING)
+        self.write(output)
+        self.probed[output] = DURATION - 30
+        queued, finished, _ = self.recover()
+        self.assertEqual([job.output_file for job in queued], [output])
+        self.assertFalse(os.path.exists(output))
+
+    def test_renditions_are_encoded_again(self):
+        # The master output alone says nothing about the other renditions
+        output = self.row("ladder", RUNNING, params={"renditions": ["1080p", "720p"]})
+        self.probed[output] = DURATION
+        queued, finished, _ = self.recover()
+        self.assertEqual([job.renditions for job in queued], [["1080p", "720p"]])
+
+    def test_jobs_of_a_running_instance_are_left_alone(self):
+        running = self.row("running", RUNNING, owner=OTHER_PID)
+        waiting = self.row("waiting", PENDING, owner=OTHER_PID)
+        crashed = self.row("crashed", RUNNING)
+        work_dir = os.path.join(self.outputs, ".convert2ios_other")
+        os.mkdir(work_dir)
+        queued, finished, _ = self.recover()
+        self.assertEqual([job.output_file for job in queued], [crashed])
+        self.assertEqual(finished, [])
+        # The other instance's work directory is in the same folder
+        self.assertTrue(os.path.isdir(work_dir))
+        rows = {row["output_file"]: row for row in self.journal.rows()}
+        self.assertEqual((rows[running]["state"], rows[running]["owner"]), (RUNNING, OTHER_PID))
+        self.assertEqual(rows[waiting]["owner"], OTHER_PID)
+
+    def test_journal_written_before_the_crash(self):
+        # Rows written through the journal by an instance that then died mid-encode
+        jobs = [ConversionJob(os.path.join(self.directory, f"in{i}.ts"),
+                              os.path.join(self.outputs, f"in{i}.mp4"), chunks=4) for i in range(3)]
+        self.journal.add_many(jobs)
+        jobs[0].status = RUNNING
+        jobs[0].total_duration = DURATION
+        self.journal.update(jobs[0])
+        self.write(jobs[0].output_file)
+        self.journal.close()
+        with connect(self.journal.path) as db:
+            db.execute("UPDATE jobs SET owner = ?", (DEAD_PID,))
+
+        journal = JobJournal(self.journal.path)
+        self.addCleanup(journal.close)
+        queued, finished = journal.recover(log=lambda message: None)
+        self.assertEqual([job.journal_id for job in queued], [job.journal_id for job in jobs])
+        self.assertEqual([job.chunks for job in queued], [4, 4, 4])
+        self.assertEqual(queued[0].attempts, 1)
+        self.assertFalse(os.path.exists(jobs[0].output_file))
+        self.assertEqual([state for state, _ in journal.transitions(jobs[0].journal_id)],
+                         [RUNNING, PENDING])
+
+
+class ProcessAliveTest(unittest.TestCase):
+
+    def test_this_process(self):
+        self.assertTrue(process_alive(os.getpid()))
+        self.assertFalse(process_alive(None))
+
+    def test_exited_process(self):
+        child = subprocess.Popen([sys.executable, "-c", "pass"])
+        child.wait()
+        self.assertFalse(process_alive(child.pid))
+
+
+if __name__ == "__main__":
+    unittest.main()
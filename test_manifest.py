@@ -0,0 +1,134 @@
+"""
+Unit tests of the incremental batch manifest (manifest.py): when an output
+counts as up to date, and which output an identical input reuses
+
+Run:  python -m unittest test_manifest
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import manifest
+from manifest import MANIFEST_FILE, Manifest, content_id, partial_hash
+
+
+ARGS = "args-hash"
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="convert2ios_test_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.output_root = os.path.join(self.directory, "out")
+        self.manifest = Manifest(self.output_root)
+
+    def write(self, name, data=b"\0" * 1024, mtime_ns=None):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
+    def converted(self, name="in.ts", output="out/in.mp4", data=b"input", files=()):
+        """(input, identity, output) of an input converted and recorded"""
+        input_file = self.write(name, data)
+        identity = self.manifest.identify(input_file)
+        output_file = self.write(output, b"output of " + data)
+        self.manifest.record(output_file, identity, ARGS, probe={"streams": []}, files=files)
+        return input_file, identity, output_file
+
+    def test_up_to_date(self):
+        input_file, identity, output_file = self.converted()
+        self.assertTrue(self.manifest.is_up_to_date(output_file, identity, ARGS))
+        # Other settings
+        self.assertFalse(self.manifest.is_up_to_date(output_file, identity, "other-args"))
+        # The output was touched or replaced
+        self.write("out/in.mp4", b"edited")
+        self.assertFalse(self.manifest.is_up_to_date(output_file, identity, ARGS))
+
+    def test_output_deleted(self):
+        input_file, identity, output_file = self.converted()
+        os.remove(output_file)
+        self.assertFalse(self.manifest.is_up_to_date(output_file, identity, ARGS))
+
+    def test_input_changed(self):
+        input_file, identity, output_file = self.converted()
+        stat = os.stat(input_file)
+        # Same content, new mtime: the partial hash may not see the edit
+        os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        touched = self.manifest.identify(input_file)
+        self.assertEqual(content_id(touched), content_id(identity))
+        self.assertFalse(self.manifest.is_up_to_date(output_file, touched, ARGS))
+        self.write("in.ts", b"other")
+        self.assertFalse(self.manifest.is_up_to_date(output_file, self.manifest.identify(input_file), ARGS))
+
+    def test_every_file_of_a_ladder_is_checked(self):
+        playlists = [self.write(f"out/hls/{name}.m3u8") for name in ("720p", "480p")]
+        segments = [self.write(f"out/hls/720p_{i:03d}.m4s") for i in range(3)]
+        master = os.path.join(self.output_root, "hls", "master.m3u8")
+        input_file, identity, output_file = self.converted(
+            output="out/hls/master.m3u8", files=[master] + playlists + segments)
+        entry = self.manifest.entries["hls/master.m3u8"]
+        self.assertEqual(sorted(entry["files"]), ["hls/480p.m3u8", "hls/720p.m3u8"]
+                         + [f"hls/720p_{i:03d}.m4s" for i in range(3)])
+        self.assertTrue(self.manifest.is_up_to_date(output_file, identity, ARGS))
+        os.remove(segments[1])
+        self.assertFalse(self.manifest.is_up_to_date(output_file, identity, ARGS))
+        self.write("out/hls/720p_001.m4s", b"short")
+        self.assertFalse(self.manifest.is_up_to_date(output_file, identity, ARGS))
+
+    def test_identical_input_reuses_the_output(self):
+        input_file, identity, output_file = self.converted()
+        # Same content under another name and mtime
+        copy = self.write("copy.ts", b"input", mtime_ns=10 ** 18)
+        copy_identity = self.manifest.identify(copy)
+        entry = self.manifest.find_output(copy_identity, ARGS)
+        self.assertEqual(self.manifest.output_path(entry), output_file)
+        self.assertIsNone(self.manifest.find_output(copy_identity, "other-args"))
+        # The job's own out of date output is not a source
+        self.assertIsNone(self.manifest.find_output(identity, ARGS, exclude=output_file))
+        self.assertEqual(self.manifest.known_probe(copy_identity), {"streams": []})
+
+    def test_damaged_output_is_not_reused(self):
+        input_file, identity, output_file = self.converted()
+        self.write("out/in.mp4", b"truncated")
+        self.assertIsNone(self.manifest.find_output(identity, ARGS))
+
+    def test_saved_and_reloaded(self):
+        input_file, identity, output_file = self.converted()
+        self.assertTrue(os.path.exists(os.path.join(self.output_root, MANIFEST_FILE)))
+        reloaded = Manifest(self.output_root)
+        self.assertTrue(reloaded.is_up_to_date(output_file, identity, ARGS))
+        # The partial hash is not read again for an unchanged input
+        with mock.patch("manifest.partial_hash", side_effect=AssertionError):
+            self.assertEqual(reloaded.identify(input_file), identity)
+        reloaded.forget(output_file)
+        self.assertEqual(Manifest(self.output_root).entries, {})
+
+    def test_unreadable_manifest_starts_empty(self):
+        os.makedirs(self.output_root)
+        with open(os.path.join(self.output_root, MANIFEST_FILE), "w", encoding='utf-8') as f:
+            f.write("{not json")
+        self.assertEqual(Manifest(self.output_root).entries, {})
+
+    def test_partial_hash_samples(self):
+        size = 4 * manifest.SAMPLE_SIZE
+        data = bytearray(size)
+        path = self.write("big.ts", bytes(data))
+        before = partial_hash(path)
+        # An edit between the samples is not seen, one inside them is
+        data[manifest.SAMPLE_SIZE + 10] = 1
+        self.write("big.ts", bytes(data))
+        self.assertEqual(partial_hash(path), before)
+        data[size - 1] = 1
+        self.write("big.ts", bytes(data))
+        self.assertNotEqual(partial_hash(path), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+"""
+Unit tests of the fragmented MP4 walking that resumes a failed NVENC
+encode (nvenc_resume.py), on files built box by box as ffmpeg writes them
+with -movflags +frag_keyframe+empty_moov+default_base_moof
+
+Run:  python -m unittest test_nvenc_resume
+"""
+import os
+import shutil
+import struct
+import tempfile
+import types
+import unittest
+
+import ios_profile
+from nvenc_resume import RESUME_MIN_DURATION, ResumableEncode, complete_fragments, resume_point, resumable
+
+
+TIMESCALE = 15360
+FRAME = 512         # ticks per frame at 30 fps
+STRETCH = 357       # AAC priming (1024 samples at 44.1 kHz) in video ticks
+GOP = 30            # frames per fragment (one keyframe each)
+VIDEO_TRACK = 1
+AUDIO_TRACK = 2
+
+
+def box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def full_box(kind, version, flags, payload=b""):
+    return box(kind, struct.pack(">I", version << 24 | flags) + payload)
+
+
+def trak(track_id, handler, timescale):
+    tkhd = full_box(b"tkhd", 0, 3, struct.pack(">III", 0, 0, track_id) + bytes(68))
+    mdhd = full_box(b"mdhd", 0, 0, struct.pack(">III", 0, 0, timescale) + bytes(8))
+    hdlr = full_box(b"hdlr", 0, 0, struct.pack(">I4s", 0, handler) + bytes(13))
+    return box(b"trak", tkhd + box(b"mdia", mdhd + hdlr))
+
+
+def traf(track_id, decode_time, durations, tfdt_version=0):
+    tfhd = full_box(b"tfhd", 0, 0x020000, struct.pack(">I", track_id))
+    tfdt = full_box(b"tfdt", tfdt_version, 0,
+                    struct.pack(">Q" if tfdt_version else ">I", decode_time))
+    if durations is None:
+        # Every sample lasts the default duration: no per-sample durations
+        trun = full_box(b"trun", 0, 0x001 | 0x200, struct.pack(">Ii", GOP, 0) + struct.pack(">I", 900) * GOP)
+    else:
+        # data offset, first sample flags, then duration + size + composition offset per sample
+        samples = b"".join(struct.pack(">IIi", duration, 900, 0) for duration in durations)
+        trun = full_box(b"trun", 0, 0x001 | 0x004 | 0x100 | 0x200 | 0x800,
+                        struct.pack(">IiI", len(durations), 0, 0x02000000) + samples)
+    return box(b"traf", tfhd + tfdt + trun)
+
+
+def large_box(kind, payload):
+    """A box with a 64-bit size, as ffmpeg writes an mdat over 4 GB"""
+    return struct.pack(">I4sQ", 1, kind, 16 + len(payload)) + payload
+
+
+def fragmented_mp4(fragments=4, stretch=STRETCH, with_audio=True, tfdt_version=0, durations=True,
+                   large_mdat=False):
+    """(bytes, [moof offsets]) of a fragmented MP4 with `fragments` one-GOP fragments"""
+    tracks = trak(AUDIO_TRACK, b"soun", 44100) if with_audio else b""
+    tracks += trak(VIDEO_TRACK, b"vide", TIMESCALE)  # The video is not always the first track
+    data = box(b"ftyp", b"isom" + bytes(4) + b"isomiso2avc1mp41") + box(b"moov", full_box(b"mvhd", 0, 0, bytes(96)) + tracks)
+    offsets = []
+    decode_time = 0
+    for index in range(fragments):
+        frame_durations = [FRAME] * GOP
+        if index == 0:
+            frame_durations[0] += stretch
+        trafs = traf(VIDEO_TRACK, decode_time, frame_durations if durations else None, tfdt_version)
+        if with_audio:
+            trafs = traf(AUDIO_TRACK, index * 44100, [1024] * 43) + trafs
+        offsets.append(len(data))
+        data += box(b"moof", full_box(b"mfhd", 0, 0, struct.pack(">I", index + 1)) + trafs)
+        data += (large_box if large_mdat else box)(b"mdat", bytes(900 * GOP))
+        decode_time += sum(frame_durations)
+    return data, offsets
+
+
+class FragmentsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="convert2ios_test_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, "gpu.mp4")
+
+    def write(self, data):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def test_complete_file(self):
+        data, offsets = fragmented_mp4()
+        self.write(data)
+        timescale, fragments, stretch = complete_fragments(self.path)
+        self.assertEqual(timescale, TIMESCALE)
+        self.assertEqual([offset for offset, _ in fragments], offsets)
+        self.assertEqual([time for _, time in fragments],
+                         [0] + [STRETCH + FRAME * GOP * i for i in range(1, 4)])
+        self.assertEqual(stretch, STRETCH)
+
+    def test_truncated_in_mdat(self):
+        # The failure cut the file in the middle of the last fragment's samples
+        data, offsets = fragmented_mp4(5)
+        self.write(data[:offsets[4] + 500])
+        start, end, timescale, shift = resume_point(self.path)
+        # Fragments 0-3 are complete; the last complete one is dropped too
+        self.assertEqual(os.path.getsize(self.path), offsets[3])
+        self.assertEqual(start, 0.0)
+        self.assertEqual(end, (STRETCH + FRAME * GOP * 3) / TIMESCALE)
+        self.assertEqual(timescale, TIMESCALE)
+        self.assertEqual(shift, STRETCH / TIMESCALE)
+        # What is kept is a valid file of its own
+        self.assertEqual(len(complete_fragments(self.path)[1]), 3)
+
+    def test_truncated_in_moof(self):
+        data, offsets = fragmented_mp4(5)
+        self.write(data[:offsets[4] + 20])
+        self.assertEqual(resume_point(self.path)[1], (STRETCH + FRAME * GOP * 3) / TIMESCALE)
+        self.assertEqual(os.path.getsize(self.path), offsets[3])
+
+    def test_truncated_in_box_header(self):
+        data, offsets = fragmented_mp4(3)
+        self.write(data[:offsets[2] + 5])
+        self.assertIsNotNone(resume_point(self.path))
+        self.assertEqual(os.path.getsize(self.path), offsets[1])
+
+    def test_too_little_to_resume(self):
+        data, offsets = fragmented_mp4(2)
+        truncated = data[:offsets[1] + 100]
+        self.write(truncated)
+        self.assertIsNone(resume_point(self.path))
+        self.assertEqual(os.path.getsize(self.path), len(truncated))
+
+    def test_no_moov(self):
+        data, offsets = fragmented_mp4(3)
+        self.write(data[:40])
+        self.assertIsNone(resume_point(self.path))
+
+    def test_video_only_64_bit_decode_time(self):
+        data, offsets = fragmented_mp4(4, stretch=0, with_audio=False, tfdt_version=1)
+        self.write(data)
+        self.assertEqual(resume_point(self.path), (0.0, FRAME * GOP * 3 / TIMESCALE, TIMESCALE, 0.0))
+
+    def test_64_bit_box_sizes(self):
+        data, offsets = fragmented_mp4(4, large_mdat=True)
+        self.write(data[:offsets[3] + 100])
+        self.assertEqual(resume_point(self.path)[1], (STRETCH + FRAME * GOP * 2) / TIMESCALE)
+        self.assertEqual(os.path.getsize(self.path), offsets[2])
+
+    def test_default_sample_durations(self):
+        data, offsets = fragmented_mp4(4, durations=False)
+        self.write(data)
+        self.assertEqual(complete_fragments(self.path)[2], 0)
+
+
+class CommandsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="convert2ios_test_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.job = types.SimpleNamespace(
+            target_file=os.path.join(self.directory, "out.mp4"), source_file="in.ts", output_format="mp4",
+            preset=None, smart_copy=True, moov_mode=ios_profile.MOOV_FRAGMENTED, renditions=None)
+        self.plan = plan = types.SimpleNamespace(video_start=1.4, start_time=1.4, audio_start=1.4, video_index=0,
+                                     audio_index=1, duration=600.0, frame_rate=30.0, copy_audio=False)
+        self.resume = ResumableEncode(self.job, plan)
+        self.addCleanup(self.resume.cleanup)
+        data, offsets = fragmented_mp4(5)
+        with open(self.resume.gpu_part, "wb") as f:
+            f.write(data[:offsets[4] + 500])
+        self.assertTrue(self.resume.cut())
+
+    def option(self, command, name):
+        return command[command.index(name) + 1]
+
+    def test_continuation_starts_on_the_first_frame_not_kept(self):
+        command = self.resume.continuation_command()
+        # Keyframe of the dropped fragment, in the input's timeline
+        self.assertAlmostEqual(float(self.option(command, "-ss")), FRAME * GOP * 3 / TIMESCALE, places=5)
+        self.assertEqual(self.option(command, "-video_track_timescale"), str(TIMESCALE))
+        self.assertEqual(self.option(command, "-bsf:v"), "dump_extra=freq=keyframe")
+
+    def test_join_writes_avc3(self):
+        command = self.resume.join_command()
+        self.assertEqual(self.option(command, "-tag:v"), "avc3")
+        self.assertEqual(self.option(command, "-c"), "copy")
+
+    def test_finish_renames_the_part(self):
+        self.resume.finish()
+        self.assertTrue(os.path.exists(self.job.target_file))
+        self.assertFalse(os.path.exists(self.resume.gpu_part))
+
+    def test_only_fragmented_outputs_resume(self):
+        # Any other layout would need a remux of every successful encode
+        self.assertTrue(resumable(self.job, self.plan, "h264_nvenc"))
+        self.assertFalse(resumable(self.job, self.plan, "hevc_nvenc"))
+        self.job.moov_mode = ios_profile.MOOV_FASTSTART
+        self.assertFalse(resumable(self.job, self.plan, "h264_nvenc"))
+        self.job.moov_mode = ios_profile.MOOV_FRAGMENTED
+        self.plan.duration = RESUME_MIN_DURATION - 1
+        self.assertFalse(resumable(self.job, self.plan, "h264_nvenc"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+Unit tests of the NVENC session slots (nvenc_slots.py) and of how the
+conversion engine uses them, with stub_ffmpeg.py standing in for an ffmpeg
+whose GPU accepts only a few sessions
+
+Run:  python -m unittest test_nvenc_slots
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from conversion_engine import ConversionEngine
+from job_queue import ConversionJob, DONE
+from nvenc_slots import RESTORE_AFTER, NvencSlots, is_session_error
+
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_ffmpeg.py")
+NVENC = "h264_nvenc"
+
+
+def stub_executable(directory):
+    """An ffmpeg in `directory` that runs stub_ffmpeg.py with this Python"""
+    if sys.platform == "win32":
+        path = os.path.join(directory, "ffmpeg.cmd")
+        with open(path, "w", encoding='utf-8') as f:
+            f.write(f'@"{sys.executable}" "{STUB}" %*\n')
+    else:
+        path = os.path.join(directory, "ffmpeg")
+        with open(path, "w", encoding='utf-8') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{STUB}" "$@"\n')
+        os.chmod(path, 0o755)
+    return path
+
+
+class NvencSlotsTest(unittest.TestCase):
+
+    def test_acquire_all_or_nothing(self):
+        slots = NvencSlots(3)
+        self.assertEqual(slots.acquire(2), 2)
+        self.assertEqual(slots.acquire(2), 0)
+        self.assertEqual(slots.acquire(2, partial=True), 1)
+        self.assertEqual(slots.free, 0)
+        slots.release(2)
+        self.assertEqual(slots.free, 2)
+
+    def test_limit_reached_lowers_total(self):
+        slots = NvencSlots(5)
+        slots.acquire(3)
+        slots.acquire(1)
+        slots.limit_reached(1)
+        self.assertEqual(slots.total, 3)
+
+    def test_limit_reached_can_reach_zero(self):
+        slots = NvencSlots(3)
+        slots.acquire(1)
+        slots.limit_reached(1)
+        slots.release(1)
+        self.assertEqual(slots.total, 0)
+        self.assertEqual(slots.acquire(1, partial=True), 0)
+
+    def test_total_comes_back_after_the_cooldown(self):
+        now = [0.0]
+        slots = NvencSlots(3, clock=lambda: now[0])
+        slots.acquire(1)
+        slots.limit_reached(1)
+        slots.release(1)
+        self.assertEqual(slots.free, 0)
+        now[0] += RESTORE_AFTER - 1
+        self.assertEqual(slots.acquire(1), 0)
+        now[0] += 1
+        self.assertEqual(slots.acquire(1), 1)
+        # One session at a time, each after a cooldown of its own
+        now[0] += RESTORE_AFTER
+        self.assertEqual(slots.free, 1)
+        now[0] += RESTORE_AFTER * 5
+        self.assertEqual(slots.free, 2)
+        self.assertEqual(slots.total, slots.configured)
+
+    def test_refusal_restarts_the_cooldown(self):
+        now = [0.0]
+        slots = NvencSlots(3, clock=lambda: now[0])
+        slots.acquire(2)
+        slots.limit_reached(1)
+        slots.release(2)
+        now[0] += RESTORE_AFTER
+        self.assertEqual(slots.acquire(2), 2)
+        slots.limit_reached(1)
+        slots.release(2)
+        now[0] += RESTORE_AFTER - 1
+        self.assertEqual(slots.total, 1)
+        self.assertEqual(slots.free, 1)
+
+    def test_session_error(self):
+        self.assertTrue(is_session_error(["[h264_nvenc @ 0x1] OpenEncodeSessionEx failed: out of memory (10)"]))
+        self.assertFalse(is_session_error(["[h264_nvenc @ 0x1] EncodePicture failed!"]))
+
+
+class EngineSessionsTest(unittest.TestCase):
+    """Jobs planned for NVENC on an engine with `sessions` slots and a GPU with `gpu_sessions`"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="convert2ios_test_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        sessions = os.path.join(self.directory, "sessions")
+        os.mkdir(sessions)
+        self.log_path = os.path.join(self.directory, "calls.log")
+        self.input_file = os.path.join(self.directory, "in.ts")
+        with open(self.input_file, "wb") as f:
+            f.write(b"\0" * 1024)
+        environment = mock.patch.dict(os.environ, {
+            "CONVERT2IOS_HOME": os.path.join(self.directory, "home"),
+            "CONVERT2IOS_FFMPEG": stub_executable(self.directory),
+            "STUB_NVENC_DIR": sessions,
+            "STUB_LOG": self.log_path,
+            "STUB_SECONDS": "0.3",
+            "STUB_X264_SECONDS": "1.2",
+        })
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def convert(self, count, sessions, gpu_sessions, workers):
+        os.environ["STUB_NVENC_SESSIONS"] = str(gpu_sessions)
+        engine = ConversionEngine(workers, nvenc_sessions=sessions, log_dir=False)
+        jobs = [ConversionJob(self.input_file, os.path.join(self.directory, f"out{i}.mp4"),
+                              smart_copy=False) for i in range(count)]
+
+        async def run():
+            # Already "probed": planned for NVENC
+            return await asyncio.gather(*(engine.run(job, (None, None, NVENC)) for job in jobs))
+
+        reports = asyncio.run(run())
+        self.assertEqual([job.status for job in jobs], [DONE] * count)
+        return engine, [report["vcodec"] for report in reports]
+
+    def calls(self):
+        with open(self.log_path, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_overflow_jobs_go_to_libx264(self):
+        engine, vcodecs = self.convert(3, sessions=2, gpu_sessions=2, workers=3)
+        self.assertEqual(sorted(vcodecs), ["h264_nvenc", "h264_nvenc", "libx264"])
+        # The third job never tried NVENC
+        self.assertNotIn(f"{NVENC} refused", self.calls())
+        self.assertEqual(engine.nvenc.total, 2)
+        self.assertEqual(engine.nvenc.in_use, 0)
+
+    def test_queued_jobs_go_back_to_nvenc(self):
+        # The NVENC jobs end long before the libx264 one and free their slots
+        engine, vcodecs = self.convert(5, sessions=2, gpu_sessions=2, workers=3)
+        self.assertEqual(sorted(vcodecs[:3]), ["h264_nvenc", "h264_nvenc", "libx264"])
+        self.assertEqual(vcodecs[3:], [NVENC, NVENC])
+        self.assertNotIn(f"{NVENC} refused", self.calls())
+
+    def test_limit_reached_shrinks_total(self):
+        # Another program holds two of the three sessions the engine counts on
+        engine, vcodecs = self.convert(2, sessions=3, gpu_sessions=1, workers=2)
+        self.assertEqual(sorted(vcodecs), ["h264_nvenc", "libx264"])
+        self.assertEqual(self.calls().count(f"{NVENC} refused"), 1)
+        self.assertEqual(engine.nvenc.total, 1)
+
+    def test_no_session_at_all_falls_back_for_good(self):
+        engine, vcodecs = self.convert(3, sessions=2, gpu_sessions=0, workers=1)
+        self.assertEqual(vcodecs, ["libx264"] * 3)
+        self.assertEqual(engine.nvenc.total, 0)
+        # Only the first job tried NVENC
+        self.assertEqual([line for line in self.calls() if line.startswith(NVENC)],
+                         [f"{NVENC} refused"])
+
+
+if __name__ == "__main__":
+    unittest.main()
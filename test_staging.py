@@ -0,0 +1,177 @@
+"""
+Unit tests of the scratch staging of inputs and outputs (staging.py): the
+scratch budget is taken and given back as files are copied, moved and
+dropped, whatever fails on the way
+
+Run:  python -m unittest test_staging
+"""
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import staging
+from job_queue import ConversionJob
+from staging import Stager
+
+
+SIZE = 1000
+DiskUsage = collections.namedtuple("DiskUsage", "total used free")
+
+
+class StagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="convert2ios_test_")
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.free = 100 * staging.FREE_RESERVE
+        patcher = mock.patch("staging.shutil.disk_usage", lambda path: DiskUsage(0, 0, self.free))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.stager = self.make_stager()
+
+    def make_stager(self, **options):
+        options = dict({"root": os.path.join(self.directory, "scratch"), "max_bytes": 2 * SIZE,
+                        "remote_only": False}, **options)
+        stager = Stager(**options)
+        self.addCleanup(stager.close)
+        return stager
+
+    def job(self, name, size=SIZE, **options):
+        input_file = os.path.join(self.directory, f"{name}.ts")
+        with open(input_file, "wb") as f:
+            f.write(os.urandom(size))
+        return ConversionJob(input_file, os.path.join(self.directory, f"{name}.mp4"), **options)
+
+    def stage(self, jobs, stager=None):
+        """stage_ahead() and wait for the copies, so claiming one does not drop it"""
+        stager = stager or self.stager
+        stager.stage_ahead(jobs)
+        for job in jobs:
+            if job.id in stager._inputs:
+                stager._inputs[job.id].result()
+
+    def staged(self, job, stager=None):
+        future = (stager or self.stager).claim_input(job)
+        return future.result() if future is not None else None
+
+    def test_inputs_within_the_budget(self):
+        jobs = [self.job(name) for name in ("a", "b", "c")]
+        self.stager.lookahead = 3
+        self.stage(jobs)
+        paths = [self.staged(job) for job in jobs]
+        # Two fit in max_bytes, the third is read in place
+        self.assertIsNone(paths[2])
+        for job, path in zip(jobs, paths[:2]):
+            with open(job.input_file, "rb") as source, open(path, "rb") as copy:
+                self.assertEqual(source.read(), copy.read())
+        self.assertEqual(self.stager._used, 2 * SIZE)
+        for job, path in zip(jobs, paths):
+            self.stager.release(job)
+            if path is not None:
+                self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.stager._used, 0)
+
+    def test_lookahead(self):
+        jobs = [self.job(name) for name in ("a", "b", "c")]
+        self.stager.lookahead = 1
+        self.stage(jobs)
+        self.assertIsNotNone(self.staged(jobs[0]))
+        self.assertIsNone(self.stager.claim_input(jobs[1]))
+
+    def test_free_space_is_kept(self):
+        self.free = staging.FREE_RESERVE + SIZE - 1
+        job = self.job("a")
+        self.stage([job])
+        self.assertIsNone(self.staged(job))
+        self.assertEqual(self.stager._used, 0)
+
+    def test_cancelled_job_is_not_copied(self):
+        job = self.job("a")
+        job.cancel_requested = True
+        self.stage([job])
+        self.assertIsNone(self.staged(job))
+        self.assertEqual(self.stager._used, 0)
+
+    def test_output_is_moved(self):
+        job = self.job("a")
+        job.staged_output = self.stager.output_for(job)
+        self.assertEqual(self.stager._used, SIZE)
+        with open(job.staged_output, "wb") as f:
+            f.write(b"encoded")
+        self.stager.move_output(job).result()
+        with open(job.output_file, "rb") as f:
+            self.assertEqual(f.read(), b"encoded")
+        self.assertFalse(os.path.exists(job.staged_output))
+        self.assertEqual(self.stager._used, 0)
+
+    def test_output_is_copied_across_file_systems(self):
+        job = self.job("a")
+        job.staged_output = self.stager.output_for(job)
+        with open(job.staged_output, "wb") as f:
+            f.write(b"encoded")
+        replace = os.replace
+
+        def cross_device(source, target):
+            if source == job.staged_output:
+                raise OSError(18, "Invalid cross-device link")
+            replace(source, target)
+
+        with mock.patch("os.replace", cross_device):
+            self.stager.move_output(job).result()
+        with open(job.output_file, "rb") as f:
+            self.assertEqual(f.read(), b"encoded")
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".part")], [])
+        self.assertEqual(self.stager._used, 0)
+
+    def test_failed_move_frees_the_reservation(self):
+        job = self.job("a")
+        job.staged_output = self.stager.output_for(job)
+        with open(job.staged_output, "wb") as f:
+            f.write(b"encoded")
+        with mock.patch("os.replace", side_effect=OSError(28, "No space left on device")):
+            with self.assertRaises(OSError):
+                self.stager.move_output(job).result()
+        self.assertFalse(os.path.exists(job.output_file))
+        self.assertFalse(os.path.exists(job.staged_output))
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".part")], [])
+        self.assertEqual(self.stager._used, 0)
+        # The budget is whole again for the next jobs
+        self.assertIsNotNone(self.stager.output_for(self.job("b")))
+        self.assertIsNotNone(self.stager.output_for(self.job("c")))
+
+    def test_discarded_output(self):
+        job = self.job("a")
+        path = self.stager.output_for(job)
+        with open(path, "wb") as f:
+            f.write(b"failed encode")
+        self.stager.discard_output(job)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.stager._used, 0)
+
+    def test_ladders_are_written_in_place(self):
+        job = self.job("a", renditions=["720p", "480p"])
+        self.assertIsNone(self.stager.output_for(job))
+        self.assertEqual(self.stager._used, 0)
+
+    def test_local_files_are_not_staged(self):
+        stager = self.make_stager(remote_only=True)
+        job = self.job("a")
+        with mock.patch("staging.is_remote", return_value=False):
+            self.stage([job], stager)
+            self.assertIsNone(stager.output_for(job))
+        self.assertIsNone(self.staged(job, stager))
+
+    def test_directories_of_dead_processes_are_removed(self):
+        root = os.path.join(self.directory, "scratch")
+        for name in ("999999991", "other"):
+            os.makedirs(os.path.join(root, name))
+        with mock.patch("job_journal.process_alive", lambda pid, since=None: pid == os.getpid()):
+            self.make_stager()
+        self.assertEqual(os.listdir(root), ["other"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Unit tests of the Smart Copy decisions (stream_planner.plan_from_probe) on
+ffprobe results: which streams are copied, which re-encoded and why
+
+Run:  python -m unittest test_stream_planner
+"""
+import unittest
+
+from stream_planner import parse_rate, plan_from_probe
+
+
+def video(**fields):
+    stream = {"index": 0, "codec_type": "video", "codec_name": "h264", "profile": "Main", "level": 40,
+              "pix_fmt": "yuv420p", "width": 1920, "height": 1080, "avg_frame_rate": "30000/1001",
+              "field_order": "progressive", "start_time": "1.400000"}
+    stream.update(fields)
+    return stream
+
+
+def audio(**fields):
+    stream = {"index": 1, "codec_type": "audio", "codec_name": "aac", "profile": "LC",
+              "sample_rate": "48000", "channels": 2, "start_time": "1.380000"}
+    stream.update(fields)
+    return stream
+
+
+def probe(*streams, duration="600.5"):
+    return {"streams": list(streams), "format": {"duration": duration, "start_time": "1.380000"}}
+
+
+class CopyDecisionTest(unittest.TestCase):
+
+    def test_compatible_input_is_remuxed(self):
+        plan = plan_from_probe(probe(video(), audio()))
+        self.assertEqual(plan.mode, "remux")
+        self.assertFalse(plan.needs_encoder)
+        self.assertEqual(plan.map_args(), ["-map", "0:0", "-map", "0:1"])
+        self.assertEqual((plan.duration, plan.start_time, plan.video_start), (600.5, 1.38, 1.4))
+        self.assertAlmostEqual(plan.frame_rate, 29.97, places=2)
+
+    def test_copy_stops_at_main_level_4_0(self):
+        # The encoders produce at most Main 4.0, a copy may not go further
+        for fields in ({"profile": "Constrained Baseline", "level": 31}, {"profile": "Baseline", "level": 30},
+                       {"profile": "Main", "level": 40}):
+            self.assertTrue(plan_from_probe(probe(video(**fields))).copy_video, fields)
+        for fields, reason in (({"profile": "High"}, "profile High"),
+                               ({"level": 41}, "level 41"),
+                               ({"level": None}, "level None"),
+                               ({"pix_fmt": "yuv420p10le"}, "pix_fmt yuv420p10le"),
+                               ({"field_order": "tt"}, "interlaced (tt)"),
+                               ({"codec_name": "mpeg2video"}, "codec mpeg2video (ต้องการ h264)")):
+            plan = plan_from_probe(probe(video(**fields), audio()))
+            self.assertEqual((plan.mode, plan.video_reason), ("audio-copy", reason))
+            self.assertTrue(plan.needs_encoder)
+
+    def test_hevc_copy(self):
+        hevc = video(codec_name="hevc", level=120)
+        self.assertTrue(plan_from_probe(probe(hevc), "h265").copy_video)
+        self.assertEqual(plan_from_probe(probe(video(codec_name="hevc", level=123)), "h265").video_reason,
+                         "level 123")
+        self.assertEqual(plan_from_probe(probe(video(codec_name="hevc", profile="Main 10")), "h265").video_reason,
+                         "profile Main 10")
+        # H.265 asked for, H.264 found: encoded
+        self.assertEqual(plan_from_probe(probe(video()), "h265").video_reason, "codec h264 (ต้องการ hevc)")
+
+    def test_audio_out_of_spec(self):
+        for fields, reason in (({"codec_name": "mp2", "profile": None}, "codec mp2"),
+                               ({"profile": "Main"}, "profile Main"),
+                               ({"sample_rate": "32000"}, "sample rate 32000"),
+                               ({"channels": 6}, "6 channels")):
+            plan = plan_from_probe(probe(video(), audio(**fields)))
+            self.assertEqual((plan.mode, plan.audio_reason), ("video-copy", reason))
+        plan = plan_from_probe(probe(video(profile="High"), audio(channels=6)))
+        self.assertEqual(plan.mode, "transcode")
+
+    def test_stream_choice(self):
+        # As ffmpeg maps by default: the largest video, the audio with most channels, no cover art
+        cover = video(index=0, width=3000, height=3000, codec_name="mjpeg", disposition={"attached_pic": 1})
+        small = video(index=1, width=640, height=360)
+        large = video(index=2, profile="High")
+        mono = audio(index=3, channels=1)
+        stereo = audio(index=4)
+        plan = plan_from_probe(probe(cover, small, large, mono, stereo))
+        self.assertEqual((plan.video_index, plan.audio_index), (2, 4))
+        self.assertEqual(plan.width, 1920)
+        self.assertEqual(plan.mode, "audio-copy")
+
+    def test_missing_streams(self):
+        plan = plan_from_probe(probe(audio()))
+        self.assertIsNone(plan.video_index)
+        self.assertFalse(plan.needs_encoder)
+        self.assertEqual(plan.mode, "remux")
+        self.assertEqual(plan.map_args(), ["-map", "0:1"])
+        plan = plan_from_probe({}, "h264")
+        self.assertEqual((plan.video_index, plan.audio_index, plan.duration), (None, None, 0.0))
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("25/1"), 25.0)
+        self.assertEqual(parse_rate("30"), 30.0)
+        self.assertEqual(parse_rate("0/0"), 0.0)
+        self.assertEqual(parse_rate(None), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Unit tests of the post-encode checks (verify.py): the profile and level an
+output may have for the settings it was encoded with, and the checks of a
+whole file on ffprobe results
+
+Run:  python -m unittest test_verify
+"""
+import types
+import unittest
+from unittest import mock
+
+from verify import check_encoded_video, expected_video, sample_times, verify_file
+
+
+def video(**fields):
+    stream = {"index": 0, "codec_type": "video", "codec_name": "h264", "profile": "Main", "level": 40,
+              "pix_fmt": "yuv420p", "width": 1920, "height": 1080}
+    stream.update(fields)
+    return stream
+
+
+def plan(width=1920, height=1080, frame_rate=30.0):
+    return types.SimpleNamespace(width=width, height=height, frame_rate=frame_rate,
+                                 video_index=0, audio_index=1, duration=600.0)
+
+
+class EncodedVideoTest(unittest.TestCase):
+
+    def test_expected_settings(self):
+        self.assertEqual(expected_video("libx264"), ("baseline", 31))
+        self.assertEqual(expected_video("h264_nvenc"), ("main", 40))
+        self.assertEqual(expected_video("hevc_nvenc"), ("main", 120))
+        self.assertEqual(expected_video("libx264", "720p", plan(1280, 720)), ("main", 31))
+
+    def test_libx264_baseline(self):
+        for fields in ({"profile": "Constrained Baseline", "level": 31}, {"profile": "Baseline", "level": 30}):
+            self.assertIsNone(check_encoded_video(video(**fields), "libx264"), fields)
+        self.assertEqual(check_encoded_video(video(level=31), "libx264"), "profile Main (ต้องการ Baseline)")
+        self.assertEqual(check_encoded_video(video(profile="Baseline"), "libx264"), "level 40 (สูงสุด 31)")
+
+    def test_a_smaller_profile_passes(self):
+        # Main 4.0 asked for: Baseline and a lower level are playable wherever Main 4.0 is
+        for fields in ({"profile": "Main"}, {"profile": "Constrained Baseline"}, {"level": 31}):
+            self.assertIsNone(check_encoded_video(video(**fields), "h264_nvenc"), fields)
+        self.assertEqual(check_encoded_video(video(profile="High"), "h264_nvenc"), "profile High (ต้องการ Main)")
+        self.assertEqual(check_encoded_video(video(profile="High 10"), "h264_nvenc"),
+                         "profile High 10 (ต้องการ Main)")
+        self.assertEqual(check_encoded_video(video(level=41), "h264_nvenc"), "level 41 (สูงสุด 40)")
+
+    def test_hevc(self):
+        hevc = {"codec_name": "hevc", "level": 120}
+        self.assertIsNone(check_encoded_video(video(**hevc), "hevc_nvenc"))
+        self.assertEqual(check_encoded_video(video(**dict(hevc, level=123)), "hevc_nvenc"),
+                         "level 123 (สูงสุด 120)")
+        self.assertEqual(check_encoded_video(video(**dict(hevc, profile="Main 10")), "hevc_nvenc"),
+                         "profile Main 10 (ต้องการ Main)")
+        self.assertEqual(check_encoded_video(video(), "hevc_nvenc"), "codec h264 (ต้องการ hevc)")
+
+    def test_stream_basics(self):
+        self.assertEqual(check_encoded_video(video(pix_fmt="yuvj420p"), "h264_nvenc"),
+                         "pix_fmt yuvj420p (ต้องการ yuv420p)")
+        self.assertEqual(check_encoded_video(video(level=None), "h264_nvenc"), "level None (สูงสุด 40)")
+        self.assertEqual(check_encoded_video(video(codec_name="mpeg4"), "libx264"),
+                         "codec mpeg4 (ต้องการ h264)")
+
+    def test_rendition_level_follows_the_frame_rate(self):
+        stream = video(width=1280, height=720, level=32)
+        # 720p30 fits level 3.1, 720p60 needs 3.2
+        self.assertEqual(check_encoded_video(stream, "libx264", "720p", plan(frame_rate=30.0)),
+                         "level 32 (สูงสุด 31)")
+        self.assertIsNone(check_encoded_video(stream, "libx264", "720p", plan(frame_rate=60.0)))
+        # 480p is Baseline with libx264, NVENC keeps Main
+        self.assertEqual(check_encoded_video(video(level=30), "libx264", "480p", plan()),
+                         "profile Main (ต้องการ Baseline)")
+        self.assertIsNone(check_encoded_video(video(level=30), "h264_nvenc", "480p", plan()))
+
+
+class VerifyFileTest(unittest.TestCase):
+
+    def verify(self, streams, vcodec="h264_nvenc", duration=600.0, **options):
+        info = {"streams": streams, "format": {"duration": str(duration)}}
+        with mock.patch("verify.probe_media", return_value=info):
+            return verify_file("out.mp4", plan(), vcodec, duration=600.0, **options)
+
+    def audio(self, **fields):
+        stream = {"index": 1, "codec_type": "audio", "codec_name": "aac", "profile": "LC",
+                  "sample_rate": "44100", "channels": 2}
+        stream.update(fields)
+        return stream
+
+    def test_good_output(self):
+        self.assertEqual(self.verify([video(), self.audio()]), [])
+
+    def test_problems(self):
+        problems = self.verify([video(profile="High"), self.audio(sample_rate="22050")], duration=590.0)
+        self.assertEqual(problems, ["video: profile High (ต้องการ Main)",
+                                    "audio: sample rate 22050",
+                                    "ความยาว 590.00s ต่างจากต้นฉบับ 600.00s (ยอมให้ ±6.00s)"])
+
+    def test_missing_stream(self):
+        self.assertEqual(self.verify([video()]), ["ไม่มี audio stream"])
+
+    def test_copied_video_meets_the_copy_limits(self):
+        self.assertEqual(self.verify([video(), self.audio()], vcodec="copy"), [])
+        self.assertEqual(self.verify([video(profile="High"), self.audio()], vcodec="copy"),
+                         ["video: profile High"])
+
+    def test_sample_times(self):
+        self.assertEqual(sample_times(12.0, 3), [0.0, 5.0, 10.0])
+        self.assertEqual(sample_times(12.0, 1), [5.0])
+        self.assertEqual(sample_times(1.0, 2), [0.0, 0.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Thread-safe, coalesced update channel between worker threads and Tk
+
+Tk must only be touched from the thread running mainloop. Workers post
+events here instead; the Tk thread drains them on a fixed `after()` tick.
+Log lines are batched into one insert per tick and progress updates are
+coalesced by key, so each job is redrawn at most once per tick no matter
+how fast ffmpeg reports progress.
+"""
+import threading
+from collections import deque
+
+
+# Redraw interval in milliseconds (20 redraws per second)
+UPDATE_INTERVAL_MS = 50
+
+
+class UIUpdateChannel:
+    """
+    `post_log(message)`      - append a log line (batched per tick)
+    `post_coalesced(key, f)` - run f once per tick, latest post per key wins
+    `post(f, *args)`         - run f on the Tk thread, every post, in order
+    """
+
+    def __init__(self, root, log_handler, interval_ms=UPDATE_INTERVAL_MS):
+        self.root = root
+        self.log_handler = log_handler
+        self.interval_ms = interval_ms
+
+        self._logs = deque()
+        self._calls = deque()
+        self._coalesced = {}
+        self._lock = threading.Lock()
+        self._after_id = None
+
+        # Simple counters so redraw rate can be checked while converting
+        self.ticks = 0
+        self.redraws = 0
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def post_log(self, message):
+        self._logs.append(message)
+
+    def post(self, func, *args):
+        self._calls.append((func, args))
+
+    def post_coalesced(self, key, func, *args):
+        with self._lock:
+            self._coalesced[key] = (func, args)
+
+    def drain(self):
+        """Apply everything posted so far (Tk thread only)"""
+        if self._logs:
+            lines = []
+            while self._logs:
+                lines.append(self._logs.popleft())
+            self.log_handler(lines)
+
+        with self._lock:
+            coalesced, self._coalesced = self._coalesced, {}
+        for func, args in coalesced.values():
+            func(*args)
+            self.redraws += 1
+
+        while self._calls:
+            func, args = self._calls.popleft()
+            func(*args)
+
+    def _tick(self):
+        self.ticks += 1
+        try:
+            self.drain()
+        finally:
+            self._after_id = self.root.after(self.interval_ms, self._tick)
@@ -0,0 +1,200 @@
+"""
+Post-encode verification of outputs
+
+ffmpeg exiting with code 0 does not prove the output plays: a full disk,
+a share that dropped the last write or a muxer bug leave truncated or
+unreadable files behind. With a Verifier the engine checks every output
+after its job finished, on a small pool of its own threads, while the
+next jobs already encode:
+
+1. ffprobe must parse the container and find the streams of the plan,
+2. the duration must match the input's within the tolerance,
+3. the video must meet the iOS settings it was encoded with
+   (ios_profile.video_settings(), per rendition for ladders): codec,
+   profile, level and pix_fmt; a copied stream the Smart Copy limits; the
+   audio must be AAC within the copy limits,
+4. optionally, `samples` short pieces spread over the file (the last one
+   at its end) are decoded with ffmpeg and must decode without errors.
+
+A job whose output fails is marked failed with the problems found; the
+output is left in place for inspection.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ios_profile
+import process_registry
+import renditions
+from ffmpeg_caps import ffmpeg_binary
+from stream_planner import ProbeError, check_audio, check_video, plan_from_probe, probe_media
+
+
+VERIFY_WORKERS = 2
+DURATION_TOLERANCE = 1.0         # seconds, at least
+DURATION_TOLERANCE_RATIO = 0.01  # of the input duration, for long files
+SAMPLE_SECONDS = 2.0             # decoded per sample
+ERROR_LINES = 3                  # decoder error lines kept per sample
+
+# H.264 profiles by feature set: an output may use a smaller one than it asked for
+H264_PROFILE_RANKS = {"Constrained Baseline": 0, "Baseline": 0, "Main": 1, "High": 2}
+H264_PROFILE_NAMES = {"baseline": "Baseline", "main": "Main", "high": "High"}
+
+
+def _option(settings, *names):
+    for name in names:
+        if name in settings:
+            return settings[settings.index(name) + 1]
+    return None
+
+
+def expected_video(vcodec, rendition=None, plan=None):
+    """(profile, ffprobe level) the encoder was told to produce"""
+    if rendition is not None:
+        settings = renditions.rendition_video_settings(vcodec, rendition, plan=plan)
+    else:
+        settings = ios_profile.video_settings(vcodec)
+    profile = _option(settings, "-profile:v")
+    level = float(_option(settings, "-level", "-level:v") or 0)
+    # ffprobe reports H.264 level 3.1 as 31 and HEVC level 4.0 as 120
+    return profile, round(level * (30 if "hevc" in vcodec else 10))
+
+
+def check_encoded_video(stream, vcodec, rendition=None, plan=None):
+    """None if an encoded video stream meets its iOS settings, otherwise why not"""
+    wanted = "hevc" if "hevc" in vcodec else "h264"
+    if stream.get("codec_name") != wanted:
+        return f"codec {stream.get('codec_name')} (ต้องการ {wanted})"
+    if stream.get("pix_fmt") != "yuv420p":
+        return f"pix_fmt {stream.get('pix_fmt')} (ต้องการ yuv420p)"
+    profile, max_level = expected_video(vcodec, rendition, plan)
+    found = stream.get("profile")
+    if wanted == "h264":
+        name = H264_PROFILE_NAMES.get(profile, profile)
+        if H264_PROFILE_RANKS.get(found, 99) > H264_PROFILE_RANKS.get(name, 0):
+            return f"profile {found} (ต้องการ {name})"
+    elif found != "Main":
+        return f"profile {found} (ต้องการ Main)"
+    try:
+        level = int(stream.get("level"))
+    except (TypeError, ValueError):
+        level = -1
+    if level < 0 or level > max_level:
+        return f"level {stream.get('level')} (สูงสุด {max_level})"
+    return None
+
+
+def sample_times(duration, samples):
+    """Start times of `samples` decode samples, the first at 0 and the last ending the file"""
+    last = max(0.0, duration - SAMPLE_SECONDS)
+    if samples <= 1:
+        return [last / 2]
+    return [last * i / (samples - 1) for i in range(samples)]
+
+
+def decode_sample(path, start, seconds=SAMPLE_SECONDS):
+    """None if `seconds` of `path` from `start` decode cleanly, otherwise the errors"""
+    result = process_registry.run(
+        [ffmpeg_binary(), "-hide_banner", "-nostdin", "-v", "error", "-xerror",
+         "-ss", f"{start:.3f}", "-i", path, "-t", f"{seconds:.3f}", "-f", "null", "-"],
+        capture_output=True, text=True, encoding='utf-8', errors='replace')
+    errors = [line for line in result.stderr.splitlines() if line.strip()]
+    if result.returncode != 0 or errors:
+        return "; ".join(errors[:ERROR_LINES]) or f"exit code {result.returncode}"
+    return None
+
+
+def verify_file(path, plan, vcodec, rendition=None, duration=0.0, tolerance=DURATION_TOLERANCE,
+                samples=0):
+    """Problems found in one output file (empty if it is fine)"""
+    try:
+        info = probe_media(path)
+    except ProbeError as e:
+        return [f"อ่านไฟล์ไม่ได้: {e}"]
+    streams = {stream.get("index"): stream for stream in info.get("streams", [])}
+    if not streams:
+        return ["ไม่พบ stream ในไฟล์"]
+    problems = []
+    # The streams ffmpeg would pick, as for an input
+    output = plan_from_probe(info)
+
+    # Without a plan of the input, the streams that are there are checked
+    video = streams.get(output.video_index)
+    if video is not None or (plan is not None and plan.video_index is not None):
+        if video is None:
+            problems.append("ไม่มี video stream")
+        elif vcodec == "copy":
+            reason = check_video(video, "h265" if video.get("codec_name") == "hevc" else "h264")
+            if reason:
+                problems.append(f"video: {reason}")
+        else:
+            reason = check_encoded_video(video, vcodec, rendition, plan)
+            if reason:
+                problems.append(f"video: {reason}")
+        if video is not None and rendition is not None:
+            height = renditions.rendition_size(rendition, plan)[1]
+            if output.height != height:
+                problems.append(f"video: ความสูง {video.get('height')} (ต้องการ {height})")
+
+    audio = streams.get(output.audio_index)
+    if audio is not None or (plan is not None and plan.audio_index is not None):
+        if audio is None:
+            problems.append("ไม่มี audio stream")
+        else:
+            reason = check_audio(audio)
+            if reason:
+                problems.append(f"audio: {reason}")
+
+    if duration > 0:
+        allowed = max(tolerance, duration * DURATION_TOLERANCE_RATIO)
+        if abs(output.duration - duration) > allowed:
+            problems.append(f"ความยาว {output.duration:.2f}s ต่างจากต้นฉบับ {duration:.2f}s "
+                            f"(ยอมให้ ±{allowed:.2f}s)")
+
+    if samples > 0 and not problems:
+        for start in sample_times(output.duration or duration, samples):
+            error = decode_sample(path, start)
+            if error:
+                problems.append(f"ถอดรหัสที่วินาที {start:.1f} ไม่ได้: {error}")
+    return problems
+
+
+def output_targets(job, names):
+    """[(rendition name or None, path)] of the files a job produced"""
+    if not names:
+        return [(None, job.output_file)]
+    # For HLS, each media playlist is probed through its segments
+    return renditions.output_paths(job.output_file, names, job.hls)
+
+
+class Verifier:
+    """Checks finished outputs on `workers` threads of its own"""
+
+    def __init__(self, workers=VERIFY_WORKERS, tolerance=DURATION_TOLERANCE, samples=0):
+        self.tolerance = tolerance
+        self.samples = max(0, samples)
+        self.enabled = True
+        self._pool = ThreadPoolExecutor(max(1, workers), "verify")
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.failed = 0
+
+    def submit(self, job, plan, vcodec, names=None):
+        """Future of (problems, seconds) for a finished job's outputs"""
+        return self._pool.submit(self.verify, job, plan, vcodec, names)
+
+    def verify(self, job, plan, vcodec, names=None):
+        started = time.monotonic()
+        duration = plan.duration if plan is not None and plan.duration else job.total_duration
+        problems = []
+        for name, path in output_targets(job, names):
+            found = verify_file(path, plan, vcodec, name, duration, self.tolerance, self.samples)
+            prefix = f"{name}: " if name else ""
+            problems += [prefix + problem for problem in found]
+        with self._lock:
+            self.checked += 1
+            self.failed += bool(problems)
+        return problems, time.monotonic() - started
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)